@@ -0,0 +1,3 @@
+from relminer.cli import main
+
+main()
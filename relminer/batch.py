@@ -0,0 +1,359 @@
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import TYPE_CHECKING, Callable, Deque, Dict, Iterator, List, NamedTuple, Optional, Tuple
+from collections import deque
+import json
+import logging
+import multiprocessing
+import os
+import queue
+import shutil
+import tempfile
+
+from relminer.domain import Relation
+from relminer.metrics import metric_labels
+from relminer.relation_store import FastRelationStore
+from relminer.scheduler import PRIORITY_BATCH, FileRateCoordinator
+from relminer.sinks import PartitionedSink, relation_record
+
+if TYPE_CHECKING:
+    from relminer.relations_miner import RelationsMiner
+
+logger = logging.getLogger(__name__)
+
+DOCUMENT_EXTENSIONS = (".txt", ".md")
+# documents submitted ahead per worker process, the output is still written in manifest order
+JOBS_PER_PROCESS = 4
+# seconds the parent waits for a chunk result before checking the document it is writing again
+RESULT_POLL_INTERVAL = 0.1
+
+
+class BatchJob(NamedTuple):
+    doc_id: str
+    subject: str
+    path: str
+
+
+def read_manifest(location: str) -> Iterator[BatchJob]:
+    # a directory of documents uses the file name as subject, ex: steve_jobs.txt -> "steve jobs"
+    if os.path.isdir(location):
+        for file_name in sorted(os.listdir(location)):
+            stem, extension = os.path.splitext(file_name)
+            if extension not in DOCUMENT_EXTENSIONS:
+                continue
+            yield BatchJob(file_name, stem.replace("_", " "), os.path.join(location, file_name))
+        return
+
+    # a JSONL manifest has one {"subject": ..., "path": ..., "id": ...} job per line, "id" is optional
+    base_dir = os.path.dirname(location)
+    with open(location) as f:
+        for line_number, line in enumerate(f):
+            line = line.strip()
+            if not line:
+                continue
+            job = json.loads(line)
+            path = os.path.join(base_dir, job["path"])
+            yield BatchJob(job.get("id", f"{line_number}:{job['path']}"), job["subject"], path)
+
+
+def make_batch_miner(relation_store: FastRelationStore, use_cache: bool = True) -> "RelationsMiner":
+    from relminer.llm_cache import LLMResponseCache
+    from relminer.relations_miner import RelationsMiner
+
+    return RelationsMiner(relation_store=relation_store, llm_cache=LLMResponseCache(enabled=use_cache))
+
+
+def encode_relations(job: BatchJob, chunk: int, relations: List[Relation]) -> bytes:
+    lines = []
+    for relation in relations:
+        record = relation.to_dict(exclude=["description", "sentence", "explanation"])
+        record.update({"document": job.doc_id, "chunk": chunk})
+        lines.append(json.dumps(record) + "\n")
+    return "".join(lines).encode("utf-8")
+
+
+# the miner of a worker process, built once by _init_worker, and the queue its chunk results are sent on
+_worker_miner: Optional["RelationsMiner"] = None
+_worker_few_shot_context = None
+_worker_results: Optional[queue.Queue] = None
+
+
+def _init_worker(
+    miner_factory: Callable[[FastRelationStore], "RelationsMiner"],
+    relation_file: str,
+    rate_file: Optional[str] = None,
+    results: Optional[queue.Queue] = None,
+):
+    from relminer.relations_miner_utils import template_registry
+
+    global _worker_miner, _worker_few_shot_context, _worker_results
+    _worker_results = results
+    # the templates are compiled and the few shot prompt built once per worker, from the read only snapshot
+    template_registry.load_all()
+    _worker_miner = miner_factory(FastRelationStore(relation_file))
+    _worker_few_shot_context = _worker_miner.build_few_shot_context()
+    if rate_file is not None and _worker_miner.scheduler.coordinator is None:
+        # the workers share the rate limits of the run instead of each spending them in full
+        _worker_miner.scheduler.coordinator = FileRateCoordinator(rate_file)
+
+
+def _extract_job(job: BatchJob, first_chunk: int, with_records: bool) -> int:
+    # splitting, prompt rendering, parsing and encoding all happen in the worker, the parent only writes
+    with open(job.path) as f:
+        input_text = f.read()
+
+    with metric_labels(document=job.doc_id):
+        prompts = _worker_miner.make_chunk_prompts(job.subject, input_text, _worker_few_shot_context)
+        for chunk in range(first_chunk, len(prompts)):
+            relations = _worker_miner.merge_relations(
+                _worker_miner.extract_chunk(prompts[chunk], PRIORITY_BATCH, chunk), [job.subject]
+            )
+            records = [relation_record(relation, job.doc_id) for relation in relations] if with_records else None
+            # every chunk is sent as soon as it is extracted, a failure later in the document does not lose it
+            _worker_results.put((job.doc_id, chunk, len(relations), encode_relations(job, chunk, relations), records))
+    return len(prompts)
+
+
+class BatchCheckpoint:
+    """Append only log of the chunks and documents already written to the output."""
+
+    def __init__(self, location: str):
+        self.location = location
+        self.completed_docs = set()
+        # doc_id -> number of chunks already written
+        self.completed_chunks: Dict[str, int] = {}
+        # size of the output file after the last checkpointed write
+        self.output_offset = 0
+
+        if os.path.exists(location):
+            self._replay()
+
+    def _replay(self):
+        with open(self.location) as f:
+            for line in f:
+                try:
+                    event = json.loads(line)
+                except json.JSONDecodeError:
+                    # a torn last line means the process died while checkpointing
+                    logger.warning(f"Ignoring partial checkpoint entry {line!r}")
+                    break
+                self.output_offset = event["offset"]
+                if event.get("done"):
+                    self.completed_docs.add(event["doc"])
+                    self.completed_chunks.pop(event["doc"], None)
+                else:
+                    self.completed_chunks[event["doc"]] = event["chunk"] + 1
+
+    def is_done(self, doc_id: str) -> bool:
+        return doc_id in self.completed_docs
+
+    def next_chunk(self, doc_id: str) -> int:
+        return self.completed_chunks.get(doc_id, 0)
+
+    def _append(self, event: Dict):
+        self.output_offset = event["offset"]
+        with open(self.location, "a") as f:
+            f.write(json.dumps(event) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def mark_chunk(self, doc_id: str, chunk: int, offset: int):
+        self.completed_chunks[doc_id] = chunk + 1
+        self._append({"doc": doc_id, "chunk": chunk, "offset": offset})
+
+    def mark_done(self, doc_id: str, offset: int):
+        self.completed_docs.add(doc_id)
+        self.completed_chunks.pop(doc_id, None)
+        self._append({"doc": doc_id, "done": True, "offset": offset})
+
+
+class BatchExtractor:
+    """
+    Extracts the relations of every document of a manifest, checkpointing every chunk written.
+    With processes > 1 the documents are sharded across worker processes, each one building its miner
+    with miner_factory (a picklable callable) over a read only snapshot of the relations store, and sending back
+    every chunk as soon as it is extracted.
+    The relations are also streamed to the sink when given, a document at a time, and written out as the sink
+    fills its blocks and when it is closed: a run that finishes or fails leaves only completed documents in it.
+    A killed run keeps its output and checkpoint, but its sink loses the documents still buffered, and the Arrow
+    and Parquet part files it was writing are left as .tmp files.
+    """
+
+    def __init__(
+        self,
+        rel_miner: "RelationsMiner",
+        output_location: str,
+        checkpoint_location: Optional[str] = None,
+        processes: int = 1,
+        miner_factory: Callable[[FastRelationStore], "RelationsMiner"] = make_batch_miner,
+        sink: Optional[PartitionedSink] = None,
+    ):
+        self.rel_miner = rel_miner
+        self.output_location = output_location
+        self.checkpoint = BatchCheckpoint(checkpoint_location or f"{output_location}.checkpoint")
+        self.processes = processes
+        self.miner_factory = miner_factory
+        self.sink = sink
+        # the sink records of the document being written
+        self._sink_records: List[Dict] = []
+
+    def _open_output(self):
+        # anything written after the last checkpoint belongs to an interrupted chunk and is written again
+        mode = "r+b" if os.path.exists(self.output_location) else "w+b"
+        output = open(self.output_location, mode)
+        output.truncate(self.checkpoint.output_offset)
+        output.seek(self.checkpoint.output_offset)
+        return output
+
+    def _write_chunk(
+        self, output, job: BatchJob, chunk: int, num_relations: int, data: bytes, stats: Dict, records: Optional[List[Dict]]
+    ):
+        if self.sink is not None:
+            self._sink_records.extend(records)
+        output.write(data)
+        output.flush()
+        os.fsync(output.fileno())
+        self.checkpoint.mark_chunk(job.doc_id, chunk, output.tell())
+        stats["chunks"] += 1
+        stats["relations"] += num_relations
+
+    def _mark_done(self, output, job: BatchJob, stats: Dict):
+        if self.sink is not None:
+            # the sink writes its blocks on its own size thresholds, flushing every document would make tiny ones
+            self.sink.write_records(self._sink_records)
+            self._sink_records = []
+        self.checkpoint.mark_done(job.doc_id, output.tell())
+        stats["documents"] += 1
+        logger.info(f"Processed document {job.doc_id}. {stats}")
+
+    def _resume_sink(self, job: BatchJob, first_chunk: int):
+        # the chunks of the resumed document written to the output by the interrupted run are read back for the sink
+        self._sink_records = []
+        if self.sink is None or not first_chunk:
+            return
+        offset = 0
+        with open(self.output_location, "rb") as f:
+            for line in f:
+                offset += len(line)
+                if offset > self.checkpoint.output_offset:
+                    break
+                record = json.loads(line)
+                if record["document"] == job.doc_id and record["chunk"] < first_chunk:
+                    relation = Relation(record["subject"], record["name"], record["object"], provenance=[record["chunk"]])
+                    self._sink_records.append(relation_record(relation, job.doc_id))
+
+    def _extract_document(self, output, job: BatchJob, input_text: str, few_shot_context, stats: Dict):
+        prompts = self.rel_miner.make_chunk_prompts(job.subject, input_text, few_shot_context)
+        first_chunk = self.checkpoint.next_chunk(job.doc_id)
+        if first_chunk:
+            logger.info(f"Resuming {job.doc_id} at chunk {first_chunk}/{len(prompts)}")
+        self._resume_sink(job, first_chunk)
+
+        for chunk in range(first_chunk, len(prompts)):
+            # interactive calls sharing the scheduler go ahead of the batch ones, the relations of every
+            # chunk are merged before being written, the chunks are checkpointed one by one
+            relations = self.rel_miner.merge_relations(
+                self.rel_miner.extract_chunk(prompts[chunk], PRIORITY_BATCH, chunk), [job.subject]
+            )
+            records = [relation_record(relation, job.doc_id) for relation in relations] if self.sink else None
+            data = encode_relations(job, chunk, relations)
+            self._write_chunk(output, job, chunk, len(relations), data, stats, records)
+
+    def _pending_jobs(self, jobs: Iterator[BatchJob], stats: Dict) -> Iterator[BatchJob]:
+        for job in jobs:
+            if self.checkpoint.is_done(job.doc_id):
+                stats["skipped"] += 1
+                continue
+            yield job
+
+    def _run_serial(self, output, jobs: Iterator[BatchJob], stats: Dict):
+        # the few shot prompt is built once for the whole run
+        few_shot_context = self.rel_miner.build_few_shot_context()
+
+        for job in self._pending_jobs(jobs, stats):
+            with open(job.path) as f:
+                input_text = f.read()
+
+            # the stages and tokens of every document are reported under its id
+            with metric_labels(document=job.doc_id):
+                self._extract_document(output, job, input_text, few_shot_context, stats)
+
+            self._mark_done(output, job, stats)
+
+    def _run_processes(self, output, jobs: Iterator[BatchJob], stats: Dict):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            # the workers read a snapshot, a registration during the run does not change their prompts
+            snapshot = os.path.join(tmp_dir, os.path.basename(self.rel_miner.relation_store.relation_file))
+            shutil.copyfile(self.rel_miner.relation_store.relation_file, snapshot)
+            # the schedulers not already coordinated through RELMINER_RATE_FILE share this one
+            rate_file = os.path.join(tmp_dir, "rate.json")
+
+            with multiprocessing.Manager() as manager:
+                # a put on a manager queue returns once the result is stored, so all the chunks of a job
+                # are in the queue by the time its future is done
+                results = manager.Queue()
+                with ProcessPoolExecutor(
+                    self.processes, initializer=_init_worker, initargs=(self.miner_factory, snapshot, rate_file, results)
+                ) as executor:
+                    self._write_in_order(output, jobs, executor, results, stats)
+
+    def _write_in_order(self, output, jobs: Iterator[BatchJob], executor: ProcessPoolExecutor, results, stats: Dict):
+        # the results are written in manifest order, with a bounded number of documents in flight
+        pending: Deque[Tuple[BatchJob, int, Future]] = deque()
+        # doc_id -> chunk -> result, for the chunks received ahead of their turn
+        received: Dict[str, Dict[int, Tuple]] = {}
+
+        def receive(timeout: float):
+            try:
+                while True:
+                    doc_id, chunk, *result = results.get(timeout=timeout)
+                    received.setdefault(doc_id, {})[chunk] = result
+                    timeout = 0
+            except queue.Empty:
+                pass
+
+        def write_next():
+            job, first_chunk, future = pending.popleft()
+            self._resume_sink(job, first_chunk)
+            chunk = first_chunk
+            while True:
+                done = future.done()
+                receive(0 if done else RESULT_POLL_INTERVAL)
+                # the chunks of the document are written and checkpointed as they arrive
+                chunks = received.get(job.doc_id, {})
+                while chunk in chunks:
+                    num_relations, data, records = chunks.pop(chunk)
+                    self._write_chunk(output, job, chunk, num_relations, data, stats, records)
+                    chunk += 1
+                if done:
+                    break
+            received.pop(job.doc_id, None)
+            # a failed worker raises here, once the chunks it finished are checkpointed
+            future.result()
+            self._mark_done(output, job, stats)
+
+        try:
+            for job in self._pending_jobs(jobs, stats):
+                first_chunk = self.checkpoint.next_chunk(job.doc_id)
+                future = executor.submit(_extract_job, job, first_chunk, self.sink is not None)
+                pending.append((job, first_chunk, future))
+                if len(pending) >= self.processes * JOBS_PER_PROCESS:
+                    write_next()
+
+            while pending:
+                write_next()
+        except BaseException:
+            # the documents not started yet are extracted again by the next run
+            for _, _, future in pending:
+                future.cancel()
+            raise
+
+    def run(self, jobs: Iterator[BatchJob]) -> Dict:
+        stats = {"documents": 0, "skipped": 0, "chunks": 0, "relations": 0}
+
+        with self._open_output() as output:
+            if self.processes > 1:
+                self._run_processes(output, jobs, stats)
+            else:
+                self._run_serial(output, jobs, stats)
+
+        return stats
@@ -0,0 +1,200 @@
+from typing import Callable, Dict, List, NamedTuple
+import os
+import random
+import shutil
+import tempfile
+import time
+import tracemalloc
+
+from relminer.chunking import TokenChunker
+from relminer.domain import Relation
+from relminer.fake_llm import FakeChatModel
+from relminer.llm_cache import LLMResponseCache
+from relminer.relation_store import RELATION_FILE, FastRelationStore
+from relminer.relations_miner import RelationsMiner
+from relminer.scheduler import LLMScheduler
+
+SCENARIOS = ("extract", "extract_simple", "register", "store")
+
+FIRST_NAMES = ["Joe", "Ann", "Maria", "Steve", "Linda", "Omar", "Wei", "Paul"]
+LAST_NAMES = ["Smith", "Jobs", "Garcia", "Chen", "Okafor", "Novak"]
+PLACES = ["Boston", "Miami", "Paris", "Mountain View", "Lagos", "Kyoto", "Lisbon"]
+ORGANIZATIONS = ["Apple", "Acme", "Stanford University", "Red Cross", "Pixar"]
+SENTENCE_TEMPLATES = [
+    "{subject} moved to {place} in {year}.",
+    "{subject} worked at {organization} with {person}.",
+    "{subject} studied at {organization} before living in {place}.",
+    "{subject} and {person} are friends since {year}.",
+    "{subject} founded {organization} in {place}.",
+]
+
+
+class BenchmarkResult(NamedTuple):
+    scenario: str
+    size: int
+    operations: int
+    seconds: float
+    chunks: int
+    relations: int
+    p50: float
+    p99: float
+    prompt_tokens_per_chunk: float
+    peak_memory: int
+
+    def throughput(self) -> float:
+        return self.operations / self.seconds if self.seconds else 0.0
+
+
+def synthetic_document(subject: str, num_sentences: int, rnd: random.Random) -> str:
+    sentences = []
+    for _ in range(num_sentences):
+        sentences.append(
+            rnd.choice(SENTENCE_TEMPLATES).format(
+                subject=subject,
+                place=rnd.choice(PLACES),
+                organization=rnd.choice(ORGANIZATIONS),
+                person=f"{rnd.choice(FIRST_NAMES)} {rnd.choice(LAST_NAMES)}",
+                year=rnd.randint(1950, 2020),
+            )
+        )
+    return " ".join(sentences)
+
+
+def synthetic_corpus(num_documents: int, num_sentences: int, seed: int = 0) -> List[Dict[str, str]]:
+    rnd = random.Random(seed)
+    corpus = []
+    for _ in range(num_documents):
+        subject = f"{rnd.choice(FIRST_NAMES)} {rnd.choice(LAST_NAMES)}"
+        corpus.append({"subject": subject, "text": synthetic_document(subject, num_sentences, rnd)})
+    return corpus
+
+
+def synthetic_relations(num_relations: int, seed: int = 0) -> List[Relation]:
+    rnd = random.Random(seed)
+    names = ["Lived_At", "Works_At", "Friend_Of", "Founder_Of", "Studied_At"]
+    return [
+        Relation(
+            f"{rnd.choice(FIRST_NAMES)} {rnd.choice(LAST_NAMES)} {i}",
+            rnd.choice(names),
+            rnd.choice(PLACES + ORGANIZATIONS),
+            "a synthetic relation used to benchmark the store",
+            "",
+            "",
+        )
+        for i in range(num_relations)
+    ]
+
+
+def percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(int(q * len(ordered)), len(ordered) - 1)]
+
+
+class Benchmark:
+    """
+    Runs the extraction, registration and store scenarios offline against a FakeChatModel, on a copy
+    of the relations store, and measures throughput, latency percentiles, prompt tokens and peak memory.
+    """
+
+    def __init__(
+        self,
+        latency: float = 0.0,
+        failure_rate: float = 0.0,
+        seed: int = 0,
+        chunk_tokens: int = 512,
+        use_cache: bool = False,
+        relation_file: str = RELATION_FILE,
+    ):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.seed = seed
+        self.chunk_tokens = chunk_tokens
+        self.use_cache = use_cache
+        self.relation_file = relation_file
+
+    def _make_miner(self, tmp_dir: str) -> RelationsMiner:
+        relation_file = os.path.join(tmp_dir, "relations.avro")
+        shutil.copyfile(self.relation_file, relation_file)
+        llm_cache = LLMResponseCache(os.path.join(tmp_dir, "cache.sqlite")) if self.use_cache else None
+        return RelationsMiner(
+            relation_store=FastRelationStore(relation_file),
+            # the fake model is never rate limited by the scheduler, only by its own failures
+            scheduler=LLMScheduler(requests_per_minute=1e9, backoff=0.001, max_backoff=0.01, max_retries=100),
+            llm_cache=llm_cache,
+            chunker=TokenChunker(chunk_tokens=self.chunk_tokens),
+            chat_llm=FakeChatModel(latency=self.latency, jitter=0.5, failure_rate=self.failure_rate, seed=self.seed),
+        )
+
+    def _operations(self, scenario: str, rel_miner: RelationsMiner, size: int) -> List[Callable[[], int]]:
+        # every operation returns the number of relations it produced
+        if scenario in ("extract", "extract_simple"):
+            extract = rel_miner.extract_relations if scenario == "extract" else rel_miner.extract_relations_simple
+            corpus = synthetic_corpus(num_documents=10, num_sentences=size, seed=self.seed)
+            return [lambda doc=doc: len(extract(doc["subject"], doc["text"])) for doc in corpus]
+
+        relations = synthetic_relations(size, seed=self.seed)
+        if scenario == "register":
+            return [lambda: rel_miner.register_relations(relations) or len(relations)]
+        if scenario == "store":
+            store = rel_miner.relation_store
+            return [lambda: store.add_relations(relations), lambda: len(store.load_relations())]
+        raise ValueError(f"Unknown benchmark scenario {scenario}, expected one of {SCENARIOS}")
+
+    def run(self, scenario: str, size: int) -> BenchmarkResult:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            rel_miner = self._make_miner(tmp_dir)
+            operations = self._operations(scenario, rel_miner, size)
+
+            latencies, relations = [], 0
+            started_at = time.perf_counter()
+            for operation in operations:
+                operation_started_at = time.perf_counter()
+                relations += operation()
+                latencies.append(time.perf_counter() - operation_started_at)
+            seconds = time.perf_counter() - started_at
+
+            # the failed calls are retried, only the answered ones are chunks
+            calls = [call for call in rel_miner.chat_llm.calls if not call["failed"]]
+            prompt_tokens = sum(call["prompt_tokens"] for call in calls)
+            return BenchmarkResult(
+                scenario=scenario,
+                size=size,
+                operations=len(operations),
+                seconds=seconds,
+                chunks=len(calls),
+                relations=relations,
+                p50=percentile(latencies, 0.5),
+                p99=percentile(latencies, 0.99),
+                prompt_tokens_per_chunk=prompt_tokens / len(calls) if calls else 0.0,
+                peak_memory=self._peak_memory(scenario, size),
+            )
+
+    def _peak_memory(self, scenario: str, size: int) -> int:
+        # tracing every allocation slows the operations down, the memory is measured in its own untimed pass
+        # over a fresh copy of the store, replaying the same seeded operations
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            operations = self._operations(scenario, self._make_miner(tmp_dir), size)
+            tracemalloc.start()
+            try:
+                for operation in operations:
+                    operation()
+                _, peak_memory = tracemalloc.get_traced_memory()
+            finally:
+                tracemalloc.stop()
+            return peak_memory
+
+    def run_all(self, scenarios: List[str], sizes: List[int]) -> List[BenchmarkResult]:
+        return [self.run(scenario, size) for scenario in scenarios for size in sizes]
+
+
+def format_results(results: List[BenchmarkResult]) -> str:
+    header = f"{'scenario':<15}{'size':>7}{'ops/s':>10}{'p50 ms':>10}{'p99 ms':>10}{'chunks':>8}{'rels':>8}{'tok/chunk':>11}{'peak MB':>9}"
+    lines = [header]
+    for r in results:
+        lines.append(
+            f"{r.scenario:<15}{r.size:>7}{r.throughput():>10.2f}{r.p50 * 1000:>10.1f}{r.p99 * 1000:>10.1f}"
+            f"{r.chunks:>8}{r.relations:>8}{r.prompt_tokens_per_chunk:>11.0f}{r.peak_memory / 2 ** 20:>9.1f}"
+        )
+    return "\n".join(lines)
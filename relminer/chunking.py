@@ -0,0 +1,202 @@
+from typing import Callable, Deque, Iterable, Iterator, List, NamedTuple, Optional, TextIO
+from collections import deque
+import functools
+import logging
+import re
+import zlib
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MODEL_NAME = "gpt-3.5-turbo-1106"
+DEFAULT_CHUNK_TOKENS = 512
+# gpt-3.5-turbo-1106 context window
+DEFAULT_CONTEXT_WINDOW = 16385
+DEFAULT_COMPLETION_TOKENS = 1024
+# with content defined boundaries a chunk is closed on average every so many sentences
+DEFAULT_BOUNDARY_SENTENCES = 8
+
+# a sentence keeps its trailing whitespace, so consecutive sentences rebuild the original text
+SENTENCE_PATTERN = re.compile(r"[^.!?\n]+(?:[.!?]+|\n+|$)\s*")
+DEFAULT_BLOCK_SIZE = 64 * 1024
+WORD_PATTERN = re.compile(r"\S+\s*")
+
+
+def count_tokens(text: str) -> int:
+    # rough estimation of ~4 characters per token, good enough for budgeting
+    return len(text) // 4 + 1
+
+
+class Chunk(NamedTuple):
+    index: int
+    text: str
+    # character offsets of the chunk in the input text
+    start: int
+    end: int
+    tokens: int
+
+
+class Sentence(NamedTuple):
+    start: int
+    end: int
+    tokens: int
+    text: str
+
+
+def make_chunk(index: int, sentences: Iterable[Sentence]) -> Chunk:
+    sentences = list(sentences)
+    text = "".join(sentence.text for sentence in sentences)
+    return Chunk(index, text.strip(), sentences[0].start, sentences[-1].end, sum(s.tokens for s in sentences))
+
+
+def iter_text_blocks(fo: TextIO, block_size: int = DEFAULT_BLOCK_SIZE) -> Iterator[str]:
+    while True:
+        block = fo.read(block_size)
+        if not block:
+            return
+        yield block
+
+
+class ChunkPlan(NamedTuple):
+    num_chunks: int
+    chunk_tokens: int
+    prompt_tokens: int
+    input_tokens: int
+    total_tokens: int
+
+
+@functools.lru_cache(maxsize=None)
+def load_token_encoder(model_name: str) -> Callable[[str], int]:
+    # tiktoken is optional, without it the tokens are estimated from the text length
+    try:
+        import tiktoken
+    except ImportError:
+        return count_tokens
+
+    encoding = tiktoken.encoding_for_model(model_name)
+    return lambda text: len(encoding.encode(text, disallowed_special=()))
+
+
+def make_token_counter(model_name: str = DEFAULT_MODEL_NAME) -> Callable[[str], int]:
+    # the encoding (possibly downloaded by tiktoken) is only resolved by the first count, once per process and model,
+    # so building a chunker or a miner stays cheap
+    encoder: Optional[Callable[[str], int]] = None
+
+    def counter(text: str) -> int:
+        nonlocal encoder
+        if encoder is None:
+            encoder = load_token_encoder(model_name)
+        return encoder(text)
+
+    return counter
+
+
+class TokenChunker:
+    """
+    Splits a text in sentences and packs them in chunks of at most chunk_tokens model tokens,
+    leaving room in the context window for the rendered prompt and the completion.
+
+    With boundary_every, a chunk is also closed after the sentences whose hash is a multiple of it,
+    once a quarter of the budget is filled. The boundaries depend on the sentences and not on their position,
+    so after an edit the chunks realign with the previous ones past the edited sentences.
+    """
+
+    def __init__(
+        self,
+        chunk_tokens: int = DEFAULT_CHUNK_TOKENS,
+        overlap_tokens: int = 0,
+        context_window: int = DEFAULT_CONTEXT_WINDOW,
+        completion_tokens: int = DEFAULT_COMPLETION_TOKENS,
+        token_counter: Optional[Callable[[str], int]] = None,
+        boundary_every: Optional[int] = None,
+    ):
+        if overlap_tokens >= chunk_tokens:
+            raise ValueError("The chunk overlap should be smaller than the chunk size")
+        self.chunk_tokens = chunk_tokens
+        self.overlap_tokens = overlap_tokens
+        self.context_window = context_window
+        self.completion_tokens = completion_tokens
+        self.token_counter = token_counter or make_token_counter()
+        self.boundary_every = boundary_every
+
+    def budget(self, prompt_tokens: int = 0) -> int:
+        available = self.context_window - prompt_tokens - self.completion_tokens
+        if available <= 0:
+            raise ValueError(f"The prompt ({prompt_tokens} tokens) leaves no room for the input text")
+        return min(self.chunk_tokens, available)
+
+    def _split_sentence(self, text: str, start: int, budget: int) -> Iterator[Sentence]:
+        if not text.strip():
+            return
+        tokens = self.token_counter(text)
+        if tokens <= budget:
+            yield Sentence(start, start + len(text), tokens, text)
+            return
+        # the sentences bigger than the budget are split by words
+        for word in WORD_PATTERN.finditer(text):
+            yield Sentence(start + word.start(), start + word.end(), self.token_counter(word.group()), word.group())
+
+    def _is_boundary(self, sentence: Sentence, tokens: int, budget: int) -> bool:
+        if not self.boundary_every or tokens < budget // 4:
+            return False
+        return zlib.crc32(sentence.text.strip().encode("utf-8")) % self.boundary_every == 0
+
+    def _iter_sentences(self, blocks: Iterable[str], budget: int) -> Iterator[Sentence]:
+        # offset of the buffer in the whole text, the buffer only keeps the incomplete last sentence
+        offset, buffer = 0, ""
+        for block in blocks:
+            buffer += block
+            consumed = 0
+            for match in SENTENCE_PATTERN.finditer(buffer):
+                # the sentence reaching the end of the buffer may continue in the next block
+                if match.end() == len(buffer):
+                    break
+                yield from self._split_sentence(match.group(), offset + match.start(), budget)
+                consumed = match.end()
+            buffer = buffer[consumed:]
+            offset += consumed
+
+        for match in SENTENCE_PATTERN.finditer(buffer):
+            yield from self._split_sentence(match.group(), offset + match.start(), budget)
+
+    def iter_chunks(self, blocks: Iterable[str], prompt_tokens: int = 0) -> Iterator[Chunk]:
+        """Packs the sentences of a text read block by block, yielding every chunk as soon as it is full."""
+        budget = self.budget(prompt_tokens)
+        window: Deque[Sentence] = deque()
+        tokens, index = 0, 0
+        boundary = False
+
+        for sentence in self._iter_sentences(blocks, budget):
+            if window and (boundary or tokens + sentence.tokens > budget):
+                yield make_chunk(index, window)
+                index += 1
+
+                # the next chunk repeats the trailing sentences that fit in the overlap
+                overlap: Deque[Sentence] = deque()
+                overlap_tokens = 0
+                while len(overlap) + 1 < len(window) and overlap_tokens + window[-1 - len(overlap)].tokens <= self.overlap_tokens:
+                    overlap.appendleft(window[-1 - len(overlap)])
+                    overlap_tokens += overlap[0].tokens
+                window, tokens = overlap, overlap_tokens
+                while window and tokens + sentence.tokens > budget:
+                    tokens -= window.popleft().tokens
+
+            window.append(sentence)
+            tokens += sentence.tokens
+            boundary = self._is_boundary(sentence, tokens, budget)
+
+        if window:
+            yield make_chunk(index, window)
+
+    def split(self, text: str, prompt_tokens: int = 0) -> List[Chunk]:
+        return list(self.iter_chunks([text], prompt_tokens))
+
+    def plan(self, text: str, prompt_tokens: int = 0) -> ChunkPlan:
+        chunks = self.split(text, prompt_tokens)
+        input_tokens = sum(chunk.tokens for chunk in chunks)
+        return ChunkPlan(
+            num_chunks=len(chunks),
+            chunk_tokens=self.budget(prompt_tokens),
+            prompt_tokens=prompt_tokens,
+            input_tokens=input_tokens,
+            total_tokens=input_tokens + prompt_tokens * len(chunks),
+        )
@@ -0,0 +1,397 @@
+"""
+The relminer command line: python -m relminer <command> [options]
+
+Every command imports what it needs when it runs, so the commands working on the relations store
+start without loading langchain or building any OpenAI client.
+"""
+from typing import List, Optional
+import argparse
+import logging
+
+logger = logging.getLogger("relminer")
+
+# kept in sync with relminer.chunking.DEFAULT_CHUNK_TOKENS, relminer.benchmark.SCENARIOS and the relminer.sinks
+# formats and partition fields, which are not imported only to parse the arguments
+DEFAULT_CHUNK_TOKENS = 512
+SINK_FORMATS = ("avro", "arrow", "parquet")
+PARTITION_FIELDS = ("subject", "name", "object", "document")
+
+EXTRACT_DESCRIPTION = """
+Extracts the relations of a subject from the text of a file, with a prompt listing the stored relation types.
+With --few-shot the stored relations are also sent as few-shot examples, --stream and --doc-id need it.
+
+Example:
+
+python -m relminer extract "Steve Jobs" data.txt --chunk-tokens 256 --dry-run
+python -m relminer extract "Steve Jobs" data.txt --few-shot --doc-id steve-jobs
+"""
+
+ADD_DESCRIPTION = """
+Allows to register a new relation type, which can be used later as a few-shot example to extract relations from a given text.
+In this way you can add your custom relation types to ground the relation extraction for the LLM.
+
+* It Takes the subject, relation type, object, and description of a new relation type.
+* It uses OpenAI to generate a example sentence for this relation, and its explanation.
+
+Example:
+
+Given the subject:"Joe", relation type:"Traveled_To", object:"France" and a description:"Traveled_To describes the feact that a person traveled to a given location"
+It uses gpt-3.5-turbo-1106 to generate this example sentece with its explanation:
+
+sentence: "Joe traveled to France"
+explanation:"The relation 'Traveled_To' holds because Joe physically journeyed to the location of France"
+
+"""
+
+BATCH_DESCRIPTION = """
+Extracts the relations of many documents in a single run, writing the extracted relations as JSON lines while the documents are processed.
+
+* The input is a JSONL manifest with one {"subject": ..., "path": ...} job per line, or a directory of .txt documents whose file names are the subjects.
+* The progress is checkpointed per chunk next to the output, re-running the same command resumes an interrupted run where it stopped.
+* With --processes the documents are sharded across worker processes, the output keeps the manifest order and is still checkpointed per chunk. The workers share the rate limits, set RELMINER_RATE_FILE to share them with other runs.
+* With --sink-dir the relations are also streamed to Avro, Arrow or Parquet part files, partitioned with --partition-by.
+
+Example:
+
+python -m relminer batch manifest.jsonl relations.jsonl
+"""
+
+COMPACT_DESCRIPTION = """
+Rewrites the relations store into a single file with optimally sized blocks, dropping the duplicated (subject, relation, object) examples.
+"""
+
+BENCHMARK_DESCRIPTION = """
+Measures relminer's own overhead offline: the extraction, registration and store scenarios run against a local fake chat model
+answering after a configurable latency and failing at a configurable rate, on synthetic corpora of the given sizes.
+
+For every scenario and size it reports the throughput, the p50/p99 latency of an operation, the prompt tokens per chunk and the peak memory.
+The size is the number of sentences per document for the extraction scenarios, the number of relations for the others.
+
+Example:
+
+python -m relminer benchmark --scenarios extract register --sizes 10 100 --latency 0.05 --failure-rate 0.1
+"""
+
+BENCHMARK_SCENARIOS = ("extract", "extract_simple", "register", "store")
+
+SERVE_DESCRIPTION = """
+Serves the extraction over HTTP, keeping warm miners and the loaded relations store in memory:
+
+* POST /extract {"subject": ..., "text": ...}
+* POST /register {"relations": [{"subject": ..., "name": ..., "object": ..., "description": ...}]}
+* POST /compare {"subject_a": ..., "text_a": ..., "subject_b": ..., "text_b": ...}
+* GET /health
+
+Identical in-flight extractions are coalesced, and the subjects extracted from the same text together share their LLM calls.
+The extractions of different texts are not batched, each one makes its own LLM calls.
+
+Example:
+
+python -m relminer serve --port 8080 --pool-size 4
+"""
+
+
+def _add_metrics_file(parser: argparse.ArgumentParser):
+    parser.add_argument("--metrics-file", help="A JSONL file where every stage timing and token count is appended")
+
+
+def _setup_metrics(args: argparse.Namespace):
+    from relminer.metrics import JSONLSink, get_default_metrics
+
+    metrics = get_default_metrics()
+    if args.metrics_file:
+        metrics.add_sink(JSONLSink(args.metrics_file))
+    return metrics
+
+
+def run_extract(args: argparse.Namespace):
+    if (args.stream or args.doc_id) and not args.few_shot:
+        raise SystemExit("relminer extract: --stream and --doc-id extract with the few-shot prompt, add --few-shot")
+
+    from relminer.chunking import DEFAULT_BOUNDARY_SENTENCES, TokenChunker
+    from relminer.llm_cache import LLMResponseCache
+    from relminer.manifest import ChunkManifest
+    from relminer.normalize import EntityNormalizer
+    from relminer.relation_store import FastRelationStore
+    from relminer.relations_miner import RelationsMiner
+
+    metrics = _setup_metrics(args)
+
+    relation_store = FastRelationStore()
+
+    llm_cache = LLMResponseCache(enabled=not args.no_cache)
+
+    # the chunk boundaries of an edited document realign with the ones stored in the manifest
+    boundary_every = DEFAULT_BOUNDARY_SENTENCES if args.doc_id else None
+    chunker = TokenChunker(chunk_tokens=args.chunk_tokens, overlap_tokens=args.overlap_tokens, boundary_every=boundary_every)
+
+    entity_normalizer = EntityNormalizer.from_file(args.aliases) if args.aliases else None
+
+    manifest = ChunkManifest() if args.doc_id else None
+
+    rel_miner = RelationsMiner(
+        relation_store=relation_store,
+        llm_cache=llm_cache,
+        chunker=chunker,
+        entity_normalizer=entity_normalizer,
+        manifest=manifest,
+    )
+
+    if args.stream:
+        # the whole file is never loaded, the chunks are extracted while it is read
+        num_relations = 0
+        with open(args.file) as f:
+            for chunk, relations in rel_miner.iter_relations(args.sub, f):
+                num_relations += len(relations)
+                logger.info(f"Chunk {chunk.index} [{chunk.start}:{chunk.end}] relations \n{relations}")
+        logger.info(f"Extracted {num_relations} relations. LLM cache stats {llm_cache.stats()}")
+        logger.info(f"Run summary\n{metrics.format_summary()}")
+        return
+
+    with open(args.file) as f:
+        input_text = f.read()
+
+    plan = rel_miner.plan_extraction(args.sub, input_text, simple=not args.few_shot)
+    logger.info(
+        f"{plan.num_chunks} chunks of up to {plan.chunk_tokens} tokens, "
+        f"{plan.prompt_tokens} prompt tokens per chunk, ~{plan.total_tokens} tokens in total"
+    )
+    if args.dry_run:
+        return
+
+    # the simple prompt is the default, as in the original extract_relations.py
+    if args.few_shot:
+        extracted_relations = rel_miner.extract_relations(args.sub, input_text, doc_id=args.doc_id)
+    else:
+        extracted_relations = rel_miner.extract_relations_simple(args.sub, input_text)
+    if manifest is not None:
+        logger.info(f"Manifest stats {manifest.stats()}")
+
+    logger.info(f"The following relations were extracted \n{extracted_relations}")
+
+    logger.info(f"LLM cache stats {llm_cache.stats()}")
+
+    logger.info(f"Run summary\n{metrics.format_summary()}")
+
+
+def run_add(args: argparse.Namespace):
+    from relminer.domain import Relation
+    from relminer.llm_cache import LLMResponseCache
+    from relminer.relation_store import FastRelationStore
+    from relminer.relations_miner import RelationsMiner
+
+    relation_store = FastRelationStore()
+
+    llm_cache = LLMResponseCache(enabled=not args.no_cache)
+
+    rel_miner = RelationsMiner(relation_store=relation_store, llm_cache=llm_cache)
+
+    rel_miner.register_relation(Relation(args.sub, args.rel, args.obj, args.desc))
+
+    logger.info(f"LLM cache stats {llm_cache.stats()}")
+
+
+def run_list(args: argparse.Namespace):
+    from relminer.relation_store import IndexedRelationStore
+
+    relation_store = IndexedRelationStore()
+
+    if args.types:
+        relations = sorted(relation_store.relation_names())
+    elif args.name:
+        relations = relation_store.get_by_name(args.name)
+    elif args.subject:
+        relations = relation_store.get_by_subject(args.subject)
+    else:
+        relations = relation_store.load_relations()
+
+    for relation in relations:
+        logger.info(f"\n{relation}")
+
+
+def run_batch(args: argparse.Namespace):
+    import functools
+
+    from relminer.batch import BatchExtractor, make_batch_miner, read_manifest
+    from relminer.metrics import PrometheusSink
+    from relminer.relation_store import FastRelationStore
+    from relminer.sinks import make_sink
+
+    metrics = _setup_metrics(args)
+    if args.metrics_port:
+        prometheus_sink = PrometheusSink()
+        metrics.add_sink(prometheus_sink)
+        prometheus_sink.serve(args.metrics_port)
+
+    relation_store = FastRelationStore()
+
+    # the worker processes build their own miner with the same factory
+    miner_factory = functools.partial(make_batch_miner, use_cache=not args.no_cache)
+
+    rel_miner = miner_factory(relation_store)
+
+    # the relations are also streamed to columnar part files, ready for the analytics tools
+    sink = None
+    if args.sink_dir:
+        sink = make_sink(args.sink_format, args.sink_dir, args.partition_by, args.sink_codec, args.sink_block_size)
+
+    batch_extractor = BatchExtractor(
+        rel_miner, args.output, args.checkpoint, processes=args.processes, miner_factory=miner_factory, sink=sink
+    )
+
+    try:
+        stats = batch_extractor.run(read_manifest(args.manifest))
+    finally:
+        if sink is not None:
+            sink.close()
+
+    logger.info(f"Batch extraction finished {stats}")
+    logger.info(f"LLM cache stats {rel_miner.llm_cache.stats()}")
+
+    logger.info(f"Run summary\n{metrics.format_summary()}")
+    for document, summary in metrics.summary(group_by="document").items():
+        if document is not None:
+            logger.info(f"Document {document} {summary['counters']}")
+
+
+def run_compact(args: argparse.Namespace):
+    from relminer.relation_store import FastRelationStore
+
+    relation_store = FastRelationStore()
+
+    stats = relation_store.compact(codec=args.codec, block_size=args.block_size)
+
+    logger.info(f"Compaction finished {stats}")
+
+
+def run_benchmark(args: argparse.Namespace):
+    import json
+
+    from relminer.benchmark import Benchmark, format_results
+
+    benchmark = Benchmark(
+        latency=args.latency,
+        failure_rate=args.failure_rate,
+        seed=args.seed,
+        chunk_tokens=args.chunk_tokens,
+        use_cache=args.cache,
+    )
+
+    results = benchmark.run_all(args.scenarios, args.sizes)
+
+    if args.json:
+        for result in results:
+            print(json.dumps({**result._asdict(), "throughput": result.throughput()}))
+    else:
+        print(format_results(results))
+
+
+def run_serve(args: argparse.Namespace):
+    from relminer.fake_llm import FakeChatModel
+    from relminer.llm_cache import LLMResponseCache
+    from relminer.relation_store import FastRelationStore
+    from relminer.relations_miner import RelationsMiner
+    from relminer.server import ExtractionService
+
+    # the miners share the store and the cache, each one keeps its own few shot context warm
+    relation_store = FastRelationStore()
+
+    llm_cache = LLMResponseCache(enabled=not args.no_cache)
+
+    def make_miner() -> RelationsMiner:
+        chat_llm = FakeChatModel(latency=args.fake_llm_latency) if args.fake_llm_latency is not None else None
+        return RelationsMiner(relation_store=relation_store, llm_cache=llm_cache, chat_llm=chat_llm)
+
+    service = ExtractionService(make_miner, pool_size=args.pool_size, batch_window=args.batch_window)
+    service.run(args.host, args.port)
+
+
+def make_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="relminer", description="Extracts relations from text with LLMs")
+    commands = parser.add_subparsers(dest="command", metavar="command")
+    commands.required = True
+
+    # the options shared by every command
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument( '-l', '--loglevel', default='info', help='Example --loglevel debug, default=info' )
+
+    def add_command(name: str, **kwargs) -> argparse.ArgumentParser:
+        return commands.add_parser(name, parents=[common], formatter_class=argparse.RawTextHelpFormatter, **kwargs)
+
+    extract = add_command("extract", help="Extract the relations of a subject from a text file", description=EXTRACT_DESCRIPTION)
+    extract.add_argument("sub", help="The subject for which the relations will be extracted")
+    extract.add_argument("file", help="The file name containing the text from which the relations will be extracted from")
+    extract.add_argument("--chunk-tokens", type=int, default=DEFAULT_CHUNK_TOKENS, help=f"The maximum model tokens of every chunk, default={DEFAULT_CHUNK_TOKENS}")
+    extract.add_argument("--overlap-tokens", type=int, default=0, help="The tokens of trailing sentences repeated in the next chunk, default=0")
+    extract.add_argument("--dry-run", action="store_true", help="Only report the number of chunks and the estimated tokens, without calling the LLM")
+    extract.add_argument("--aliases", help="A JSON file of entity alias -> canonical name, used to merge the duplicated relations")
+    extract.add_argument("--no-cache", action="store_true", help="Always call the LLM instead of reusing cached generations")
+    extract.add_argument("--few-shot", action="store_true", help="Also send the stored relations most relevant to every chunk as few-shot examples")
+    # the few-shot extraction can either stream the file or reuse the manifest of the document
+    mode = extract.add_mutually_exclusive_group()
+    mode.add_argument("--stream", action="store_true", help="Read the file incrementally and report the relations of every chunk as soon as it is extracted")
+    mode.add_argument("--doc-id", help="Keep the relations of every chunk in the manifest under this id, so only the chunks edited since the last run are extracted again")
+    _add_metrics_file(extract)
+    extract.set_defaults(run=run_extract)
+
+    add = add_command("add", help="Register a new relation type as few-shot example", description=ADD_DESCRIPTION)
+    add.add_argument("sub", help="The subject of the relationship")
+    add.add_argument("rel", help="The relationship name")
+    add.add_argument("obj", help="The object of the relationship")
+    add.add_argument("desc", help="The description of the relationship")
+    add.add_argument("--no-cache", action="store_true", help="Always call the LLM instead of reusing cached generations")
+    add.set_defaults(run=run_add)
+
+    list_ = add_command("list", help="List the relations stored as few-shot examples", description="Lists the relations stored as few-shot examples")
+    list_.add_argument("--name", help="Only list the examples of this relation type")
+    list_.add_argument("--subject", help="Only list the examples of this subject")
+    list_.add_argument("--types", action="store_true", help="Only list the distinct relation types")
+    list_.set_defaults(run=run_list)
+
+    batch = add_command("batch", help="Extract the relations of many documents", description=BATCH_DESCRIPTION)
+    batch.add_argument("manifest", help="The JSONL manifest or the directory with the documents")
+    batch.add_argument("output", help="The JSONL file where the extracted relations are written")
+    batch.add_argument("--checkpoint", help="The checkpoint file, default=<output>.checkpoint")
+    batch.add_argument("--no-cache", action="store_true", help="Always call the LLM instead of reusing cached generations")
+    batch.add_argument("--processes", type=int, default=1, help="Shard the documents across this many worker processes, default=1")
+    batch.add_argument("--sink-dir", help="Also stream the relations to columnar part files in this directory")
+    batch.add_argument("--sink-format", choices=SINK_FORMATS, default="avro", help="The format of the part files, default=avro (arrow and parquet need pyarrow)")
+    batch.add_argument("--partition-by", choices=PARTITION_FIELDS, help="Write one directory of part files per value of this field")
+    batch.add_argument("--sink-codec", help="The compression of the part files, default=deflate for avro, zstd for arrow and parquet")
+    batch.add_argument("--sink-block-size", type=int, help="The bytes of an Avro block, or the rows of an Arrow record batch or Parquet row group")
+    batch.add_argument("--metrics-port", type=int, help="Expose the metrics in the Prometheus text format on this port while the batch runs")
+    _add_metrics_file(batch)
+    batch.set_defaults(run=run_batch)
+
+    compact = add_command("compact", help="Compact the relations store", description=COMPACT_DESCRIPTION)
+    compact.add_argument("--codec", default="null", help="The Avro codec of the compacted file, default=null (required by the indexed store)")
+    compact.add_argument("--block-size", type=int, default=64 * 1024, help="The approximate size in bytes of every Avro block, default=65536")
+    compact.set_defaults(run=run_compact)
+
+    benchmark = add_command("benchmark", help="Measure relminer's overhead against a fake chat model", description=BENCHMARK_DESCRIPTION)
+    benchmark.add_argument("--scenarios", nargs="+", choices=BENCHMARK_SCENARIOS, default=list(BENCHMARK_SCENARIOS), help="The scenarios to run, default=all")
+    benchmark.add_argument("--sizes", nargs="+", type=int, default=[10, 100], help="The corpus sizes, default=10 100")
+    benchmark.add_argument("--latency", type=float, default=0.0, help="The mean latency in seconds of a fake model call, default=0")
+    benchmark.add_argument("--failure-rate", type=float, default=0.0, help="The rate of fake model calls failing with a rate limit error, default=0")
+    benchmark.add_argument("--chunk-tokens", type=int, default=DEFAULT_CHUNK_TOKENS, help=f"The maximum model tokens of every chunk, default={DEFAULT_CHUNK_TOKENS}")
+    benchmark.add_argument("--cache", action="store_true", help="Use a (fresh) LLM response cache")
+    benchmark.add_argument("--seed", type=int, default=0, help="The seed of the corpus and the fake model, default=0")
+    benchmark.add_argument("--json", action="store_true", help="Print the results as JSON lines")
+    benchmark.set_defaults(run=run_benchmark)
+
+    serve = add_command("serve", help="Serve the extraction over HTTP", description=SERVE_DESCRIPTION)
+    serve.add_argument("--host", default="127.0.0.1", help="The address to listen on, default=127.0.0.1")
+    serve.add_argument("--port", type=int, default=8080, help="The port to listen on, default=8080")
+    serve.add_argument("--pool-size", type=int, default=4, help="The number of warm miners, default=4")
+    serve.add_argument("--batch-window", type=float, default=0.01, help="The seconds the extractions of the same text wait for each other, default=0.01")
+    serve.add_argument("--no-cache", action="store_true", help="Always call the LLM instead of reusing cached generations")
+    serve.add_argument("--fake-llm-latency", type=float, help="Answer with the local fake chat model after this latency instead of calling OpenAI, for testing")
+    serve.set_defaults(run=run_serve)
+
+    return parser
+
+
+def main(argv: Optional[List[str]] = None):
+    args = make_parser().parse_args(argv)
+    logging.basicConfig(level=args.loglevel.upper())
+    args.run(args)
@@ -0,0 +1,102 @@
+from typing import Dict, Hashable, Iterable, List, NamedTuple, Tuple
+
+from relminer.domain import Relation
+from relminer.normalize import normalize_text
+
+# name: same relation type, name_object: same relation type to the same object,
+# object: related to the same (normalized) object through any relation
+OVERLAP_LEVELS = ("name", "name_object", "object")
+# above this many index hits per subject pair the overlaps are counted with set intersections
+DENSE_OVERLAP_FACTOR = 16
+
+
+def overlap_keys(relation: Relation) -> Dict[str, Hashable]:
+    return {
+        "name": relation.name,
+        "name_object": (relation.name, normalize_text(relation.object)),
+        "object": normalize_text(relation.object),
+    }
+
+
+class OverlapReport(NamedTuple):
+    subjects: List[str]
+    # level -> square matrix of shared key counts, indexed like subjects (the diagonal holds the distinct keys)
+    counts: Dict[str, List[List[int]]]
+    # level -> shared key -> subjects sharing it
+    shared: Dict[str, Dict[Hashable, List[str]]]
+
+    def pair(self, level: str, subject_a: str, subject_b: str) -> int:
+        return self.counts[level][self.subjects.index(subject_a)][self.subjects.index(subject_b)]
+
+
+class RelationComparator:
+    """
+    Compares the relation sets of N subjects through hash indexes on the relation name, the
+    (name, object) pair and the normalized object: each index maps a key to the subjects having it,
+    so the cost is linear in the number of relations plus the number of shared (key, pair) hits.
+    """
+
+    def __init__(self, relation_sets: Dict[str, Iterable[Relation]]):
+        self.subjects: List[str] = list(relation_sets)
+        self.indexes: Dict[str, Dict[Hashable, List[int]]] = {level: {} for level in OVERLAP_LEVELS}
+        # level -> key -> [(subject position, relation)]
+        self.relations: Dict[str, Dict[Hashable, List[Tuple[int, Relation]]]] = {level: {} for level in OVERLAP_LEVELS}
+
+        for position, subject in enumerate(self.subjects):
+            for relation in relation_sets[subject]:
+                for level, key in overlap_keys(relation).items():
+                    positions = self.indexes[level].setdefault(key, [])
+                    # the relations of one subject are indexed together, a repeated key is the last appended
+                    if not positions or positions[-1] != position:
+                        positions.append(position)
+                    self.relations[level].setdefault(key, []).append((position, relation))
+
+    def shared_keys(self, level: str, min_subjects: int = 2) -> Dict[Hashable, List[str]]:
+        return {
+            key: [self.subjects[position] for position in positions]
+            for key, positions in self.indexes[level].items()
+            if len(positions) >= min_subjects
+        }
+
+    def overlap_matrix(self, level: str) -> List[List[int]]:
+        size = len(self.subjects)
+        index = self.indexes[level]
+
+        # sparse overlaps are counted from the index, dense ones from per subject key set intersections
+        index_cost = sum(len(positions) ** 2 for positions in index.values())
+        if index_cost > DENSE_OVERLAP_FACTOR * size * size:
+            key_sets = [set() for _ in range(size)]
+            for key, positions in index.items():
+                for position in positions:
+                    key_sets[position].add(key)
+            matrix = [[0] * size for _ in range(size)]
+            for a in range(size):
+                matrix[a][a] = len(key_sets[a])
+                for b in range(a + 1, size):
+                    matrix[a][b] = matrix[b][a] = len(key_sets[a] & key_sets[b])
+            return matrix
+
+        matrix = [[0] * size for _ in range(size)]
+        for positions in index.values():
+            # every subject having the key counts it against every other one (and itself on the diagonal)
+            for a in positions:
+                row = matrix[a]
+                for b in positions:
+                    row[b] += 1
+        return matrix
+
+    def shared_relations(self, level: str, subjects: Iterable[str]) -> List[Relation]:
+        # the relations of the given subjects behind the keys they all share
+        positions = set(self.subjects.index(subject) for subject in subjects)
+        results = []
+        for key, key_positions in self.indexes[level].items():
+            if positions.issubset(key_positions):
+                results.extend(rel for position, rel in self.relations[level][key] if position in positions)
+        return results
+
+    def report(self) -> OverlapReport:
+        return OverlapReport(
+            subjects=self.subjects,
+            counts={level: self.overlap_matrix(level) for level in OVERLAP_LEVELS},
+            shared={level: self.shared_keys(level) for level in OVERLAP_LEVELS},
+        )
@@ -1,9 +1,21 @@
-from typing import List, TypeVar, Type
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Sequence, TypeVar, Type
+from array import array
 import json
+import sys
 
 T = TypeVar("T", bound="Relation")
 
+RELATION_FIELDS = ("subject", "name", "object", "description", "sentence", "explanation")
+# the columns with few distinct values are dictionary encoded
+ENCODED_FIELDS = ("subject", "name", "object")
+RELATION_KEY = ("subject", "name", "object")
+# the columns of a RelationBatch, the chunk indices of every relation are kept along with its fields
+BATCH_FIELDS = RELATION_FIELDS + ("provenance",)
+
 class Relation:
+    # provenance: indices of the chunks the relation was extracted from
+    __slots__ = RELATION_FIELDS + ("provenance",)
+
     def __init__(
         self,
         subject: str,
@@ -12,6 +24,7 @@ class Relation:
         description: str = "",
         sentence: str = "",
         explanation: str = "",
+        provenance: Optional[List[int]] = None,
     ):
         self.name = name
         self.description = description
@@ -19,6 +32,7 @@ class Relation:
         self.object = object
         self.sentence = sentence
         self.explanation = explanation
+        self.provenance = provenance or []
 
     def to_dict(self, exclude=[]) -> dict:
         d = {
@@ -53,3 +67,163 @@ class Relation:
 
     def __repr__(self) -> str:
         return self.__str__()
+
+
+
+class EncodedColumn:
+    """Column of interned strings stored as integer codes into a vocabulary."""
+
+    def __init__(self):
+        self.codes = array("I")
+        self.vocabulary: List[str] = []
+        self.lookup: Dict[str, int] = {}
+
+    def encode(self, value: str) -> int:
+        code = self.lookup.get(value)
+        if code is None:
+            code = len(self.vocabulary)
+            value = sys.intern(value)
+            self.vocabulary.append(value)
+            self.lookup[value] = code
+        return code
+
+    def append(self, value: str):
+        self.codes.append(self.encode(value))
+
+    def __getitem__(self, i: int) -> str:
+        return self.vocabulary[self.codes[i]]
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+    def __iter__(self) -> Iterator[str]:
+        vocabulary = self.vocabulary
+        return (vocabulary[code] for code in self.codes)
+
+
+class RelationBatch:
+    """
+    Columnar container of relations. Subject, name and object are dictionary encoded, so millions of
+    triplets only hold a few distinct strings, and the filters work on the integer codes.
+    The provenance of every relation is kept in its own column of chunk index lists.
+    """
+
+    def __init__(self):
+        self.columns: Dict[str, object] = {
+            field: EncodedColumn() if field in ENCODED_FIELDS else [] for field in BATCH_FIELDS
+        }
+
+    @classmethod
+    def from_relations(cls, relations: Iterable[Relation]) -> "RelationBatch":
+        batch = cls()
+        batch.extend(relations)
+        return batch
+
+    @classmethod
+    def from_dicts(cls, records: Iterable[Dict]) -> "RelationBatch":
+        batch = cls()
+        for record in records:
+            batch.append_dict(record)
+        return batch
+
+    @classmethod
+    def from_avro(cls, fo) -> "RelationBatch":
+        import fastavro
+
+        return cls.from_dicts(fastavro.reader(fo))
+
+    def append_dict(self, record: Dict):
+        for field in RELATION_FIELDS:
+            self.columns[field].append(record.get(field, ""))
+        self.columns["provenance"].append(list(record.get("provenance", ())))
+
+    def append(self, relation: Relation):
+        for field in RELATION_FIELDS:
+            self.columns[field].append(getattr(relation, field))
+        self.columns["provenance"].append(list(relation.provenance))
+
+    def extend(self, relations: Iterable[Relation]):
+        for relation in relations:
+            self.append(relation)
+
+    def __len__(self) -> int:
+        return len(self.columns["subject"])
+
+    def __getitem__(self, i: int) -> Relation:
+        return Relation(
+            **{field: self.columns[field][i] for field in RELATION_FIELDS}, provenance=list(self.columns["provenance"][i])
+        )
+
+    def __iter__(self) -> Iterator[Relation]:
+        for i in range(len(self)):
+            yield self[i]
+
+    def column(self, field: str) -> Sequence[str]:
+        return self.columns[field]
+
+    def mask(self, field: str, values: Iterable[str]) -> List[bool]:
+        values = set(values)
+        column = self.columns[field]
+        if isinstance(column, EncodedColumn):
+            # the values are compared once per distinct string, then per row on the integer codes
+            codes = set(column.lookup[value] for value in values if value in column.lookup)
+            return [code in codes for code in column.codes]
+        return [value in values for value in column]
+
+    def mask_where(self, field: str, predicate: Callable[[str], bool]) -> List[bool]:
+        column = self.columns[field]
+        if isinstance(column, EncodedColumn):
+            matches = [predicate(value) for value in column.vocabulary]
+            return [matches[code] for code in column.codes]
+        return [predicate(value) for value in column]
+
+    def take(self, indices: Iterable[int]) -> "RelationBatch":
+        batch = RelationBatch()
+        indices = list(indices)
+        for field in BATCH_FIELDS:
+            column, target = self.columns[field], batch.columns[field]
+            if isinstance(column, EncodedColumn):
+                for i in indices:
+                    target.append(column.vocabulary[column.codes[i]])
+            else:
+                target.extend(column[i] for i in indices)
+        return batch
+
+    def filter(self, mask: Sequence[bool]) -> "RelationBatch":
+        return self.take(i for i, keep in enumerate(mask) if keep)
+
+    def select(self, **conditions: str) -> "RelationBatch":
+        # ex: batch.select(name="lived_at", subject="Joe")
+        mask = [True] * len(self)
+        for field, value in conditions.items():
+            mask = [keep and matches for keep, matches in zip(mask, self.mask(field, [value]))]
+        return self.filter(mask)
+
+    def dedup(self, fields: Sequence[str] = RELATION_KEY) -> "RelationBatch":
+        # the first relation of every (subject, name, object) is kept
+        keys = [
+            self.columns[field].codes if isinstance(self.columns[field], EncodedColumn) else self.columns[field]
+            for field in fields
+        ]
+        seen, indices = set(), []
+        for i, key in enumerate(zip(*keys)):
+            if key not in seen:
+                seen.add(key)
+                indices.append(i)
+        return self.take(indices)
+
+    def to_dicts(self, exclude: Sequence[str] = ()) -> Iterator[Dict]:
+        fields = [field for field in BATCH_FIELDS if field not in exclude]
+        for i in range(len(self)):
+            yield {field: self.columns[field][i] for field in fields}
+
+    def to_relations(self) -> List[Relation]:
+        return list(self)
+
+    def to_avro(self, fo, codec: str = "null"):
+        import fastavro
+        from relminer.relation_store import relation_schema_def
+
+        # the store schema has no provenance
+        records = self.to_dicts(exclude=["provenance"])
+        fastavro.writer(fo, fastavro.parse_schema(relation_schema_def), records, codec=codec)
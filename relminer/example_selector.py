@@ -0,0 +1,115 @@
+from typing import Dict, List, Optional, Tuple
+from collections import Counter
+from itertools import chain
+import math
+import re
+
+from langchain.prompts import PromptTemplate
+from langchain.prompts.example_selector.base import BaseExampleSelector
+
+from relminer.domain import Relation
+from relminer.relations_miner_utils import count_tokens, get_few_shot_examples
+
+TERM_PATTERN = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text: str) -> List[str]:
+    # relation names like Lived_At are split in their words
+    return TERM_PATTERN.findall(text.lower())
+
+
+class BM25ExampleSelector(BaseExampleSelector):
+    """
+    Selects the few-shot examples most relevant to the chunk being extracted using
+    a BM25 index over the sentence, description and name of the stored relations.
+    The selected examples are capped by count (k) and by their rendered tokens (max_tokens).
+    """
+
+    def __init__(
+        self,
+        k: int = 10,
+        max_tokens: Optional[int] = None,
+        example_prompt: Optional[PromptTemplate] = None,
+        input_key: str = "input",
+        k1: float = 1.5,
+        b: float = 0.75,
+    ):
+        self.k = k
+        self.max_tokens = max_tokens
+        self.example_prompt = example_prompt
+        self.input_key = input_key
+        self.k1 = k1
+        self.b = b
+        self.examples: List[Dict] = []
+        self.example_tokens: List[int] = []
+        self.doc_lengths: List[int] = []
+        # term -> [(example index, term frequency)]
+        self.postings: Dict[str, List[Tuple[int, int]]] = {}
+        self.total_length = 0
+        # the query and the examples last selected for it
+        self._last_selection: Optional[Tuple[str, List[Dict]]] = None
+
+    @classmethod
+    def from_relations(cls, relations: List[Relation], **kwargs) -> "BM25ExampleSelector":
+        selector = cls(**kwargs)
+        for relation, example in zip(relations, get_few_shot_examples(relations)):
+            selector.add_example(example, " ".join([relation.name, relation.description, relation.sentence]))
+        return selector
+
+    def add_example(self, example: Dict[str, str], text: Optional[str] = None):
+        terms = Counter(tokenize(text if text is not None else " ".join(example.values())))
+        example_index = len(self.examples)
+        self.examples.append(example)
+        for term, freq in terms.items():
+            self.postings.setdefault(term, []).append((example_index, freq))
+        self.doc_lengths.append(sum(terms.values()))
+        self.total_length += self.doc_lengths[-1]
+        self._last_selection = None
+
+        if self.example_prompt:
+            rendered = self.example_prompt.format(**{k: example[k] for k in self.example_prompt.input_variables})
+        else:
+            rendered = " ".join(example.values())
+        self.example_tokens.append(count_tokens(rendered))
+
+    def _scores(self, query: str) -> Dict[int, float]:
+        num_docs = len(self.examples)
+        avg_length = max(self.total_length / num_docs, 1)
+
+        # only the examples sharing a term with the query are scored
+        scores: Dict[int, float] = {}
+        for term in set(tokenize(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (num_docs - len(postings) + 0.5) / (len(postings) + 0.5))
+            for i, freq in postings:
+                norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[i] / avg_length)
+                scores[i] = scores.get(i, 0.0) + idf * freq * (self.k1 + 1) / (freq + norm)
+        return scores
+
+    def select_examples(self, input_variables: Dict[str, str]) -> List[dict]:
+        if not self.examples:
+            return []
+
+        # the prompt of a chunk selects its examples twice, to list their relation types and to render them
+        query = input_variables.get(self.input_key, "")
+        last_selection = self._last_selection
+        if last_selection is not None and last_selection[0] == query:
+            return last_selection[1]
+
+        scores = self._scores(query)
+        # the matching examples go first, then the rest in store order so the selection is deterministic
+        matching = sorted(scores, key=lambda i: (-scores[i], i))
+        ranking = chain(matching, (i for i in range(len(self.examples)) if i not in scores))
+
+        selected, used_tokens = [], 0
+        for i in ranking:
+            if len(selected) >= self.k or (self.max_tokens is not None and used_tokens >= self.max_tokens):
+                break
+            if self.max_tokens is not None and used_tokens + self.example_tokens[i] > self.max_tokens:
+                continue
+            selected.append(self.examples[i])
+            used_tokens += self.example_tokens[i]
+        self._last_selection = (query, selected)
+        return selected
@@ -0,0 +1,117 @@
+from typing import Dict, List, NamedTuple
+import asyncio
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+
+from langchain.schema import BaseMessage
+
+from relminer.chunking import count_tokens
+
+FAKE_MODEL_NAME = "fake-chat-model"
+
+SUBJECT_PATTERN = re.compile(r"focus on (.+?)(?:\.|\n|$)")
+RELATION_TYPES_PATTERN = re.compile(r"'(\w+)'")
+# the input text is the last "text: ..." (few shot prompt) or "text 6: ..." (simple prompt) of the prompt
+INPUT_PATTERN = re.compile(r"text(?: \d+)?: ", re.MULTILINE)
+EXPLAIN_PATTERN = re.compile(r'relation type "(.*?)".*?subject "(.*?)" and object "(.*?)"', re.DOTALL)
+# the batch explanation prompts list the relation types one per line, with their index
+EXPLAIN_BATCH_PATTERN = re.compile(r'^(\d+)\. relation type "(.*?)".*?subject "(.*?)" and object "(.*?)"', re.MULTILINE)
+SENTENCE_PATTERN = re.compile(r"[^.!?\n]+")
+ENTITY_PATTERN = re.compile(r"[A-Z]\w*(?: [A-Z]\w*)*")
+
+
+class FakeGeneration(NamedTuple):
+    content: str
+
+
+class FakeRateLimitError(Exception):
+    status_code = 429
+
+
+class FakeChatModel:
+    """
+    Local stand in for the OpenAI chat model: answers the extraction and explanation prompts with
+    plausible JSON after a configurable latency, and fails with a rate limit error at a configurable rate.
+    The answers only depend on the prompt and the seed, the failures and latencies on the seed and call order.
+    """
+
+    def __init__(
+        self,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        failure_rate: float = 0.0,
+        seed: int = 0,
+        relations_per_sentence: int = 1,
+        model_name: str = FAKE_MODEL_NAME,
+    ):
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.seed = seed
+        self.relations_per_sentence = relations_per_sentence
+        self.model_name = model_name
+        self.model_kwargs: Dict = {"response_format": {"type": "json_object"}}
+        self.calls: List[Dict] = []
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def _prompt_random(self, prompt: str) -> random.Random:
+        digest = hashlib.sha256(f"{self.seed}:{prompt}".encode("utf-8")).hexdigest()
+        return random.Random(int(digest[:16], 16))
+
+    def _extract(self, prompt: str) -> Dict:
+        rnd = self._prompt_random(prompt)
+        subject_match = SUBJECT_PATTERN.search(prompt)
+        # the multi-subject prompts focus on "subject_a, subject_b", every sentence goes to the subject it mentions
+        subjects = [s.strip() for s in subject_match.group(1).split(", ")] if subject_match else ["Someone"]
+        relation_types = sorted(set(RELATION_TYPES_PATTERN.findall(prompt.split("\n", 1)[0]))) or ["Related_To"]
+        input_text = INPUT_PATTERN.split(prompt)[-1]
+
+        relations = []
+        for sentence in SENTENCE_PATTERN.findall(input_text):
+            subject = next((s for s in subjects if s in sentence), subjects[0])
+            entities = [entity for entity in ENTITY_PATTERN.findall(sentence) if entity not in subject]
+            for _ in range(self.relations_per_sentence if entities else 0):
+                relations.append([subject, rnd.choice(relation_types), rnd.choice(entities)])
+        return {"relations": relations, "explanation": f"Relations of {', '.join(subjects)} found in the text"}
+
+    def _explain(self, match) -> Dict:
+        name, subject, object = match.groups()[-3:]
+        return {
+            "sentence": f"{subject} {name.replace('_', ' ').lower()} {object}.",
+            "explanation": f"The relation '{name}' holds because the sentence states it between {subject} and {object}",
+        }
+
+    def _generate(self, chat_messages: List[BaseMessage]) -> str:
+        prompt = "\n".join(message.content for message in chat_messages)
+        batch_matches = list(EXPLAIN_BATCH_PATTERN.finditer(prompt))
+        if batch_matches:
+            return json.dumps({"relations": [{"index": int(m.group(1)), **self._explain(m)} for m in batch_matches]})
+        explain_match = EXPLAIN_PATTERN.search(prompt)
+        response = self._explain(explain_match) if explain_match else self._extract(prompt)
+        return json.dumps(response)
+
+    def _next_call(self, chat_messages: List[BaseMessage]) -> float:
+        # the latency and failure of every call are drawn in call order
+        with self._lock:
+            latency = max(self.latency * (1 + self.jitter * (2 * self._random.random() - 1)), 0)
+            failed = self._random.random() < self.failure_rate
+            prompt_tokens = sum(count_tokens(message.content) for message in chat_messages)
+            self.calls.append({"prompt_tokens": prompt_tokens, "latency": latency, "failed": failed})
+        if failed:
+            raise FakeRateLimitError("Fake rate limit")
+        return latency
+
+    def invoke(self, chat_messages: List[BaseMessage]) -> FakeGeneration:
+        latency = self._next_call(chat_messages)
+        time.sleep(latency)
+        return FakeGeneration(self._generate(chat_messages))
+
+    async def ainvoke(self, chat_messages: List[BaseMessage]) -> FakeGeneration:
+        latency = self._next_call(chat_messages)
+        await asyncio.sleep(latency)
+        return FakeGeneration(self._generate(chat_messages))
@@ -0,0 +1,158 @@
+from typing import Any, Dict, Optional
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+CACHE_BASE_DIR = os.path.dirname(__file__)
+CACHE_FILE = os.path.join(CACHE_BASE_DIR, "../data/cache/llm_cache.sqlite")
+
+DEFAULT_MAX_ENTRIES = 100000
+# eviction is checked every so many writes, not on every single one
+EVICTION_INTERVAL = 100
+
+
+class LLMResponseCache:
+    """On-disk cache of LLM generations keyed by a hash of (model, rendered prompt, response format)."""
+
+    def __init__(
+        self,
+        location: str = CACHE_FILE,
+        max_entries: Optional[int] = DEFAULT_MAX_ENTRIES,
+        max_size_bytes: Optional[int] = None,
+        max_age: Optional[float] = None,
+        enabled: bool = True,
+    ):
+        self.location = location
+        self.max_entries = max_entries
+        self.max_size_bytes = max_size_bytes
+        self.max_age = max_age
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+        self._writes = 0
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+
+    @staticmethod
+    def make_key(model_name: str, prompt: str, response_format: Any = None) -> str:
+        payload = json.dumps([model_name, prompt, response_format], sort_keys=True)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            directory = os.path.dirname(self.location)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._conn = sqlite3.connect(self.location, check_same_thread=False, timeout=30)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, "
+                "created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed_at)")
+            self._conn.commit()
+        return self._conn
+
+    def get(self, key: str) -> Optional[str]:
+        if not self.enabled:
+            return None
+
+        with self._lock:
+            conn = self._connection()
+            row = conn.execute("SELECT value, created_at FROM responses WHERE key = ?", (key,)).fetchone()
+            now = time.time()
+            if row is not None and self.max_age is not None and now - row[1] > self.max_age:
+                conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                conn.commit()
+                row = None
+
+            if row is None:
+                self.misses += 1
+                return None
+
+            conn.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+            conn.commit()
+            self.hits += 1
+            return row[0]
+
+    def put(self, key: str, value: str):
+        if not self.enabled:
+            return
+
+        with self._lock:
+            conn = self._connection()
+            now = time.time()
+            conn.execute(
+                "INSERT OR REPLACE INTO responses (key, value, size, created_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                (key, value, len(value.encode("utf-8")), now, now),
+            )
+            conn.commit()
+            self._writes += 1
+            if self._writes % EVICTION_INTERVAL == 0:
+                self._evict(conn)
+
+    def delete(self, key: str):
+        if not self.enabled:
+            return
+        with self._lock:
+            conn = self._connection()
+            conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            conn.commit()
+
+    def evict(self):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._evict(self._connection())
+
+    def _evict(self, conn: sqlite3.Connection):
+        if self.max_age is not None:
+            conn.execute("DELETE FROM responses WHERE created_at < ?", (time.time() - self.max_age,))
+
+        if self.max_entries is not None:
+            # least recently used entries go first
+            conn.execute(
+                "DELETE FROM responses WHERE key IN ("
+                "SELECT key FROM responses ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+
+        if self.max_size_bytes is not None:
+            total_size = conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+            if total_size > self.max_size_bytes:
+                evicted_keys = []
+                for key, size in conn.execute("SELECT key, size FROM responses ORDER BY accessed_at"):
+                    if total_size <= self.max_size_bytes:
+                        break
+                    evicted_keys.append((key,))
+                    total_size -= size
+                conn.executemany("DELETE FROM responses WHERE key = ?", evicted_keys)
+
+        conn.commit()
+
+    def clear(self):
+        with self._lock:
+            conn = self._connection()
+            conn.execute("DELETE FROM responses")
+            conn.commit()
+
+    def stats(self) -> Dict:
+        entries, size = 0, 0
+        if self.enabled:
+            with self._lock:
+                entries, size = self._connection().execute(
+                    "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses"
+                ).fetchone()
+        return {"hits": self.hits, "misses": self.misses, "entries": entries, "size_bytes": size}
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
@@ -0,0 +1,87 @@
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+
+from relminer.domain import Relation
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_BASE_DIR = os.path.dirname(__file__)
+MANIFEST_FILE = os.path.join(MANIFEST_BASE_DIR, "../data/cache/manifest.sqlite")
+
+
+class ChunkManifest:
+    """
+    On-disk manifest of the chunks extracted from every document: the fingerprint of each chunk with
+    the relations extracted from it, so only the new or edited chunks of a document are extracted again.
+    """
+
+    def __init__(self, location: str = MANIFEST_FILE):
+        self.location = location
+        self.reused = 0
+        self.extracted = 0
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+
+    @staticmethod
+    def fingerprint(model_name: str, subject: str, relation_names: Iterable[str], chunk_text: str) -> str:
+        # a new relation type or another model changes the answer, the chunk is extracted again
+        payload = json.dumps([model_name, subject, sorted(relation_names), chunk_text])
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            directory = os.path.dirname(self.location)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._conn = sqlite3.connect(self.location, check_same_thread=False, timeout=30)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS chunks ("
+                "doc_id TEXT NOT NULL, position INTEGER NOT NULL, fingerprint TEXT NOT NULL, relations TEXT NOT NULL, "
+                "PRIMARY KEY (doc_id, position))"
+            )
+            self._conn.commit()
+        return self._conn
+
+    def load(self, doc_id: str) -> Dict[str, List[Relation]]:
+        """The relations of every chunk of the document last extracted, by chunk fingerprint."""
+        with self._lock:
+            rows = self._connection().execute(
+                "SELECT fingerprint, relations FROM chunks WHERE doc_id = ? ORDER BY position", (doc_id,)
+            ).fetchall()
+        return {fingerprint: [Relation(**record) for record in json.loads(relations)] for fingerprint, relations in rows}
+
+    def save(self, doc_id: str, chunks: Sequence[Tuple[str, List[Relation]]]):
+        # the chunks gone from the document are dropped with the previous version
+        rows = [
+            (doc_id, position, fingerprint, json.dumps([relation.to_dict() for relation in relations]))
+            for position, (fingerprint, relations) in enumerate(chunks)
+        ]
+        with self._lock:
+            conn = self._connection()
+            conn.execute("DELETE FROM chunks WHERE doc_id = ?", (doc_id,))
+            conn.executemany("INSERT INTO chunks (doc_id, position, fingerprint, relations) VALUES (?, ?, ?, ?)", rows)
+            conn.commit()
+
+    def delete(self, doc_id: str):
+        with self._lock:
+            conn = self._connection()
+            conn.execute("DELETE FROM chunks WHERE doc_id = ?", (doc_id,))
+            conn.commit()
+
+    def documents(self) -> List[str]:
+        with self._lock:
+            return [row[0] for row in self._connection().execute("SELECT DISTINCT doc_id FROM chunks ORDER BY doc_id")]
+
+    def stats(self) -> Dict:
+        return {"reused": self.reused, "extracted": self.extracted}
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
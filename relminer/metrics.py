@@ -0,0 +1,234 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple, TypeVar
+import functools
+import json
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# the labels of the current document, extraction... attached to every metric recorded under them
+_labels: ContextVar[Dict[str, str]] = ContextVar("relminer_metric_labels", default={})
+
+LabelKey = Tuple[Tuple[str, str], ...]
+F = TypeVar("F", bound=Callable)
+
+
+@contextmanager
+def metric_labels(**labels: str) -> Iterator[None]:
+    token = _labels.set({**_labels.get(), **labels})
+    try:
+        yield
+    finally:
+        _labels.reset(token)
+
+
+def timed(stage: str) -> Callable[[F], F]:
+    # times a method of an object holding its recorder in self.metrics
+    def decorator(method: F) -> F:
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            with self.metrics.timer(stage):
+                return method(self, *args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+class InMemorySink:
+    def __init__(self):
+        self.events: List[Dict] = []
+
+    def record(self, event: Dict):
+        self.events.append(event)
+
+
+class JSONLSink:
+    """Appends every metric event as a JSON line."""
+
+    def __init__(self, location: str):
+        self.location = location
+        self._lock = threading.Lock()
+        self._file = open(location, "a")
+
+    def record(self, event: Dict):
+        with self._lock:
+            self._file.write(json.dumps(event) + "\n")
+            self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+class PrometheusSink:
+    """
+    Aggregates the metrics in the Prometheus text format: stage timers as relminer_stage_seconds summaries
+    and counters as relminer_<name>_total. Only the given labels are kept, to bound the series cardinality.
+    """
+
+    def __init__(self, label_names: Sequence[str] = ()):
+        self.label_names = tuple(label_names)
+        self._lock = threading.Lock()
+        # (stage, labels) -> [count, sum]
+        self.timers: Dict[Tuple[str, LabelKey], List[float]] = {}
+        # (name, labels) -> value
+        self.counters: Dict[Tuple[str, LabelKey], float] = {}
+
+    def record(self, event: Dict):
+        labels = tuple((name, event["labels"][name]) for name in self.label_names if name in event["labels"])
+        with self._lock:
+            if event["type"] == "timer":
+                timer = self.timers.setdefault((event["name"], labels), [0, 0.0])
+                timer[0] += 1
+                timer[1] += event["value"]
+            else:
+                key = (event["name"], labels)
+                self.counters[key] = self.counters.get(key, 0) + event["value"]
+
+    @staticmethod
+    def _format_labels(labels: LabelKey) -> str:
+        if not labels:
+            return ""
+        return "{" + ",".join(f'{name}="{value}"' for name, value in labels) + "}"
+
+    def render(self) -> str:
+        lines = ["# TYPE relminer_stage_seconds summary"]
+        with self._lock:
+            for (stage, labels), (count, total) in sorted(self.timers.items()):
+                stage_labels = self._format_labels((("stage", stage),) + labels)
+                lines.append(f"relminer_stage_seconds_count{stage_labels} {count}")
+                lines.append(f"relminer_stage_seconds_sum{stage_labels} {total}")
+            for name in sorted(set(name for name, _ in self.counters)):
+                lines.append(f"# TYPE relminer_{name}_total counter")
+                for (counter, labels), value in sorted(self.counters.items()):
+                    if counter == name:
+                        lines.append(f"relminer_{name}_total{self._format_labels(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+    def serve(self, port: int, host: str = "") -> ThreadingHTTPServer:
+        # exposes the metrics to a Prometheus scraper from a background thread
+        sink = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = sink.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                logger.debug(format % args)
+
+        server = ThreadingHTTPServer((host, port), MetricsHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
+
+
+class MetricsRecorder:
+    """
+    Records stage durations and counters (tokens, retries, cache hits...), aggregates them in memory
+    for the run summary and forwards every event, with the current labels, to the sinks.
+    """
+
+    def __init__(self, sinks: Optional[List] = None):
+        self.sinks = list(sinks or [])
+        self._lock = threading.Lock()
+        # (name, labels) -> [count, sum, max]
+        self.timers: Dict[Tuple[str, LabelKey], List[float]] = {}
+        # (name, labels) -> value
+        self.counters: Dict[Tuple[str, LabelKey], float] = {}
+
+    def add_sink(self, sink):
+        self.sinks.append(sink)
+
+    def _emit(self, event_type: str, name: str, value: float):
+        labels = _labels.get()
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            if event_type == "timer":
+                timer = self.timers.setdefault(key, [0, 0.0, 0.0])
+                timer[0] += 1
+                timer[1] += value
+                timer[2] = max(timer[2], value)
+            else:
+                self.counters[key] = self.counters.get(key, 0) + value
+
+        if self.sinks:
+            event = {"type": event_type, "name": name, "value": value, "labels": labels, "time": time.time()}
+            for sink in self.sinks:
+                sink.record(event)
+
+    def observe(self, stage: str, seconds: float):
+        self._emit("timer", stage, seconds)
+
+    def increment(self, name: str, value: float = 1):
+        if value:
+            self._emit("counter", name, value)
+
+    @contextmanager
+    def timer(self, stage: str) -> Iterator[None]:
+        started_at = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - started_at)
+
+    def reset(self):
+        with self._lock:
+            self.timers.clear()
+            self.counters.clear()
+
+    def summary(self, group_by: Optional[str] = None) -> Dict:
+        """Totals per stage and counter, or per value of the group_by label, ex: group_by="subject"."""
+        groups: Dict[Optional[str], Dict] = {}
+
+        def group(labels: LabelKey) -> Dict:
+            value = dict(labels).get(group_by) if group_by else None
+            return groups.setdefault(value, {"stages": {}, "counters": {}})
+
+        with self._lock:
+            for (name, labels), (count, total, longest) in self.timers.items():
+                stage = group(labels)["stages"].setdefault(name, {"count": 0, "seconds": 0.0, "max": 0.0})
+                stage["count"] += count
+                stage["seconds"] += total
+                stage["max"] = max(stage["max"], longest)
+            for (name, labels), value in self.counters.items():
+                counters = group(labels)["counters"]
+                counters[name] = counters.get(name, 0) + value
+
+        if group_by is None:
+            return groups.get(None, {"stages": {}, "counters": {}})
+        return groups
+
+    def format_summary(self) -> str:
+        summary = self.summary()
+        total = sum(stage["seconds"] for stage in summary["stages"].values())
+        lines = [f"{'stage':<20}{'count':>8}{'seconds':>10}{'mean ms':>10}{'max ms':>10}{'share':>8}"]
+        for name, stage in sorted(summary["stages"].items(), key=lambda item: -item[1]["seconds"]):
+            lines.append(
+                f"{name:<20}{stage['count']:>8}{stage['seconds']:>10.3f}"
+                f"{stage['seconds'] / stage['count'] * 1000:>10.1f}{stage['max'] * 1000:>10.1f}"
+                f"{stage['seconds'] / total if total else 0:>8.1%}"
+            )
+        for name, value in sorted(summary["counters"].items()):
+            lines.append(f"{name:<20}{value:>8g}")
+        return "\n".join(lines)
+
+
+_default_metrics: Optional[MetricsRecorder] = None
+_default_metrics_lock = threading.Lock()
+
+
+def get_default_metrics() -> MetricsRecorder:
+    # one recorder shared by the miners and stores of the process
+    global _default_metrics
+    with _default_metrics_lock:
+        if _default_metrics is None:
+            _default_metrics = MetricsRecorder()
+        return _default_metrics
@@ -0,0 +1,88 @@
+from typing import Dict, Iterable, List, Optional, Tuple
+import json
+import re
+import unicodedata
+
+from relminer.domain import Relation
+
+WORD_PATTERN = re.compile(r"\w+")
+
+
+def normalize_text(text: str) -> str:
+    # case, accents forms, punctuation and whitespace insensitive form of an entity, ex: " Boston,  MA" -> "boston ma"
+    return " ".join(WORD_PATTERN.findall(unicodedata.normalize("NFKC", text).casefold()))
+
+
+class EntityNormalizer:
+    """
+    Maps the surface forms of an entity to a canonical name: first through the alias table, then to the
+    known entity (ex: the extracted subjects) the text names or partially mentions, ex: "Jobs" -> "Steve Jobs".
+    """
+
+    def __init__(self, aliases: Optional[Dict[str, str]] = None, entities: Iterable[str] = ()):
+        # normalized alias -> canonical name
+        self.aliases: Dict[str, str] = {normalize_text(alias): name for alias, name in (aliases or {}).items()}
+        # normalized entity -> canonical name
+        self.entities: Dict[str, str] = {}
+        for entity in entities:
+            self.entities.setdefault(normalize_text(entity), entity)
+
+    @classmethod
+    def from_file(cls, location: str, entities: Iterable[str] = ()) -> "EntityNormalizer":
+        # a JSON object of alias -> canonical name, ex: {"Boston, MA": "Boston"}
+        with open(location) as f:
+            return cls(json.load(f), entities)
+
+    def with_entities(self, entities: Iterable[str]) -> "EntityNormalizer":
+        return EntityNormalizer(self.aliases, entities)
+
+    def canonical(self, text: str) -> Optional[str]:
+        key = normalize_text(text)
+        if key in self.aliases:
+            return self.aliases[key]
+        if key in self.entities:
+            return self.entities[key]
+
+        # a partial mention of a single known entity
+        words = set(key.split())
+        matches = [name for entity, name in self.entities.items() if words and words <= set(entity.split())]
+        return matches[0] if len(matches) == 1 else None
+
+    def key(self, text: str) -> str:
+        canonical = self.canonical(text)
+        return normalize_text(canonical if canonical is not None else text)
+
+
+def merge_relations(relations: Iterable[Relation], normalizer: Optional[EntityNormalizer] = None) -> List[Relation]:
+    """
+    Merges in one pass the relations naming the same entities, keyed by the normalized subject, name and object.
+    The first relation of every key is kept, with the canonical names and the chunks of all its duplicates,
+    so the same extraction always merges the same way.
+    """
+    normalizer = normalizer or EntityNormalizer()
+    merged: Dict[Tuple[str, str, str], Relation] = {}
+    # text -> merge key, the same texts repeat across chunks
+    keys: Dict[str, str] = {}
+
+    def canonical_key(text: str) -> str:
+        if text not in keys:
+            keys[text] = normalizer.key(text)
+        return keys[text]
+
+    for relation in relations:
+        key = (canonical_key(relation.subject), relation.name.lower(), canonical_key(relation.object))
+        first = merged.get(key)
+        if first is None:
+            merged[key] = Relation(
+                normalizer.canonical(relation.subject) or relation.subject.strip(),
+                relation.name,
+                normalizer.canonical(relation.object) or relation.object.strip(),
+                relation.description,
+                relation.sentence,
+                relation.explanation,
+                provenance=list(relation.provenance),
+            )
+            continue
+        first.provenance = sorted(set(first.provenance).union(relation.provenance))
+
+    return list(merged.values())
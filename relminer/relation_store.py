@@ -1,7 +1,15 @@
 import fastavro
+import io
+import json
+import logging
+import mmap
 import os
-from typing import List
-from relminer.domain import Relation
+import shutil
+from typing import Dict, List, Optional, Set, Tuple
+from relminer.domain import Relation, RelationBatch
+from relminer.metrics import MetricsRecorder, get_default_metrics, timed
+
+logger = logging.getLogger(__name__)
 
 RELATIONS_BASE_DIR = os.path.dirname(__file__)
 RELATION_FILE = os.path.join(RELATIONS_BASE_DIR, "../data/relations/ootb_relations.avro")
@@ -19,23 +27,247 @@ relation_schema_def = {
     ],
 }
 
+INDEX_SUFFIX = ".idx"
+# compacted stores are written in blocks of about this many bytes
+COMPACT_BLOCK_SIZE = 64 * 1024
+INDEXED_FIELDS = ("name", "subject", "object")
+SYNC_SIZE = 16
+
+
+def relation_key(relation: Relation) -> Tuple[str, str, str]:
+    return (relation.subject, relation.name, relation.object)
+
+
 class FastRelationStore:
-    def __init__(self):
+    def __init__(self, relation_file: str = RELATION_FILE, metrics: Optional[MetricsRecorder] = None):
+        self.relation_file = relation_file
+        self.metrics: MetricsRecorder = metrics or get_default_metrics()
         self.relation_schema = fastavro.parse_schema(relation_schema_def)
         self.relations = []
+        # the relation names with the store version they were read at
+        self._relation_names: Optional[Tuple[Optional[Tuple[int, int]], Set[str]]] = None
+
+    @timed("store_write")
+    def add_relations(self, relations: List[Relation], append: bool = True, dedupe: bool = True) -> int:
+        existing = append and os.path.exists(self.relation_file)
 
-    def add_relations(self, relations: List[Relation], append: bool = True):
-        records = [relation.to_dict() for relation in relations]
-        mode = "a+b" if append else "w+b"
-        with open(RELATION_FILE, mode) as f:
+        # relations are identified by their (subject, name, object) triplet
+        seen_keys = self.relation_keys() if existing and dedupe else set()
+        records = []
+        for relation in relations:
+            key = relation_key(relation)
+            if dedupe and key in seen_keys:
+                continue
+            seen_keys.add(key)
+            records.append(relation.to_dict())
+
+        if existing and not records:
+            return 0
+
+        # all the records go in one pass to a temporary copy which replaces the store atomically,
+        # appending to a copy keeps the existing blocks and only adds new ones after them
+        tmp_file = self.relation_file + ".tmp"
+        if existing:
+            shutil.copyfile(self.relation_file, tmp_file)
+        with open(tmp_file, "a+b" if existing else "w+b") as f:
             fastavro.writer(f, self.relation_schema, records)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_file, self.relation_file)
+
+        logger.info(f"Added {len(records)} relations to {self.relation_file}")
+        self.metrics.increment("relations_written", len(records))
+        return len(records)
+
+    def compact(self, codec: str = "null", block_size: int = COMPACT_BLOCK_SIZE) -> Dict:
+        relations = self.load_relations()
+        before_size = os.path.getsize(self.relation_file) if os.path.exists(self.relation_file) else 0
+
+        unique_relations = {}
+        for relation in relations:
+            unique_relations.setdefault(relation_key(relation), relation)
+        records = [relation.to_dict() for relation in unique_relations.values()]
+
+        tmp_file = self.relation_file + ".tmp"
+        with open(tmp_file, "w+b") as f:
+            fastavro.writer(f, self.relation_schema, records, codec=codec, sync_interval=block_size)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_file, self.relation_file)
 
+        stats = {
+            "relations": len(relations),
+            "duplicates": len(relations) - len(records),
+            "size_before": before_size,
+            "size_after": os.path.getsize(self.relation_file),
+        }
+        logger.info(f"Compacted {self.relation_file} {stats}")
+        return stats
+
+    def relation_keys(self) -> Set[Tuple[str, str, str]]:
+        return set([relation_key(relation) for relation in self.load_relations()])
+
+    @timed("store_load")
     def load_relations(self) -> List[Relation]:
-        if not os.path.exists(RELATION_FILE):
+        if not os.path.exists(self.relation_file):
             return []
 
-        with open(RELATION_FILE, "rb") as f:
+        with open(self.relation_file, "rb") as f:
             reader = fastavro.reader(f)
             self.relations = [Relation(**relation) for relation in reader]
 
-        return self.relations
\ No newline at end of file
+        return self.relations
+
+    @timed("store_load")
+    def load_batch(self) -> RelationBatch:
+        # the records go straight into the columns, without building a Relation per record
+        if not os.path.exists(self.relation_file):
+            return RelationBatch()
+
+        with open(self.relation_file, "rb") as f:
+            return RelationBatch.from_avro(f)
+
+    def relation_names(self) -> Set[str]:
+        # every prompt lists the relation names, the store is only decoded again once it changed
+        version = self.version()
+        if self._relation_names is None or self._relation_names[0] != version:
+            self._relation_names = (version, set(self.load_batch().column("name")))
+        return set(self._relation_names[1])
+
+    def version(self) -> Optional[Tuple[int, int]]:
+        # changes whenever the store file is written
+        if not os.path.exists(self.relation_file):
+            return None
+        stat = os.stat(self.relation_file)
+        return (stat.st_size, stat.st_mtime_ns)
+
+
+class IndexedRelationStore(FastRelationStore):
+    """
+    Relation store backed by a persistent secondary index (by name, subject and object)
+    kept next to the Avro file. Records are decoded on demand from a memory map of the
+    file, so the lookups never deserialize the whole store.
+    """
+
+    def __init__(self, relation_file: str = RELATION_FILE, metrics: Optional[MetricsRecorder] = None):
+        super().__init__(relation_file, metrics)
+        self.index_file = relation_file + INDEX_SUFFIX
+        self.index: Dict = self._empty_index()
+        self._index_loaded = False
+
+    @staticmethod
+    def _empty_index() -> Dict:
+        index = {"file_size": 0, "file_mtime_ns": 0, "sync": "", "offsets": []}
+        for field in INDEXED_FIELDS:
+            index[field] = {}
+        return index
+
+    def _ensure_index(self) -> Dict:
+        if not os.path.exists(self.relation_file):
+            self.index = self._empty_index()
+            return self.index
+
+        if not self._index_loaded and os.path.exists(self.index_file):
+            with open(self.index_file) as f:
+                self.index = json.load(f)
+        self._index_loaded = True
+
+        stat = os.stat(self.relation_file)
+        if stat.st_size == self.index["file_size"] and stat.st_mtime_ns == self.index["file_mtime_ns"]:
+            return self.index
+
+        with open(self.relation_file, "rb") as f:
+            f.seek(stat.st_size - SYNC_SIZE)
+            sync = f.read(SYNC_SIZE).hex()
+
+        # an appended file keeps its sync marker, only the new blocks need to be indexed
+        if sync != self.index["sync"] or stat.st_size < self.index["file_size"]:
+            self.index = self._empty_index()
+        self._index_blocks(self.index["file_size"])
+
+        self.index.update({"file_size": stat.st_size, "file_mtime_ns": stat.st_mtime_ns, "sync": sync})
+        self._save_index()
+        return self.index
+
+    def _index_blocks(self, from_offset: int):
+        offsets = self.index["offsets"]
+        with open(self.relation_file, "rb") as f:
+            for block in fastavro.block_reader(f):
+                if block.offset < from_offset:
+                    continue
+                if block.codec != "null":
+                    raise ValueError(f"{self.relation_file} uses the {block.codec} codec, the index needs uncompressed blocks")
+
+                # the block is: record count, data size, records data, sync marker
+                data = block.bytes_
+                data_size = data.getbuffer().nbytes
+                data_start = block.offset + block.size - SYNC_SIZE - data_size
+                for _ in range(block.num_records):
+                    start = data.tell()
+                    record = fastavro.schemaless_reader(data, block.writer_schema)
+                    record_id = len(offsets)
+                    offsets.append([data_start + start, data.tell() - start])
+                    for field in INDEXED_FIELDS:
+                        self.index[field].setdefault(record[field], []).append(record_id)
+
+        logger.info(f"Indexed {len(offsets)} relations of {self.relation_file}")
+
+    def _save_index(self):
+        tmp_file = self.index_file + ".tmp"
+        with open(tmp_file, "w") as f:
+            json.dump(self.index, f)
+        os.replace(tmp_file, self.index_file)
+
+    @timed("store_read")
+    def _read_records(self, record_ids: List[int]) -> List[Relation]:
+        if not record_ids:
+            return []
+
+        offsets = self.index["offsets"]
+        with open(self.relation_file, "rb") as f:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                relations = []
+                for record_id in record_ids:
+                    start, size = offsets[record_id]
+                    record = fastavro.schemaless_reader(io.BytesIO(mm[start:start + size]), self.relation_schema)
+                    relations.append(Relation(**record))
+        return relations
+
+    def __len__(self) -> int:
+        return len(self._ensure_index()["offsets"])
+
+    def load_relations(self) -> List[Relation]:
+        self.relations = self._read_records(list(range(len(self))))
+        return self.relations
+
+    def relation_names(self) -> Set[str]:
+        return set(self._ensure_index()["name"])
+
+    def relation_keys(self) -> Set[Tuple[str, str, str]]:
+        # the triplets are rebuilt from the index without decoding any record
+        index = self._ensure_index()
+        fields = {}
+        for field in INDEXED_FIELDS:
+            values = [None] * len(index["offsets"])
+            for value, record_ids in index[field].items():
+                for record_id in record_ids:
+                    values[record_id] = value
+            fields[field] = values
+        return set(zip(fields["subject"], fields["name"], fields["object"]))
+
+    def subjects(self) -> Set[str]:
+        return set(self._ensure_index()["subject"])
+
+    def get_relations(self, field: str, value: str) -> List[Relation]:
+        if field not in INDEXED_FIELDS:
+            raise ValueError(f"{field} is not indexed, use one of {INDEXED_FIELDS}")
+        return self._read_records(self._ensure_index()[field].get(value, []))
+
+    def get_by_name(self, name: str) -> List[Relation]:
+        return self.get_relations("name", name)
+
+    def get_by_subject(self, subject: str) -> List[Relation]:
+        return self.get_relations("subject", subject)
+
+    def get_by_object(self, object: str) -> List[Relation]:
+        return self.get_relations("object", object)
\ No newline at end of file
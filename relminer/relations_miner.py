@@ -1,30 +1,54 @@
-from typing import List, Dict
+from typing import TYPE_CHECKING, Any, AsyncIterator, Callable, Deque, Iterable, Iterator, List, Dict, NamedTuple, Optional, Set, TextIO, Tuple, Union
+from collections import deque
+import asyncio
 import logging
-from langchain.chat_models import ChatOpenAI
 
-import langchain.chat_models as lcmodels
 from langchain.output_parsers import PydanticOutputParser
+from langchain.schema import OutputParserException
 from langchain.pydantic_v1 import BaseModel, Field
-from langchain.schema import HumanMessage
+from langchain.schema import HumanMessage, BaseMessage
 from langchain.prompts import PromptTemplate
+from langchain.prompts.few_shot import FewShotPromptTemplate
 
+from relminer.chunking import DEFAULT_BOUNDARY_SENTENCES, Chunk, ChunkPlan, TokenChunker, iter_text_blocks, make_token_counter
+from relminer.example_selector import BM25ExampleSelector
+from relminer.llm_cache import LLMResponseCache
+from relminer.manifest import ChunkManifest
+from relminer.metrics import MetricsRecorder, get_default_metrics, timed
 from relminer.relation_store import FastRelationStore
+from relminer.scheduler import LLMScheduler, PRIORITY_INTERACTIVE, get_default_scheduler
+from relminer.compare import RelationComparator
+from relminer.normalize import EntityNormalizer, merge_relations
 from relminer.domain import Relation
 from relminer.relations_miner_utils import (
+    attribute_relations,
     make_prompt,
     process_result_triplets,
     build_few_shot_prompt,
-    get_template
+    estimate_tokens,
+    get_prompt_template,
+    FEW_SHOT_EXAMPLE_TEMPLATE,
 )
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from ratelimiter import RateLimiter
 import json
 
+if TYPE_CHECKING:
+    # importing the chat models takes most of the import time, they are only imported to build the client
+    from langchain.chat_models import ChatOpenAI
+
 logger = logging.getLogger(__name__)
 
 EXPLAIN_RELATION_TEMPLATE = "explain_relation.txt"
+EXPLAIN_RELATIONS_BATCH_TEMPLATE = "explain_relations_batch.txt"
 EXTRACT_RELATIONS = "extract_relations.txt"
 MODEL_NAME = "gpt-3.5-turbo-1106"
+CHAT_MODEL_KWARGS = {"response_format": {"type": "json_object"}}
+DEFAULT_MAX_CONCURRENCY = 8
+DEFAULT_FEW_SHOT_K = 10
+DEFAULT_FEW_SHOT_MAX_TOKENS = 1500
+# relation types explained per LLM call when registering many of them
+DEFAULT_EXPLAIN_BATCH_SIZE = 20
+# the errors of a generation that is not valid JSON or does not match the expected model
+PARSE_ERRORS = (OutputParserException, ValueError)
 
 class RelationTriplets(BaseModel):
     relations: List[List[str]] = Field(
@@ -43,58 +67,131 @@ class RelationInfo(BaseModel):
         description="The generated explanation for the given relationship"
     )
 
+class IndexedRelationInfo(BaseModel):
+    index: int = Field(description="The index of the relation type")
+    sentence: str = Field(description="The generated sentence for the given relationship")
+    explanation: str = Field(description="The generated explanation for the given relationship")
+
+
+class RelationInfoBatch(BaseModel):
+    relations: List[IndexedRelationInfo] = Field(
+        description="The generated sentence and explanation of every relation type"
+    )
+
+class ChunkRelations(NamedTuple):
+    chunk: Chunk
+    relations: List[Relation]
+
+
+# a whole text, a text file or the text blocks as they arrive
+TextSource = Union[str, TextIO, Iterable[str]]
+
+
+def iter_source_blocks(source: TextSource) -> Iterable[str]:
+    if isinstance(source, str):
+        return [source]
+    if hasattr(source, "read"):
+        return iter_text_blocks(source)
+    return source
+
+
 class RelationsMiner:
-    def __init__(self, relation_store: FastRelationStore):
+    def __init__(
+        self,
+        relation_store: FastRelationStore,
+        max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+        scheduler: Optional[LLMScheduler] = None,
+        priority: int = PRIORITY_INTERACTIVE,
+        llm_cache: Optional[LLMResponseCache] = None,
+        few_shot_k: Optional[int] = DEFAULT_FEW_SHOT_K,
+        few_shot_max_tokens: Optional[int] = DEFAULT_FEW_SHOT_MAX_TOKENS,
+        chunker: Optional[TokenChunker] = None,
+        entity_normalizer: Optional[EntityNormalizer] = None,
+        chat_llm: Optional["ChatOpenAI"] = None,
+        metrics: Optional[MetricsRecorder] = None,
+        manifest: Optional[ChunkManifest] = None,
+    ):
         self.relation_store: FastRelationStore = relation_store
-        self.llm: ChatOpenAI = ChatOpenAI(model_name=MODEL_NAME)
-        self.chat_llm: lcmodels.ChatOpenAI = lcmodels.ChatOpenAI(
-            model_name=MODEL_NAME,
-            model_kwargs={"response_format": {"type": "json_object"}},
-        )
-        self.text_splitter: RecursiveCharacterTextSplitter = RecursiveCharacterTextSplitter(
-            chunk_size=500,
-            chunk_overlap=0,
-            length_function=len,
-            is_separator_regex=False,
+        self.llm_cache: Optional[LLMResponseCache] = llm_cache
+        # with few_shot_k=None every stored relation is sent as a few shot example
+        self.few_shot_k: Optional[int] = few_shot_k
+        self.few_shot_max_tokens: Optional[int] = few_shot_max_tokens
+        # the few shot prompt is rebuilt only when the relation store changes
+        self._few_shot_context: Optional[Tuple[FewShotPromptTemplate, Set[str]]] = None
+        self._few_shot_context_version = None
+        self._explain_prompt_template: Optional[PromptTemplate] = None
+        self.max_concurrency: int = max_concurrency
+        # every LLM call goes through the scheduler, shared by all the miners of the process by default
+        self.scheduler: LLMScheduler = scheduler or get_default_scheduler()
+        self.priority: int = priority
+        # stage durations, tokens, retries and cache hits of every extraction
+        self.metrics: MetricsRecorder = metrics or get_default_metrics()
+        # any chat model with invoke/ainvoke can be given instead, ex: the offline FakeChatModel,
+        # the OpenAI client is only built by the first call reaching the model
+        self._chat_llm: Optional["ChatOpenAI"] = chat_llm
+        # chunks are measured in model tokens, leaving room for the rendered prompt, with a manifest they are
+        # also cut on content defined boundaries so the chunks of an edited document realign with the stored ones
+        self.chunker: TokenChunker = chunker or TokenChunker(
+            token_counter=make_token_counter(MODEL_NAME),
+            boundary_every=DEFAULT_BOUNDARY_SENTENCES if manifest is not None else None,
         )
         self.rel_triplets_parser: PydanticOutputParser = PydanticOutputParser(pydantic_object=RelationTriplets)
         self.rel_info_parser: PydanticOutputParser = PydanticOutputParser(pydantic_object=RelationInfo)
+        self.rel_info_batch_parser: PydanticOutputParser = PydanticOutputParser(pydantic_object=RelationInfoBatch)
+        self._explain_batch_prompt_template: Optional[PromptTemplate] = None
+        # the extracted relations are merged on their canonical subject and object
+        self.entity_normalizer: EntityNormalizer = entity_normalizer or EntityNormalizer()
+        # the extractions given a doc_id only send the chunks missing from the manifest to the model
+        self.manifest: Optional[ChunkManifest] = manifest
+
+    @property
+    def chat_llm(self) -> "ChatOpenAI":
+        if self._chat_llm is None:
+            from langchain.chat_models import ChatOpenAI
+
+            # the scheduler meters and retries every call, langchain's own retries would send unmetered requests
+            self._chat_llm = ChatOpenAI(model_name=MODEL_NAME, model_kwargs=CHAT_MODEL_KWARGS, max_retries=0)
+        return self._chat_llm
+
+    @chat_llm.setter
+    def chat_llm(self, chat_llm: "ChatOpenAI"):
+        self._chat_llm = chat_llm
+
+    @timed("merge")
+    def merge_relations(self, relations: List[Relation], subjects: List[str]) -> List[Relation]:
+        merged = merge_relations(relations, self.entity_normalizer.with_entities(subjects))
+        logger.info(f"Merged {len(relations)} extracted relations into {len(merged)}")
+        return merged
+
+    def _make_simple_prompt_template(self, subject: str) -> Tuple[PromptTemplate, int]:
+        # getting the list of unique relations
+        relation_types = self.relation_store.relation_names()
 
-    @RateLimiter(max_calls=100, period=60)
-    def extract_relations_simple(self, subject: str, input_text: str) -> List[Relation]:
-        template = get_template(EXTRACT_RELATIONS)
-
-        prompt_template = PromptTemplate(
-            template=template, 
-            input_variables=["relation_types", "subject", "input_text"]
+        prompt_template = get_prompt_template(EXTRACT_RELATIONS).partial(
+            relation_types=str(sorted(relation_types)), subject=subject
         )
 
-        relations = self.relation_store.load_relations()
+        prompt_tokens = self.chunker.token_counter(prompt_template.format(input_text=""))
+        return prompt_template, prompt_tokens
 
-        # getting the list of unique relations
-        relation_types = set([relation.name for relation in relations])
-
-        chunked_text = self.text_splitter.create_documents([input_text])
+    def _make_simple_prompts(self, subject: str, input_text: str) -> List[List[BaseMessage]]:
+        prompt_template, prompt_tokens = self._make_simple_prompt_template(subject)
 
-        results, num_chunks = [], len(chunked_text)
-        for i, chunked_input_text in enumerate(chunked_text):
-            context = {
-                "relation_types": relation_types,
-                "subject": subject,
-                "input_text": chunked_input_text.page_content
-            }
+        prompts = []
+        for chunk in self._split_text(input_text, prompt_tokens):
+            with self.metrics.timer("prompt_build"):
+                prompt = prompt_template.format(input_text=chunk.text)
+            prompts.append([HumanMessage(content=prompt)])
+        return prompts
 
-            prompt = prompt_template.format(**context)
+    def extract_relations_simple(self, subject: str, input_text: str) -> List[Relation]:
+        prompts = self._make_simple_prompts(subject, input_text)
 
-            chat_messages = [HumanMessage(content=prompt)]
+        results, num_chunks = [], len(prompts)
+        for i, chat_messages in enumerate(prompts):
             logger.debug(f"Chat message prompt \n\n{chat_messages}")
 
-            chat_generations = self.chat_llm.invoke(chat_messages)
-
-            logger.debug(f"Generations \n\n[[{chat_generations.content}]]")
-
-            extracted_triples = json.loads(chat_generations.content)
-            results.extend(process_result_triplets(extracted_triples))
+            results.extend(self._invoke(chat_messages, parse=lambda content: self._parse_simple_triplets(content, i)))
 
             if i % 10 == 0:
                 logger.info(
@@ -103,40 +200,125 @@ class RelationsMiner:
 
         logger.info(f"Processed all chunks. Detected {len(results)} relations")
 
-        return results
+        return self.merge_relations(results, [subject])
 
+    async def aextract_relations_simple(
+        self, subject: str, input_text: str, max_concurrency: Optional[int] = None
+    ) -> List[Relation]:
+        prompts = self._make_simple_prompts(subject, input_text)
 
-    @RateLimiter(max_calls=100, period=60)
-    def register_relation(self, relation: Relation):
-        template = get_template(EXPLAIN_RELATION_TEMPLATE)
+        generations = await self._ainvoke_all(prompts, max_concurrency, self._parse_simple_triplets)
 
-        format_instructions = self.rel_info_parser.get_format_instructions()
-        prompt_template = PromptTemplate(
-            template=template, 
-            input_variables=["subject", "name", "object", "description"], 
-            partial_variables={"format_instructions": format_instructions}
-        )
+        results = [relation for relations in generations for relation in relations]
+
+        logger.info(f"Processed all chunks. Detected {len(results)} relations")
+
+        return self.merge_relations(results, [subject])
+
+
+    def explain_relation(self, relation: Relation) -> Relation:
+        if self._explain_prompt_template is None:
+            format_instructions = self.rel_info_parser.get_format_instructions()
+            self._explain_prompt_template = get_prompt_template(EXPLAIN_RELATION_TEMPLATE).partial(
+                format_instructions=format_instructions
+            )
 
         context = relation.to_dict(exclude=["explanation", "sentence"])
-        prompt = prompt_template.format(**context)
+        prompt = self._explain_prompt_template.format(**context)
 
         chat_messages = [HumanMessage(content=prompt)]
-        chat_generations = self.chat_llm.invoke(chat_messages)
-
-        relation_info = self.rel_info_parser.parse(chat_generations.content)
+        relation_info = self._invoke(chat_messages, parse=self.rel_info_parser.parse)
 
         relation.sentence = relation_info.sentence
         relation.explanation = relation_info.explanation
+        return relation
+
+    def register_relation(self, relation: Relation):
+        self.explain_relation(relation)
 
         logger.info(f"Adding relation \n{relation}")
         self.relation_store.add_relations([relation])
 
-    def register_relations(self, relations: List[Relation]):
-        for relation in relations:
-            self.register_relation(relation)
+    def _explain_batch(self, relations: List[Relation]) -> List[Relation]:
+        # returns the relations the answer did not explain properly
+        if self._explain_batch_prompt_template is None:
+            format_instructions = self.rel_info_batch_parser.get_format_instructions()
+            self._explain_batch_prompt_template = get_prompt_template(EXPLAIN_RELATIONS_BATCH_TEMPLATE).partial(
+                format_instructions=format_instructions
+            )
+
+        with self.metrics.timer("prompt_build"):
+            items = "\n".join(
+                f'{i}. relation type "{relation.name}" which means "{relation.description}", '
+                f'with the subject "{relation.subject}" and object "{relation.object}"'
+                for i, relation in enumerate(relations)
+            )
+            prompt = self._explain_batch_prompt_template.format(relations=items)
+
+        try:
+            relation_infos = self._invoke([HumanMessage(content=prompt)], parse=self.rel_info_batch_parser.parse).relations
+        except OutputParserException as error:
+            logger.warning(f"Invalid batch explanation, explaining the {len(relations)} relations one by one: {error}")
+            return relations
+
+        explained = set()
+        for info in relation_infos:
+            # an item out of range, repeated or empty is explained again on its own
+            if not 0 <= info.index < len(relations) or info.index in explained:
+                continue
+            if not info.sentence.strip() or not info.explanation.strip():
+                continue
+            relations[info.index].sentence = info.sentence
+            relations[info.index].explanation = info.explanation
+            explained.add(info.index)
+        return [relation for i, relation in enumerate(relations) if i not in explained]
+
+    def explain_relations(self, relations: List[Relation], batch_size: int = DEFAULT_EXPLAIN_BATCH_SIZE) -> List[Relation]:
+        """Explains the relations batch_size at a time, with one call per relation only for the items a batch failed."""
+        failed = []
+        for start in range(0, len(relations), batch_size):
+            failed.extend(self._explain_batch(relations[start:start + batch_size]))
+
+        if failed:
+            logger.info(f"Explaining {len(failed)} of {len(relations)} relations one by one")
+            self.metrics.increment("explain_fallbacks", len(failed))
+        for relation in failed:
+            self.explain_relation(relation)
+        return relations
+
+    def register_relations(self, relations: List[Relation], batch_size: int = DEFAULT_EXPLAIN_BATCH_SIZE):
+        # explaining every relation first so the store is written once
+        explained = self.explain_relations(relations, batch_size)
+
+        logger.info(f"Adding {len(explained)} relations")
+        self.relation_store.add_relations(explained)
+
+    def _split_text(self, input_text: str, prompt_tokens: int = 0) -> List[Chunk]:
+        return self.chunker.split(input_text, prompt_tokens)
+
+    def _few_shot_prompt_tokens(
+        self, subject: str, few_shot_context: Tuple[FewShotPromptTemplate, Set[str]]
+    ) -> int:
+        # the prompt rendered without input text is the overhead paid by every chunk
+        few_shot_prompt, relation_names = few_shot_context
+        return estimate_tokens(
+            make_prompt(few_shot_prompt, relation_names, subject, ""), self.chunker.token_counter
+        )
+
+    def plan_extraction(self, subject: str, input_text: str, simple: bool = False) -> ChunkPlan:
+        # reports the chunks and tokens of an extraction before any LLM call is made
+        if simple:
+            _, prompt_tokens = self._make_simple_prompt_template(subject)
+        else:
+            prompt_tokens = self._few_shot_prompt_tokens(subject, self.build_few_shot_context())
+        return self.chunker.plan(input_text, prompt_tokens)
+
+    @timed("few_shot_context")
+    def build_few_shot_context(self) -> Tuple[FewShotPromptTemplate, Set[str]]:
+        version = self.relation_store.version()
+        if self._few_shot_context is not None and self._few_shot_context_version == version:
+            return self._few_shot_context
 
-    @RateLimiter(max_calls=100, period=60)
-    def extract_relations(self, subject: str, input_text: str) -> List[Relation]:
         # loading the existing relations to use them for few shot learning
         relations = self.relation_store.load_relations()
 
@@ -144,25 +326,115 @@ class RelationsMiner:
         relation_names = set([relation.name for relation in relations])
 
         # building the few shot prompt with the existing relations as examples
-        few_shot_prompt = build_few_shot_prompt(relations, self.rel_triplets_parser)
+        few_shot_prompt = build_few_shot_prompt(
+            relations, self.rel_triplets_parser, self._make_example_selector(relations)
+        )
 
-        # chunking the description into smaller pieces yields more extracted relations
-        chunked_text = self.text_splitter.create_documents([input_text])
+        self._few_shot_context, self._few_shot_context_version = (few_shot_prompt, relation_names), version
+        return self._few_shot_context
 
-        results, num_chunks = [], len(chunked_text)
-        for i, chunked_description in enumerate(chunked_text):
-            chat_messages = make_prompt(
-                few_shot_prompt, relation_names, subject, chunked_description.page_content
-            )
-            logger.debug(f"Chat message prompt \n\n{chat_messages}")
+    def _make_example_selector(self, relations: List[Relation]) -> Optional[BM25ExampleSelector]:
+        if self.few_shot_k is None:
+            return None
 
-            chat_generations = self.chat_llm.invoke(chat_messages)
-            logger.info(f"Generations [[\n\n{chat_generations}]]")
+        return BM25ExampleSelector.from_relations(
+            relations,
+            k=self.few_shot_k,
+            max_tokens=self.few_shot_max_tokens,
+            example_prompt=get_prompt_template(FEW_SHOT_EXAMPLE_TEMPLATE),
+        )
 
-            # parsing the relations represented as list of list
-            out_relations = self.rel_triplets_parser.parse(chat_generations.content)
+    def _iter_chunk_prompts(
+        self,
+        subject: str,
+        source: TextSource,
+        few_shot_context: Optional[Tuple[FewShotPromptTemplate, Set[str]]] = None,
+    ) -> Iterator[Tuple[Chunk, List[BaseMessage]]]:
+        few_shot_context = few_shot_context or self.build_few_shot_context()
+        few_shot_prompt, relation_names = few_shot_context
+        prompt_tokens = self._few_shot_prompt_tokens(subject, few_shot_context)
 
-            results.extend(process_result_triplets(out_relations))
+        # chunking the description into smaller pieces yields more extracted relations
+        for chunk in self.chunker.iter_chunks(iter_source_blocks(source), prompt_tokens):
+            with self.metrics.timer("prompt_build"):
+                prompt = make_prompt(few_shot_prompt, relation_names, subject, chunk.text)
+            yield chunk, prompt
+
+    def make_chunk_prompts(
+        self,
+        subject: str,
+        input_text: str,
+        few_shot_context: Optional[Tuple[FewShotPromptTemplate, Set[str]]] = None,
+    ) -> List[List[BaseMessage]]:
+        return [prompt for _, prompt in self._iter_chunk_prompts(subject, input_text, few_shot_context)]
+
+    def extract_chunk(
+        self, chat_messages: List[BaseMessage], priority: Optional[int] = None, chunk_index: Optional[int] = None
+    ) -> List[Relation]:
+        logger.debug(f"Chat message prompt \n\n{chat_messages}")
+
+        return self._invoke(chat_messages, priority, parse=lambda content: self._parse_triplets(content, chunk_index))
+
+    def _model_name(self) -> str:
+        return self._chat_llm.model_name if self._chat_llm is not None else MODEL_NAME
+
+    def _plan_incremental(
+        self, subject: str, input_text: str, doc_id: str
+    ) -> Tuple[List[str], Dict[int, List[Relation]], List[Tuple[int, List[BaseMessage]]]]:
+        # fingerprints of every chunk, the relations of the chunks found in the manifest and the prompts of the others
+        if self.manifest is None:
+            raise ValueError(f"Extracting the document {doc_id} incrementally needs a manifest")
+        if not self.chunker.boundary_every:
+            # without them an edit shifts every following chunk, none of them would be found in the manifest
+            raise ValueError(f"Extracting the document {doc_id} incrementally needs a chunker with content defined boundaries (boundary_every)")
+
+        few_shot_context = self.build_few_shot_context()
+        few_shot_prompt, relation_names = few_shot_context
+        prompt_tokens = self._few_shot_prompt_tokens(subject, few_shot_context)
+        known = self.manifest.load(doc_id)
+
+        fingerprints, reused, pending = [], {}, []
+        for chunk in self.chunker.iter_chunks([input_text], prompt_tokens):
+            fingerprint = ChunkManifest.fingerprint(self._model_name(), subject, relation_names, chunk.text)
+            fingerprints.append(fingerprint)
+            if fingerprint in known:
+                # the chunk may have moved in the edited document
+                for relation in known[fingerprint]:
+                    relation.provenance = [chunk.index]
+                reused[chunk.index] = known[fingerprint]
+                continue
+            with self.metrics.timer("prompt_build"):
+                prompt = make_prompt(few_shot_prompt, relation_names, subject, chunk.text)
+            pending.append((chunk.index, prompt))
+
+        logger.info(f"Document {doc_id}: {len(reused)} chunks unchanged, {len(pending)} chunks to extract")
+        return fingerprints, reused, pending
+
+    def _save_incremental(
+        self, doc_id: str, fingerprints: List[str], reused: Dict[int, List[Relation]], extracted: Dict[int, List[Relation]]
+    ) -> List[Relation]:
+        chunks = [(fingerprint, reused[i] if i in reused else extracted[i]) for i, fingerprint in enumerate(fingerprints)]
+        self.manifest.save(doc_id, chunks)
+        self.manifest.reused += len(reused)
+        self.manifest.extracted += len(extracted)
+        self.metrics.increment("chunks_reused", len(reused))
+        return [relation for _, relations in chunks for relation in relations]
+
+    def extract_relations(self, subject: str, input_text: str, doc_id: Optional[str] = None) -> List[Relation]:
+        """With a doc_id, only the chunks changed since the last extraction of the document are sent to the model."""
+        return self.merge_relations(self._extract_relations(subject, input_text, doc_id), [subject])
+
+    def _extract_relations(self, subject: str, input_text: str, doc_id: Optional[str] = None) -> List[Relation]:
+        if doc_id is not None:
+            fingerprints, reused, pending = self._plan_incremental(subject, input_text, doc_id)
+            extracted = {i: self.extract_chunk(chat_messages, chunk_index=i) for i, chat_messages in pending}
+            return self._save_incremental(doc_id, fingerprints, reused, extracted)
+
+        prompts = self.make_chunk_prompts(subject, input_text)
+
+        results, num_chunks = [], len(prompts)
+        for i, chat_messages in enumerate(prompts):
+            results.extend(self.extract_chunk(chat_messages, chunk_index=i))
 
             if i % 10 == 0:
                 logger.info(
@@ -173,16 +445,246 @@ class RelationsMiner:
 
         return results
 
+    async def aextract_relations(
+        self, subject: str, input_text: str, max_concurrency: Optional[int] = None, doc_id: Optional[str] = None
+    ) -> List[Relation]:
+        relations = await self._aextract_relations(subject, input_text, max_concurrency, doc_id)
+        return self.merge_relations(relations, [subject])
+
+    async def _aextract_relations(
+        self, subject: str, input_text: str, max_concurrency: Optional[int] = None, doc_id: Optional[str] = None
+    ) -> List[Relation]:
+        if doc_id is not None:
+            fingerprints, reused, pending = self._plan_incremental(subject, input_text, doc_id)
+            generations = await self._ainvoke_all(
+                [chat_messages for _, chat_messages in pending],
+                max_concurrency,
+                # the chunk index of a pending prompt is its position in the document, not in the list
+                lambda content, position: self._parse_triplets(content, pending[position][0]),
+            )
+            extracted = {i: relations for (i, _), relations in zip(pending, generations)}
+            return self._save_incremental(doc_id, fingerprints, reused, extracted)
+
+        prompts = self.make_chunk_prompts(subject, input_text)
+
+        generations = await self._ainvoke_all(prompts, max_concurrency, self._parse_triplets)
+
+        results = [relation for relations in generations for relation in relations]
+
+        logger.info(f"Processed all chunks. Detected {len(results)} relations")
+
+        return results
+
+    def iter_relations(self, subject: str, source: TextSource) -> Iterator[ChunkRelations]:
+        """Yields the relations of every chunk as soon as it is extracted, reading the source incrementally."""
+        for chunk, chat_messages in self._iter_chunk_prompts(subject, source):
+            relations = self.extract_chunk(chat_messages, chunk_index=chunk.index)
+            yield ChunkRelations(chunk, self.merge_relations(relations, [subject]))
+
+    async def aiter_relations(
+        self, subject: str, source: TextSource, max_concurrency: Optional[int] = None
+    ) -> AsyncIterator[ChunkRelations]:
+        # at most max_concurrency chunks are in flight, their relations are yielded in chunk order
+        max_concurrency = max_concurrency or self.max_concurrency
+        pending: Deque[Tuple[Chunk, asyncio.Task]] = deque()
+
+        async def extract(chunk: Chunk, chat_messages: List[BaseMessage]) -> List[Relation]:
+            relations = await self._ainvoke(chat_messages, parse=lambda content: self._parse_triplets(content, chunk.index))
+            return self.merge_relations(relations, [subject])
+
+        try:
+            for chunk, chat_messages in self._iter_chunk_prompts(subject, source):
+                pending.append((chunk, asyncio.ensure_future(extract(chunk, chat_messages))))
+                if len(pending) >= max_concurrency:
+                    chunk, task = pending.popleft()
+                    yield ChunkRelations(chunk, await task)
+
+            while pending:
+                chunk, task = pending.popleft()
+                yield ChunkRelations(chunk, await task)
+        finally:
+            # the consumer stopping early must not leave chunks being extracted
+            for _, task in pending:
+                task.cancel()
+
+    def extract_relations_multi(self, subjects: List[str], input_text: str) -> Dict[str, List[Relation]]:
+        # one pass per chunk for all the subjects, the relations are attributed back afterwards
+        relations = self._extract_relations(", ".join(subjects), input_text)
+        return attribute_relations(self.merge_relations(relations, subjects), subjects)
+
+    async def aextract_relations_multi(
+        self, subjects: List[str], input_text: str, max_concurrency: Optional[int] = None
+    ) -> Dict[str, List[Relation]]:
+        relations = await self._aextract_relations(", ".join(subjects), input_text, max_concurrency)
+        return attribute_relations(self.merge_relations(relations, subjects), subjects)
+
+    async def _ainvoke_all(
+        self,
+        prompts: List[List[BaseMessage]],
+        max_concurrency: Optional[int] = None,
+        parse: Optional[Callable[[str, int], Any]] = None,
+    ) -> List[Any]:
+        # fans the chunk prompts out over a bounded pool, keeping the results in chunk order,
+        # parse gets the generation and the index of its prompt
+        semaphore = asyncio.Semaphore(max_concurrency or self.max_concurrency)
+        num_chunks, completed = len(prompts), 0
+
+        async def invoke(i: int, chat_messages: List[BaseMessage]) -> Any:
+            nonlocal completed
+            async with semaphore:
+                logger.debug(f"Chat message prompt \n\n{chat_messages}")
+                result = await self._ainvoke(chat_messages, parse=parse and (lambda content: parse(content, i)))
+
+            completed += 1
+            if completed % 10 == 0:
+                logger.info(f"Processed {completed}/{num_chunks} chunk")
+            return result
+
+        return await asyncio.gather(*[invoke(i, chat_messages) for i, chat_messages in enumerate(prompts)])
+
+    def _parse_triplets(self, content: str, chunk_index: Optional[int] = None) -> List[Relation]:
+        # parsing the relations represented as list of list
+        return process_result_triplets(self.rel_triplets_parser.parse(content), chunk_index)
+
+    @staticmethod
+    def _parse_simple_triplets(content: str, chunk_index: Optional[int] = None) -> List[Relation]:
+        return process_result_triplets(json.loads(content), chunk_index)
+
+    def _parse(self, content: str, parse: Optional[Callable[[str], Any]]) -> Any:
+        logger.debug(f"Generations [[\n\n{content}]]")
+        if parse is None:
+            return content
+        with self.metrics.timer("parse"):
+            return parse(content)
+
+    def _from_cache(self, key: str, parse: Optional[Callable[[str], Any]]) -> Tuple[bool, Any]:
+        content = self.llm_cache.get(key)
+        if content is not None:
+            try:
+                parsed = self._parse(content, parse)
+            except PARSE_ERRORS as error:
+                # an entry that does not parse is dropped, the model is asked again
+                logger.warning(f"Dropping the cached generation {key} that does not parse: {error}")
+                self.llm_cache.delete(key)
+            else:
+                self.metrics.increment("cache_hits")
+                return True, parsed
+        self.metrics.increment("cache_misses")
+        return False, None
+
+    def _cache_key(self, chat_messages: List[BaseMessage]) -> str:
+        prompt = "\n".join(message.content for message in chat_messages)
+        # a cache hit must not build the client
+        if self._chat_llm is None:
+            return LLMResponseCache.make_key(MODEL_NAME, prompt, CHAT_MODEL_KWARGS["response_format"])
+        response_format = self._chat_llm.model_kwargs.get("response_format")
+        return LLMResponseCache.make_key(self._chat_llm.model_name, prompt, response_format)
+
+    def _record_retry(self, error: Exception):
+        self.metrics.increment("llm_retries")
+
+    def _record_tokens(self, prompt_tokens: int, content: str):
+        completion_tokens = self.chunker.token_counter(content)
+        self.scheduler.record_tokens(completion_tokens)
+        self.metrics.increment("llm_calls")
+        self.metrics.increment("prompt_tokens", prompt_tokens)
+        self.metrics.increment("completion_tokens", completion_tokens)
+
+    def _invoke(
+        self, chat_messages: List[BaseMessage], priority: Optional[int] = None, parse: Optional[Callable[[str], Any]] = None
+    ) -> Any:
+        """Returns the generation, parsed with parse when given. Only the generations that parse are cached."""
+        key = None
+        if self.llm_cache is not None:
+            key = self._cache_key(chat_messages)
+            found, parsed = self._from_cache(key, parse)
+            if found:
+                return parsed
+
+        # only the calls that actually reach the model go through the scheduler
+        prompt_tokens = estimate_tokens(chat_messages, self.chunker.token_counter)
+        with self.metrics.timer("llm_call"):
+            content = self.scheduler.call(
+                lambda: self.chat_llm.invoke(chat_messages).content,
+                tokens=prompt_tokens,
+                priority=self.priority if priority is None else priority,
+                on_retry=self._record_retry,
+            )
+        self._record_tokens(prompt_tokens, content)
+
+        # a malformed generation raises before being cached, the next run asks the model again
+        parsed = self._parse(content, parse)
+        if key is not None:
+            self.llm_cache.put(key, content)
+        return parsed
+
+    async def _ainvoke(
+        self, chat_messages: List[BaseMessage], priority: Optional[int] = None, parse: Optional[Callable[[str], Any]] = None
+    ) -> Any:
+        key = None
+        if self.llm_cache is not None:
+            key = self._cache_key(chat_messages)
+            found, parsed = self._from_cache(key, parse)
+            if found:
+                return parsed
+
+        async def invoke() -> str:
+            return (await self.chat_llm.ainvoke(chat_messages)).content
+
+        prompt_tokens = estimate_tokens(chat_messages, self.chunker.token_counter)
+        with self.metrics.timer("llm_call"):
+            content = await self.scheduler.acall(
+                invoke,
+                tokens=prompt_tokens,
+                priority=self.priority if priority is None else priority,
+                on_retry=self._record_retry,
+            )
+        self._record_tokens(prompt_tokens, content)
+
+        # a malformed generation raises before being cached, the next run asks the model again
+        parsed = self._parse(content, parse)
+        if key is not None:
+            self.llm_cache.put(key, content)
+        return parsed
+
     def extract_common_relations(
         self, subject_a: str, description_a: str, subject_b: str, description_b: str
     ) -> Dict:
-        relations_a = self.extract_relations(subject_a, description_a)
-        relations_b = self.extract_relations(subject_b, description_b)
-
+        if description_a == description_b:
+            # both subjects come from the same text, a single pass extracts the relations of both
+            relations = self.extract_relations_multi([subject_a, subject_b], description_a)
+            relations_a, relations_b = relations[subject_a], relations[subject_b]
+        else:
+            relations_a = self.extract_relations(subject_a, description_a)
+            relations_b = self.extract_relations(subject_b, description_b)
+
+        return self.common_relations(subject_a, relations_a, subject_b, relations_b)
+
+    def common_relations(
+        self, subject_a: str, relations_a: List[Relation], subject_b: str, relations_b: List[Relation]
+    ) -> Dict:
         shared_relations = Relation.detect_shared_relations(relations_a, relations_b)
+        overlap = RelationComparator({subject_a: relations_a, subject_b: relations_b}).report()
 
         return {
             "relations_left": relations_a,
             "relations_right": relations_b,
             "shared_relations": shared_relations,
+            "overlap": overlap,
         }
+
+    def compare_subjects(self, subject_texts: Dict[str, str]) -> Dict:
+        # the subjects described by the same text are extracted together in a single pass
+        subjects_by_text: Dict[str, List[str]] = {}
+        for subject, text in subject_texts.items():
+            subjects_by_text.setdefault(text, []).append(subject)
+
+        relations: Dict[str, List[Relation]] = {}
+        for text, subjects in subjects_by_text.items():
+            if len(subjects) == 1:
+                relations[subjects[0]] = self.extract_relations(subjects[0], text)
+            else:
+                relations.update(self.extract_relations_multi(subjects, text))
+
+        relations = {subject: relations[subject] for subject in subject_texts}
+        return {"relations": relations, "overlap": RelationComparator(relations).report()}
@@ -1,11 +1,14 @@
-from typing import List, Dict
+from typing import Callable, List, Dict, Optional
 import logging
 
+from langchain.prompts.example_selector.base import BaseExampleSelector
 from langchain.prompts.few_shot import FewShotPromptTemplate
 from langchain.schema import HumanMessage, BaseMessage
 from langchain.prompts import PromptTemplate
 
+from relminer.chunking import count_tokens
 from relminer.domain import Relation
+from relminer.normalize import normalize_text
 
 from typing import List
 import os
@@ -13,6 +16,7 @@ import os
 logger = logging.getLogger(__name__)
 
 TMPLT_BASE_DIR = os.path.dirname(__file__)
+TEMPLATES_DIR = os.path.join(TMPLT_BASE_DIR, "../templates")
 
 FEW_SHOT_EXAMPLE_TEMPLATE = "few_shot_example.txt"
 FEW_SHOT_PREFIX_TEMPLATE = "few_shot_prefix_template.txt"
@@ -20,14 +24,24 @@ FEW_SHOT_SUFFIX_TEMPLATE = "few_shot_suffix_template.txt"
 
 
 def make_prompt(few_shot_prompt, relation_names, subject, chunked_description) -> List[BaseMessage]:
-    # all the instructions of the full prompt per chunk
+    example_selector = getattr(few_shot_prompt, "example_selector", None)
+    if example_selector is not None:
+        # only the types of the examples selected for the chunk are listed, the prompt does not grow with the store
+        examples = example_selector.select_examples({"input": chunked_description})
+        relation_names = {example["example_name"] for example in examples}
+    # all the instructions of the full prompt per chunk, the types are sorted so the prompt does not
+    # depend on the hash seed and its cache key is the same in every run
     full_prompt = few_shot_prompt.format(
-        relation_types=relation_names, subject=subject, input=chunked_description
+        relation_types=sorted(relation_names), subject=subject, input=chunked_description
     )
     return [HumanMessage(content=full_prompt)]
 
 
-def process_result_triplets(out_relations) -> List[Relation]:
+def estimate_tokens(chat_messages: List[BaseMessage], token_counter: Callable[[str], int] = count_tokens) -> int:
+    return sum(token_counter(message.content) for message in chat_messages)
+
+
+def process_result_triplets(out_relations, chunk_index: Optional[int] = None) -> List[Relation]:
     relations = []
     # A relation is parsed as list with subject, relation, object.
     # Ex: ['Luis Rodriguez', 'Lived_At', 'Techville']
@@ -43,10 +57,38 @@ def process_result_triplets(out_relations) -> List[Relation]:
         if not rel:
             logger.warning(f"Invalid relation {triplet}")
             continue
+        if chunk_index is not None:
+            rel.provenance = [chunk_index]
         relations.append(rel)
     return relations
 
 
+def attribute_relations(relations: List[Relation], subjects: List[str]) -> Dict[str, List[Relation]]:
+    # the relations extracted for several subjects at once are attributed back to each subject
+    results = {subject: [] for subject in subjects}
+    normalized = {subject: normalize_text(subject) for subject in subjects}
+    by_name = {name: subject for subject, name in normalized.items()}
+    subject_words = {subject: set(name.split()) for subject, name in normalized.items()}
+
+    for relation in relations:
+        name = normalize_text(relation.subject)
+        subject = by_name.get(name)
+        if subject is None:
+            # partial mentions like "Jobs" for "Steve Jobs" go to the subject sharing the most words
+            words = set(name.split())
+            overlaps = {s: len(words & subject_words[s]) for s in subjects}
+            best = max(overlaps.values(), default=0)
+            candidates = [s for s in subjects if overlaps[s] == best]
+            if best and len(candidates) == 1:
+                subject = candidates[0]
+
+        if subject is None:
+            logger.warning(f"Could not attribute relation {relation} to any of {subjects}")
+            continue
+        results[subject].append(relation)
+    return results
+
+
 def get_few_shot_examples(relations: List[Relation]) -> List[Dict]:
     few_shot_examples = []
     for r in relations:
@@ -56,23 +98,28 @@ def get_few_shot_examples(relations: List[Relation]) -> List[Dict]:
             "example_text": r.sentence,
             "example_relations": str(triplet),
             "example_explanation": explanation,
+            "example_name": r.name,
         }
         few_shot_examples.append(shot_example)
     return few_shot_examples
 
 
-def build_few_shot_prompt(relations: List[Relation], output_parser) -> FewShotPromptTemplate:
+def build_few_shot_prompt(
+    relations: List[Relation], output_parser, example_selector: Optional[BaseExampleSelector] = None
+) -> FewShotPromptTemplate:
     format_instructions = output_parser.get_format_instructions()
 
     few_shot_example_prompt = get_prompt_template(FEW_SHOT_EXAMPLE_TEMPLATE)
     few_shot_suffix = get_template(FEW_SHOT_SUFFIX_TEMPLATE)
     few_shot_prefix = get_template(FEW_SHOT_PREFIX_TEMPLATE)
 
-    few_shot_examples = get_few_shot_examples(relations)
+    # with a selector only the examples relevant to each chunk are rendered
+    few_shot_examples = None if example_selector else get_few_shot_examples(relations)
 
     few_shot_prompt = FewShotPromptTemplate(
         prefix=few_shot_prefix,
         examples=few_shot_examples,
+        example_selector=example_selector,
         example_prompt=few_shot_example_prompt,
         suffix=few_shot_suffix,
         partial_variables={"output_instructions": format_instructions},
@@ -82,15 +129,37 @@ def build_few_shot_prompt(relations: List[Relation], output_parser) -> FewShotPr
     return few_shot_prompt
 
 
+class TemplateRegistry:
+    """Loads the templates once and keeps them, along with their compiled prompt templates, in memory."""
+
+    def __init__(self, base_dir: str = TEMPLATES_DIR):
+        self.base_dir = base_dir
+        self.templates: Dict[str, str] = {}
+        self.prompt_templates: Dict[str, PromptTemplate] = {}
+
+    def load_all(self) -> "TemplateRegistry":
+        for name in sorted(os.listdir(self.base_dir)):
+            self.get_prompt_template(name)
+        return self
+
+    def get_template(self, name: str) -> str:
+        if name not in self.templates:
+            with open(os.path.join(self.base_dir, name), "r") as f:
+                self.templates[name] = f.read()
+        return self.templates[name]
+
+    def get_prompt_template(self, name: str) -> PromptTemplate:
+        if name not in self.prompt_templates:
+            self.prompt_templates[name] = PromptTemplate.from_template(self.get_template(name))
+        return self.prompt_templates[name]
+
+
+template_registry = TemplateRegistry()
+
+
 def get_prompt_template(name: str) -> PromptTemplate:
-    location = os.path.join(TMPLT_BASE_DIR, "../templates", name)
-    with open(location, "r") as f:
-        promp_template = f.read()
-    return PromptTemplate.from_template(promp_template)
+    return template_registry.get_prompt_template(name)
 
 
 def get_template(name: str) -> str:
-    location = os.path.join(TMPLT_BASE_DIR, "../templates", name)
-    with open(location, "r") as f:
-        template = f.read()
-    return template
+    return template_registry.get_template(name)
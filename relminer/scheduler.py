@@ -0,0 +1,264 @@
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple, TypeVar
+import asyncio
+import fcntl
+import heapq
+import itertools
+import json
+import logging
+import os
+import random
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# lower values are served first
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BATCH = 10
+
+DEFAULT_REQUESTS_PER_MINUTE = 100
+# waiters which are not at the head of the queue check back this often
+POLL_INTERVAL = 0.05
+
+
+def is_rate_limit_error(error: Exception) -> bool:
+    status = getattr(error, "http_status", None) or getattr(error, "status_code", None)
+    return status == 429 or type(error).__name__ == "RateLimitError"
+
+
+def retry_after(error: Exception) -> Optional[float]:
+    headers = getattr(error, "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+class TokenBucket:
+    def __init__(self, capacity: float, per_seconds: float = 60):
+        self.capacity = capacity
+        self.rate = capacity / per_seconds
+        self.level = capacity
+        self.updated_at = time.time()
+
+    def refill(self, now: float):
+        self.level = min(self.capacity, self.level + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def wait_time(self, amount: float) -> float:
+        # a single request bigger than the bucket only waits for the bucket to be full
+        missing = min(amount, self.capacity) - self.level
+        return max(missing / self.rate, 0)
+
+    def get_state(self) -> List[float]:
+        return [self.level, self.updated_at]
+
+    def set_state(self, state: List[float]):
+        self.level, self.updated_at = state
+
+
+class FileRateCoordinator:
+    """Shares the token buckets state between the worker processes of one host through a locked file."""
+
+    def __init__(self, location: str):
+        self.location = location
+        directory = os.path.dirname(location)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def update(self, buckets: Dict[str, TokenBucket], reserve: Callable[[], T]) -> T:
+        with open(self.location, "a+") as f:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            try:
+                f.seek(0)
+                content = f.read()
+                state = json.loads(content) if content else {}
+                for name, bucket in buckets.items():
+                    if name in state:
+                        bucket.set_state(state[name])
+
+                result = reserve()
+
+                f.seek(0)
+                f.truncate()
+                f.write(json.dumps({name: bucket.get_state() for name, bucket in buckets.items()}))
+                f.flush()
+            finally:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+        return result
+
+
+class LLMScheduler:
+    """
+    Governs every LLM call of the process: requests and tokens per minute through token buckets,
+    calls served by priority, and rate limited (429) calls retried with exponential backoff.
+    """
+
+    def __init__(
+        self,
+        requests_per_minute: float = DEFAULT_REQUESTS_PER_MINUTE,
+        tokens_per_minute: Optional[float] = None,
+        max_retries: int = 5,
+        backoff: float = 1.0,
+        max_backoff: float = 60.0,
+        coordinator: Optional[FileRateCoordinator] = None,
+    ):
+        self.buckets: Dict[str, TokenBucket] = {"requests": TokenBucket(requests_per_minute)}
+        if tokens_per_minute is not None:
+            self.buckets["tokens"] = TokenBucket(tokens_per_minute)
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.coordinator = coordinator
+        self.stats = {"calls": 0, "retries": 0, "waited": 0.0}
+
+        self._lock = threading.Lock()
+        self._condition = threading.Condition(self._lock)
+        self._waiters: List[Tuple[int, int]] = []
+        self._tickets = itertools.count()
+
+    def _try_reserve(self, tokens: int) -> float:
+        now = time.time()
+        waits = {"requests": 1, "tokens": tokens}
+        for name, bucket in self.buckets.items():
+            bucket.refill(now)
+        wait = max(bucket.wait_time(waits[name]) for name, bucket in self.buckets.items())
+        if wait <= 0:
+            for name, bucket in self.buckets.items():
+                bucket.level -= waits[name]
+        return wait
+
+    def _reserve(self, ticket: Tuple[int, int], tokens: int) -> float:
+        with self._lock:
+            if self._waiters[0] != ticket:
+                return POLL_INTERVAL
+            if self.coordinator is not None:
+                wait = self.coordinator.update(self.buckets, lambda: self._try_reserve(tokens))
+            else:
+                wait = self._try_reserve(tokens)
+            if wait <= 0:
+                heapq.heappop(self._waiters)
+                self._condition.notify_all()
+            return wait
+
+    def _enqueue(self, priority: int) -> Tuple[int, int]:
+        ticket = (priority, next(self._tickets))
+        with self._lock:
+            heapq.heappush(self._waiters, ticket)
+        return ticket
+
+    def _dequeue(self, ticket: Tuple[int, int]):
+        # a waiter giving up (ex: a cancelled task) must not block the ones behind it
+        with self._lock:
+            if ticket in self._waiters:
+                self._waiters.remove(ticket)
+                heapq.heapify(self._waiters)
+                self._condition.notify_all()
+
+    def acquire(self, tokens: int = 0, priority: int = PRIORITY_INTERACTIVE):
+        ticket, started_at = self._enqueue(priority), time.time()
+        try:
+            while True:
+                wait = self._reserve(ticket, tokens)
+                if wait <= 0:
+                    break
+                with self._condition:
+                    self._condition.wait(min(wait, 1))
+        except BaseException:
+            self._dequeue(ticket)
+            raise
+        self.stats["waited"] += time.time() - started_at
+
+    async def aacquire(self, tokens: int = 0, priority: int = PRIORITY_INTERACTIVE):
+        ticket, started_at = self._enqueue(priority), time.time()
+        try:
+            while True:
+                wait = self._reserve(ticket, tokens)
+                if wait <= 0:
+                    break
+                await asyncio.sleep(min(wait, 1))
+        except BaseException:
+            self._dequeue(ticket)
+            raise
+        self.stats["waited"] += time.time() - started_at
+
+    def record_tokens(self, tokens: int):
+        # the completion tokens are only known after the call, they are charged afterwards
+        if "tokens" not in self.buckets or not tokens:
+            return
+        with self._lock:
+            bucket = self.buckets["tokens"]
+            if self.coordinator is not None:
+                self.coordinator.update(self.buckets, lambda: setattr(bucket, "level", bucket.level - tokens))
+            else:
+                bucket.level -= tokens
+
+    def _backoff_time(self, attempt: int, error: Exception) -> float:
+        delay = retry_after(error)
+        if delay is None:
+            delay = min(self.backoff * 2 ** attempt, self.max_backoff) * (0.5 + random.random() / 2)
+        return delay
+
+    def call(
+        self,
+        fn: Callable[[], T],
+        tokens: int = 0,
+        priority: int = PRIORITY_INTERACTIVE,
+        on_retry: Optional[Callable[[Exception], None]] = None,
+    ) -> T:
+        for attempt in itertools.count():
+            self.acquire(tokens, priority)
+            self.stats["calls"] += 1
+            try:
+                return fn()
+            except Exception as error:
+                if not is_rate_limit_error(error) or attempt >= self.max_retries:
+                    raise
+                delay = self._backoff_time(attempt, error)
+                logger.warning(f"Rate limited, retrying in {delay:.1f}s ({attempt + 1}/{self.max_retries})")
+                self.stats["retries"] += 1
+                if on_retry is not None:
+                    on_retry(error)
+                time.sleep(delay)
+
+    async def acall(
+        self,
+        fn: Callable[[], Awaitable[T]],
+        tokens: int = 0,
+        priority: int = PRIORITY_INTERACTIVE,
+        on_retry: Optional[Callable[[Exception], None]] = None,
+    ) -> T:
+        for attempt in itertools.count():
+            await self.aacquire(tokens, priority)
+            self.stats["calls"] += 1
+            try:
+                return await fn()
+            except Exception as error:
+                if not is_rate_limit_error(error) or attempt >= self.max_retries:
+                    raise
+                delay = self._backoff_time(attempt, error)
+                logger.warning(f"Rate limited, retrying in {delay:.1f}s ({attempt + 1}/{self.max_retries})")
+                self.stats["retries"] += 1
+                if on_retry is not None:
+                    on_retry(error)
+                await asyncio.sleep(delay)
+
+
+_default_scheduler: Optional[LLMScheduler] = None
+_default_scheduler_lock = threading.Lock()
+
+
+def get_default_scheduler() -> LLMScheduler:
+    # one scheduler shared by every miner of the process, RELMINER_RATE_FILE shares it across processes
+    global _default_scheduler
+    with _default_scheduler_lock:
+        if _default_scheduler is None:
+            rate_file = os.environ.get("RELMINER_RATE_FILE")
+            _default_scheduler = LLMScheduler(
+                requests_per_minute=float(os.environ.get("RELMINER_RPM", DEFAULT_REQUESTS_PER_MINUTE)),
+                tokens_per_minute=float(os.environ["RELMINER_TPM"]) if "RELMINER_TPM" in os.environ else None,
+                coordinator=FileRateCoordinator(rate_file) if rate_file else None,
+            )
+        return _default_scheduler
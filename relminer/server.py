@@ -0,0 +1,292 @@
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
+import asyncio
+import json
+import logging
+
+from relminer.compare import OverlapReport
+from relminer.domain import Relation
+from relminer.relations_miner import RelationsMiner
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PORT = 8080
+DEFAULT_POOL_SIZE = 4
+# the requests on the same text arriving within this window share their LLM calls
+DEFAULT_BATCH_WINDOW = 0.01
+DEFAULT_MAX_BATCH_SUBJECTS = 8
+MAX_BODY_SIZE = 16 * 2 ** 20
+
+HTTP_REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 413: "Payload Too Large", 500: "Internal Server Error"}
+
+
+class HTTPError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+def relation_to_json(relation: Relation, full: bool = False) -> Dict:
+    record = relation.to_dict() if full else relation.to_dict(exclude=["description", "sentence", "explanation"])
+    record["provenance"] = relation.provenance
+    return record
+
+
+def overlap_to_json(report: OverlapReport) -> Dict:
+    # the (name, object) keys are not valid JSON keys, every shared key is listed with its subjects
+    shared = {
+        level: [{"key": list(key) if isinstance(key, tuple) else key, "subjects": subjects} for key, subjects in keys.items()]
+        for level, keys in report.shared.items()
+    }
+    return {"subjects": report.subjects, "counts": report.counts, "shared": shared}
+
+
+class MinerPool:
+    """Warm miners sharing the loaded relations store, each one serving a single extraction at a time."""
+
+    def __init__(self, miners: List[RelationsMiner]):
+        self.miners = miners
+        self._idle: Optional[asyncio.Queue] = None
+
+    def warm_up(self):
+        # the few shot context is built before the first request
+        for miner in self.miners:
+            miner.build_few_shot_context()
+        self._idle = asyncio.Queue()
+        for miner in self.miners:
+            self._idle.put_nowait(miner)
+
+    @asynccontextmanager
+    async def acquire(self) -> AsyncIterator[RelationsMiner]:
+        miner = await self._idle.get()
+        try:
+            yield miner
+        finally:
+            self._idle.put_nowait(miner)
+
+    def idle(self) -> int:
+        return self._idle.qsize() if self._idle is not None else 0
+
+
+class ExtractionService:
+    """
+    Asyncio HTTP service keeping warm miners in memory. Identical in-flight (subject, text) extractions
+    are coalesced into one, and the extractions of different subjects on the same text arriving within
+    batch_window share their LLM calls through a multi-subject extraction. The extractions of different
+    texts are never batched together: each one makes its own LLM calls, however small its text.
+    Registrations arriving together are explained and written to the store in one batch.
+    """
+
+    def __init__(
+        self,
+        miner_factory: Callable[[], RelationsMiner],
+        pool_size: int = DEFAULT_POOL_SIZE,
+        batch_window: float = DEFAULT_BATCH_WINDOW,
+        max_batch_subjects: int = DEFAULT_MAX_BATCH_SUBJECTS,
+    ):
+        self.pool = MinerPool([miner_factory() for _ in range(pool_size)])
+        self.batch_window = batch_window
+        self.max_batch_subjects = max_batch_subjects
+        self.stats = {"requests": 0, "extractions": 0, "coalesced": 0, "batched": 0, "registered": 0}
+        self.server: Optional[asyncio.AbstractServer] = None
+
+        # (subject, text) -> extraction task
+        self._inflight: Dict[Tuple[str, str], asyncio.Future] = {}
+        # text -> subjects waiting for the batch window, with the future of their results
+        self._pending_extractions: Dict[str, Tuple[List[str], asyncio.Future]] = {}
+        self._pending_registrations: Optional[Tuple[List[Relation], asyncio.Future]] = None
+
+        self.routes: Dict[Tuple[str, str], Callable[[Dict], Awaitable[Dict]]] = {
+            ("POST", "/extract"): self.handle_extract,
+            ("POST", "/register"): self.handle_register,
+            ("POST", "/compare"): self.handle_compare,
+            ("GET", "/health"): self.handle_health,
+        }
+
+    async def extract(self, subject: str, text: str) -> List[Relation]:
+        key = (subject, text)
+        task = self._inflight.get(key)
+        if task is not None:
+            self.stats["coalesced"] += 1
+        else:
+            task = asyncio.ensure_future(self._extract_batched(subject, text))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        # a client going away must not cancel the extraction the others are waiting for
+        return await asyncio.shield(task)
+
+    async def _extract_batched(self, subject: str, text: str) -> List[Relation]:
+        loop = asyncio.get_running_loop()
+        batch = self._pending_extractions.get(text)
+        if batch is None:
+            batch = ([], loop.create_future())
+            self._pending_extractions[text] = batch
+            loop.call_later(self.batch_window, self._flush_extractions, text, batch)
+        else:
+            self.stats["batched"] += 1
+
+        subjects, results = batch
+        subjects.append(subject)
+        if len(subjects) >= self.max_batch_subjects:
+            self._flush_extractions(text, batch)
+        return (await results)[subject]
+
+    def _flush_extractions(self, text: str, batch: Tuple[List[str], asyncio.Future]):
+        # the window timer of a batch flushed because it was full finds another batch, or none
+        if self._pending_extractions.get(text) is batch:
+            del self._pending_extractions[text]
+            asyncio.ensure_future(self._run_extractions(text, *batch))
+
+    async def _run_extractions(self, text: str, subjects: List[str], results: asyncio.Future):
+        self.stats["extractions"] += 1
+        try:
+            async with self.pool.acquire() as miner:
+                if len(subjects) == 1:
+                    relations = {subjects[0]: await miner.aextract_relations(subjects[0], text)}
+                else:
+                    relations = await miner.aextract_relations_multi(subjects, text)
+            results.set_result(relations)
+        except Exception as error:
+            results.set_exception(error)
+
+    async def register(self, relations: List[Relation]) -> List[Relation]:
+        loop = asyncio.get_running_loop()
+        if self._pending_registrations is None:
+            self._pending_registrations = ([], loop.create_future())
+            loop.call_later(self.batch_window, self._flush_registrations)
+        pending, done = self._pending_registrations
+        pending.extend(relations)
+        await done
+        return relations
+
+    def _flush_registrations(self):
+        batch, self._pending_registrations = self._pending_registrations, None
+        asyncio.ensure_future(self._run_registrations(*batch))
+
+    async def _run_registrations(self, relations: List[Relation], done: asyncio.Future):
+        try:
+            async with self.pool.acquire() as miner:
+                # the registration calls the model synchronously, it runs out of the event loop
+                await asyncio.get_running_loop().run_in_executor(None, miner.register_relations, relations)
+            self.stats["registered"] += len(relations)
+            done.set_result(None)
+        except Exception as error:
+            done.set_exception(error)
+
+    @staticmethod
+    def _field(request: Dict, name: str) -> str:
+        value = request.get(name)
+        if not isinstance(value, str) or not value:
+            raise HTTPError(400, f"Missing the {name} field")
+        return value
+
+    async def handle_extract(self, request: Dict) -> Dict:
+        relations = await self.extract(self._field(request, "subject"), self._field(request, "text"))
+        return {"relations": [relation_to_json(relation) for relation in relations]}
+
+    async def handle_register(self, request: Dict) -> Dict:
+        try:
+            relations = [
+                Relation(r["subject"], r["name"], r["object"], r.get("description", "")) for r in request["relations"]
+            ]
+        except (KeyError, TypeError):
+            raise HTTPError(400, "Expected the relations as a list of {subject, name, object, description}")
+        registered = await self.register(relations)
+        return {"relations": [relation_to_json(relation, full=True) for relation in registered]}
+
+    async def handle_compare(self, request: Dict) -> Dict:
+        subject_a, subject_b = self._field(request, "subject_a"), self._field(request, "subject_b")
+        relations_a, relations_b = await asyncio.gather(
+            self.extract(subject_a, self._field(request, "text_a")),
+            self.extract(subject_b, self._field(request, "text_b")),
+        )
+        common = self.pool.miners[0].common_relations(subject_a, relations_a, subject_b, relations_b)
+        return {
+            "relations_left": [relation_to_json(relation) for relation in common["relations_left"]],
+            "relations_right": [relation_to_json(relation) for relation in common["relations_right"]],
+            "shared_relations": [relation_to_json(relation) for relation in common["shared_relations"]],
+            "overlap": overlap_to_json(common["overlap"]),
+        }
+
+    async def handle_health(self, request: Dict) -> Dict:
+        return {
+            "status": "ok",
+            "miners": len(self.pool.miners),
+            "idle_miners": self.pool.idle(),
+            "inflight": len(self._inflight),
+            **self.stats,
+        }
+
+    async def _read_request(self, reader: asyncio.StreamReader) -> Tuple[str, str, Dict]:
+        request_line = (await reader.readline()).decode("latin-1").strip()
+        try:
+            method, target, _ = request_line.split(" ", 2)
+        except ValueError:
+            raise HTTPError(400, f"Invalid request line {request_line!r}")
+
+        headers = {}
+        while True:
+            line = (await reader.readline()).decode("latin-1")
+            if line in ("\r\n", "\n", ""):
+                break
+            name, _, value = line.partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        length = int(headers.get("content-length") or 0)
+        if length > MAX_BODY_SIZE:
+            raise HTTPError(413, f"The request body is bigger than {MAX_BODY_SIZE} bytes")
+        body = await reader.readexactly(length) if length else b""
+        try:
+            request = json.loads(body) if body else {}
+        except json.JSONDecodeError as error:
+            raise HTTPError(400, f"Invalid JSON body: {error}")
+        return method, target.split("?", 1)[0], request
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            try:
+                method, path, request = await self._read_request(reader)
+                route = self.routes.get((method, path))
+                if route is None:
+                    raise HTTPError(404, f"No route for {method} {path}")
+                self.stats["requests"] += 1
+                status, response = 200, await route(request)
+            except HTTPError as error:
+                status, response = error.status, {"error": str(error)}
+            except Exception as error:
+                logger.exception("Request failed")
+                status, response = 500, {"error": str(error)}
+
+            body = json.dumps(response).encode("utf-8")
+            writer.write(
+                f"HTTP/1.1 {status} {HTTP_REASONS[status]}\r\n"
+                f"Content-Type: application/json\r\nContent-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode("latin-1")
+                + body
+            )
+            await writer.drain()
+        except ConnectionError:
+            logger.debug("Client disconnected")
+        finally:
+            writer.close()
+
+    async def start(self, host: str = "127.0.0.1", port: int = DEFAULT_PORT) -> asyncio.AbstractServer:
+        self.pool.warm_up()
+        self.server = await asyncio.start_server(self._handle_connection, host, port)
+        logger.info(f"Serving {len(self.pool.miners)} miners on {host}:{self.port}")
+        return self.server
+
+    @property
+    def port(self) -> int:
+        return self.server.sockets[0].getsockname()[1]
+
+    async def close(self):
+        self.server.close()
+        await self.server.wait_closed()
+
+    def run(self, host: str = "127.0.0.1", port: int = DEFAULT_PORT):
+        async def serve():
+            await self.start(host, port)
+            async with self.server:
+                await self.server.serve_forever()
+
+        asyncio.run(serve())
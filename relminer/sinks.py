@@ -0,0 +1,284 @@
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional
+import logging
+import os
+import re
+
+import fastavro
+
+from relminer.domain import RELATION_FIELDS, Relation
+from relminer.relation_store import relation_schema_def
+
+logger = logging.getLogger(__name__)
+
+# the schema of the few shot store, with the chunks and the document every relation was extracted from
+extracted_relation_schema_def = {
+    "name": "relation.miner.domain.ExtractedRelation",
+    "type": "record",
+    "fields": relation_schema_def["fields"]
+    + [
+        {"name": "provenance", "type": {"type": "array", "items": "int"}, "default": []},
+        {"name": "document", "type": "string", "default": ""},
+    ],
+}
+
+PARTITION_FIELDS = ("subject", "name", "object", "document")
+# characters not allowed in a partition directory name
+PARTITION_UNSAFE = re.compile(r"[^\w.\-]+")
+
+DEFAULT_AVRO_CODEC = "deflate"
+# an Avro block is written every so many bytes
+DEFAULT_AVRO_BLOCK_SIZE = 1024 * 1024
+DEFAULT_ARROW_CODEC = "zstd"
+# an Arrow record batch or a Parquet row group is written every so many rows
+DEFAULT_BATCH_ROWS = 64 * 1024
+# the part files only readable once closed are written under this suffix, then renamed
+TMP_SUFFIX = ".tmp"
+# the least recently written partition has its part file closed past this many open ones
+DEFAULT_MAX_OPEN_WRITERS = 64
+
+
+def relation_record(relation: Relation, document: str = "") -> Dict:
+    record = relation.to_dict()
+    record["provenance"] = list(relation.provenance)
+    record["document"] = document
+    return record
+
+
+def partition_dir(field: str, value: str) -> str:
+    # hive style directories, ex: name=lived_at, read as a column by the analytics tools
+    return f"{field}={PARTITION_UNSAFE.sub('_', value) or '_'}"
+
+
+class PartitionedSink:
+    """
+    Streams extracted relations into part files, one per value of the partition_by field when given.
+    Every sink opened on a location adds its own part files next to the ones of the previous runs.
+    At most max_open_writers part files are open at once: the least recently written one is closed,
+    and the next records of its partition go to a new part file.
+    """
+
+    extension = ""
+    # the formats needing their footer write every part file under a temporary name until it is closed,
+    # so a killed run never leaves a truncated file with a final name
+    atomic = False
+
+    def __init__(self, location: str, partition_by: Optional[str] = None, max_open_writers: int = DEFAULT_MAX_OPEN_WRITERS):
+        if partition_by is not None and partition_by not in PARTITION_FIELDS:
+            raise ValueError(f"Cannot partition by {partition_by}, expected one of {PARTITION_FIELDS}")
+        self.location = location
+        self.partition_by = partition_by
+        self.max_open_writers = max_open_writers
+        self.rows = 0
+        # partition value -> writer of its open part file, from the least to the most recently written
+        self.writers: "OrderedDict[Optional[str], Any]" = OrderedDict()
+        # partition value -> path of its open part file
+        self.paths: Dict[Optional[str], str] = {}
+        self.files: List[str] = []
+
+    def _part_file(self, partition: Optional[str]) -> str:
+        directory = self.location if partition is None else os.path.join(self.location, partition_dir(self.partition_by, partition))
+        os.makedirs(directory, exist_ok=True)
+        # the next index after the highest one, the part files of the previous runs may have gaps
+        pattern = re.compile(rf"part-(\d+){re.escape(self.extension)}(?:{re.escape(TMP_SUFFIX)})?$")
+        indices = [int(match.group(1)) for match in map(pattern.match, os.listdir(directory)) if match]
+        index = max(indices) + 1 if indices else 0
+        return os.path.join(directory, f"part-{index:05d}{self.extension}")
+
+    def _open(self, path: str) -> Any:
+        raise NotImplementedError
+
+    def _write(self, writer: Any, record: Dict):
+        raise NotImplementedError
+
+    def _flush(self, writer: Any):
+        raise NotImplementedError
+
+    def _close(self, writer: Any):
+        raise NotImplementedError
+
+    def write_records(self, records: Iterable[Dict]) -> int:
+        written = 0
+        for record in records:
+            partition = record[self.partition_by] if self.partition_by else None
+            writer = self.writers.get(partition)
+            if writer is not None:
+                self.writers.move_to_end(partition)
+            else:
+                if len(self.writers) >= self.max_open_writers:
+                    self._close_partition(next(iter(self.writers)))
+                path = self._part_file(partition)
+                writer = self.writers[partition] = self._open(path + TMP_SUFFIX if self.atomic else path)
+                self.paths[partition] = path
+                self.files.append(path)
+            self._write(writer, record)
+            written += 1
+        self.rows += written
+        return written
+
+    def write(self, relations: Iterable[Relation], document: str = "") -> int:
+        return self.write_records(relation_record(relation, document) for relation in relations)
+
+    def flush(self):
+        # the buffered records are written as a block, the files hold every record written so far
+        for writer in self.writers.values():
+            self._flush(writer)
+
+    def _close_partition(self, partition: Optional[str]):
+        self._close(self.writers.pop(partition))
+        path = self.paths.pop(partition)
+        if self.atomic:
+            os.replace(path + TMP_SUFFIX, path)
+
+    def close(self):
+        for partition in list(self.writers):
+            self._close_partition(partition)
+        logger.info(f"Wrote {self.rows} relations to {len(self.files)} files in {self.location}")
+
+    def __enter__(self) -> "PartitionedSink":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class AvroSink(PartitionedSink):
+    """Avro part files with the extracted relation schema, written in blocks of about block_size bytes."""
+
+    extension = ".avro"
+
+    def __init__(
+        self,
+        location: str,
+        partition_by: Optional[str] = None,
+        codec: str = DEFAULT_AVRO_CODEC,
+        block_size: int = DEFAULT_AVRO_BLOCK_SIZE,
+        max_open_writers: int = DEFAULT_MAX_OPEN_WRITERS,
+    ):
+        super().__init__(location, partition_by, max_open_writers)
+        self.codec = codec
+        self.block_size = block_size
+        self.schema = fastavro.parse_schema(extracted_relation_schema_def)
+
+    def _open(self, path: str) -> Any:
+        f = open(path, "wb")
+        return f, fastavro.write.Writer(f, self.schema, codec=self.codec, sync_interval=self.block_size)
+
+    def _write(self, writer: Any, record: Dict):
+        writer[1].write(record)
+
+    def _flush(self, writer: Any):
+        f, avro_writer = writer
+        avro_writer.flush()
+        f.flush()
+        os.fsync(f.fileno())
+
+    def _close(self, writer: Any):
+        self._flush(writer)
+        writer[0].close()
+
+
+class ArrowSink(PartitionedSink):
+    """
+    Arrow IPC part files, the records are buffered by column and written as record batches of batch_rows rows.
+    A part file is only readable once the sink is closed, it is written as part-NNNNN.arrow.tmp until then.
+    """
+
+    extension = ".arrow"
+    atomic = True
+
+    def __init__(
+        self,
+        location: str,
+        partition_by: Optional[str] = None,
+        codec: Optional[str] = DEFAULT_ARROW_CODEC,
+        batch_rows: int = DEFAULT_BATCH_ROWS,
+        max_open_writers: int = DEFAULT_MAX_OPEN_WRITERS,
+    ):
+        # pyarrow is optional, only the Arrow and Parquet sinks need it
+        try:
+            import pyarrow
+        except ImportError:
+            raise ImportError(f"{type(self).__name__} needs pyarrow, install it with: pip install pyarrow")
+
+        super().__init__(location, partition_by, max_open_writers)
+        self.pa = pyarrow
+        self.codec = codec
+        self.batch_rows = batch_rows
+        self.schema = pyarrow.schema(
+            [(field, pyarrow.string()) for field in RELATION_FIELDS]
+            + [("provenance", pyarrow.list_(pyarrow.int32())), ("document", pyarrow.string())]
+        )
+
+    def _new_writer(self, path: str) -> Any:
+        options = self.pa.ipc.IpcWriteOptions(compression=self.codec)
+        return self.pa.ipc.new_file(path, self.schema, options=options)
+
+    def _open(self, path: str) -> Any:
+        return {"writer": self._new_writer(path), "columns": {name: [] for name in self.schema.names}}
+
+    def _write(self, writer: Any, record: Dict):
+        columns = writer["columns"]
+        for name, values in columns.items():
+            values.append(record[name])
+        if len(columns["subject"]) >= self.batch_rows:
+            self._flush(writer)
+
+    def _flush(self, writer: Any):
+        columns = writer["columns"]
+        if not columns["subject"]:
+            return
+        writer["writer"].write_table(self.pa.Table.from_pydict(columns, schema=self.schema))
+        for values in columns.values():
+            values.clear()
+
+    def _close(self, writer: Any):
+        self._flush(writer)
+        writer["writer"].close()
+
+
+class ParquetSink(ArrowSink):
+    """Parquet part files, one row group per batch_rows rows."""
+
+    extension = ".parquet"
+
+    def __init__(
+        self,
+        location: str,
+        partition_by: Optional[str] = None,
+        codec: Optional[str] = DEFAULT_ARROW_CODEC,
+        batch_rows: int = DEFAULT_BATCH_ROWS,
+        max_open_writers: int = DEFAULT_MAX_OPEN_WRITERS,
+    ):
+        super().__init__(location, partition_by, codec, batch_rows, max_open_writers)
+        import pyarrow.parquet
+
+        self.pq = pyarrow.parquet
+
+    def _new_writer(self, path: str) -> Any:
+        return self.pq.ParquetWriter(path, self.schema, compression=self.codec or "none")
+
+
+SINK_FORMATS = {"avro": AvroSink, "arrow": ArrowSink, "parquet": ParquetSink}
+
+
+def make_sink(
+    sink_format: str,
+    location: str,
+    partition_by: Optional[str] = None,
+    codec: Optional[str] = None,
+    block_size: Optional[int] = None,
+    max_open_writers: Optional[int] = None,
+) -> PartitionedSink:
+    """block_size is in bytes for Avro and in rows for Arrow and Parquet, the defaults of every format are used when None."""
+    if sink_format not in SINK_FORMATS:
+        raise ValueError(f"Unknown sink format {sink_format}, expected one of {tuple(SINK_FORMATS)}")
+
+    options: Dict[str, Any] = {}
+    if codec is not None:
+        options["codec"] = codec
+    if block_size is not None:
+        options["block_size" if sink_format == "avro" else "batch_rows"] = block_size
+    if max_open_writers is not None:
+        options["max_open_writers"] = max_open_writers
+    return SINK_FORMATS[sink_format](location, partition_by, **options)
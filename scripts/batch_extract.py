@@ -0,0 +1,6 @@
+# kept for compatibility, same as: python -m relminer batch
+import sys
+
+from relminer.cli import main
+
+main(["batch"] + sys.argv[1:])
@@ -0,0 +1,6 @@
+# kept for compatibility, same as: python -m relminer benchmark
+import sys
+
+from relminer.cli import main
+
+main(["benchmark"] + sys.argv[1:])
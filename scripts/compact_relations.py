@@ -0,0 +1,6 @@
+# kept for compatibility, same as: python -m relminer compact
+import sys
+
+from relminer.cli import main
+
+main(["compact"] + sys.argv[1:])
@@ -1,12 +1,6 @@
-from relminer.relation_store import FastRelationStore
+# kept for compatibility, same as: python -m relminer list
+import sys
 
-import logging
+from relminer.cli import main
 
-relation_store = FastRelationStore()
-relations = relation_store.load_relations()
-
-logging.basicConfig(level=logging.INFO)
-logger = logging.getLogger(__name__)
-
-for relation in relations:
-    logger.info(f"\n{relation}")
+main(["list"] + sys.argv[1:])
@@ -0,0 +1,176 @@
+import functools
+import unittest
+from unittest.mock import patch
+import langchain.chat_models
+import json
+import os
+import tempfile
+from collections import namedtuple
+
+from relminer import batch
+from relminer.batch import BatchExtractor, read_manifest
+from relminer.benchmark import synthetic_corpus
+from relminer.chunking import TokenChunker
+from relminer.fake_llm import FakeChatModel
+from relminer.relation_store import RELATION_FILE, FastRelationStore
+from relminer.relations_miner import RelationsMiner
+from relminer.scheduler import FileRateCoordinator, LLMScheduler
+
+relation_store = FastRelationStore()
+
+Generations = namedtuple("Generations", ["content"])
+
+
+def mock_extract_triplets(arg1, arg2):
+    chunk_text = arg2[0].content.split("text: ")[-1]
+    if "crash" in chunk_text and mock_extract_triplets.crash:
+        raise RuntimeError("rate limit")
+    subject = chunk_text.split()[0]
+    generations = json.dumps(
+        {
+            "relations": [[subject, "Lives_At", "Boston"]],
+            "explanation": f"{subject} lives in Boston",
+        }
+    )
+    return Generations(generations)
+
+
+class TestBatchExtractor(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.rel_miner = RelationsMiner(relation_store=relation_store)
+        documents = {"joe.txt": "Joe lives in Boston.", "ann.txt": "Ann lives in Boston. crash"}
+        with open(os.path.join(self.tmp_dir.name, "manifest.jsonl"), "w") as manifest:
+            for name, text in documents.items():
+                with open(os.path.join(self.tmp_dir.name, name), "w") as f:
+                    f.write(text)
+                manifest.write(json.dumps({"subject": name[:-4].title(), "path": name}) + "\n")
+        self.output = os.path.join(self.tmp_dir.name, "relations.jsonl")
+        return super().setUp()
+
+    def tearDown(self) -> None:
+        self.tmp_dir.cleanup()
+        return super().tearDown()
+
+    def read_output(self):
+        with open(self.output) as f:
+            return [json.loads(line) for line in f]
+
+    @patch.object(langchain.chat_models.ChatOpenAI, "invoke", mock_extract_triplets)
+    def test_resume_after_failure(self):
+        manifest = os.path.join(self.tmp_dir.name, "manifest.jsonl")
+
+        mock_extract_triplets.crash = True
+        with self.assertRaises(RuntimeError):
+            BatchExtractor(self.rel_miner, self.output).run(read_manifest(manifest))
+        self.assertEqual([r["subject"] for r in self.read_output()], ["Joe"])
+
+        mock_extract_triplets.crash = False
+        stats = BatchExtractor(self.rel_miner, self.output).run(read_manifest(manifest))
+        self.assertEqual(stats["skipped"], 1)
+        self.assertEqual(stats["documents"], 1)
+        self.assertEqual([r["subject"] for r in self.read_output()], ["Joe", "Ann"])
+
+    def test_chunk_relations_merged(self):
+        def mock_extract_duplicates(arg1, arg2):
+            generations = json.dumps(
+                {
+                    "relations": [["Joe", "Lives_At", "Boston"], ["joe", "Lives_At", "Boston."]],
+                    "explanation": "Joe lives in Boston",
+                }
+            )
+            return Generations(generations)
+
+        with patch.object(langchain.chat_models.ChatOpenAI, "invoke", mock_extract_duplicates):
+            BatchExtractor(self.rel_miner, self.output).run(read_manifest(self.tmp_dir.name))
+        # one relation per document, the duplicates of its chunk merged into it
+        self.assertEqual([(r["document"], r["object"]) for r in self.read_output()], [("ann.txt", "Boston"), ("joe.txt", "Boston")])
+
+    def test_read_manifest_directory(self):
+        jobs = list(read_manifest(self.tmp_dir.name))
+        self.assertEqual([job.subject for job in jobs], ["ann", "joe"])
+
+
+def make_fake_miner(relation_store):
+    # built in every worker process, the fake model answers the same prompt the same way in all of them
+    return RelationsMiner(
+        relation_store=relation_store,
+        scheduler=LLMScheduler(requests_per_minute=1e9),
+        chunker=TokenChunker(chunk_tokens=64),
+        chat_llm=FakeChatModel(),
+    )
+
+
+class CrashingChatModel(FakeChatModel):
+    # fails on the chunks mentioning a crash, in the worker processes as well
+    def invoke(self, chat_messages):
+        if "crash" in chat_messages[-1].content.split("text: ")[-1]:
+            raise RuntimeError("worker failure")
+        return super().invoke(chat_messages)
+
+
+def make_crashing_miner(relation_store):
+    rel_miner = make_fake_miner(relation_store)
+    rel_miner.chat_llm = CrashingChatModel()
+    return rel_miner
+
+
+def make_coordinated_miner(rate_file, relation_store):
+    rel_miner = make_fake_miner(relation_store)
+    rel_miner.scheduler.coordinator = FileRateCoordinator(rate_file)
+    return rel_miner
+
+
+class TestBatchExtractorProcesses(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        for doc in synthetic_corpus(num_documents=6, num_sentences=20, seed=3):
+            with open(os.path.join(self.tmp_dir.name, doc["subject"].replace(" ", "_") + ".txt"), "w") as f:
+                f.write(doc["text"])
+        self.rel_miner = make_fake_miner(relation_store)
+
+    def tearDown(self) -> None:
+        self.tmp_dir.cleanup()
+
+    def run_batch(self, name, processes):
+        output = os.path.join(self.tmp_dir.name, name)
+        stats = BatchExtractor(self.rel_miner, output, processes=processes, miner_factory=make_fake_miner).run(
+            read_manifest(self.tmp_dir.name)
+        )
+        with open(output) as f:
+            return stats, f.read()
+
+    def test_processes_match_serial_output(self):
+        serial_stats, serial_output = self.run_batch("serial.jsonl", processes=1)
+        stats, output = self.run_batch("processes.jsonl", processes=2)
+        self.assertEqual(stats, serial_stats)
+        self.assertEqual(stats["documents"], 6)
+        self.assertGreater(stats["chunks"], 6)
+        self.assertEqual(output, serial_output)
+
+        # the finished run is skipped when resumed
+        stats, _ = self.run_batch("processes.jsonl", processes=2)
+        self.assertEqual(stats["skipped"], 6)
+
+    def test_worker_failure_keeps_finished_chunks(self):
+        with open(os.path.join(self.tmp_dir.name, "zed.txt"), "w") as f:
+            f.write(" ".join(f"Zed visited Paris in {year}." for year in range(1900, 1960)) + " Then a crash.")
+        output = os.path.join(self.tmp_dir.name, "processes.jsonl")
+        extractor = BatchExtractor(self.rel_miner, output, processes=2, miner_factory=make_crashing_miner)
+        with self.assertRaises(RuntimeError):
+            extractor.run(read_manifest(self.tmp_dir.name))
+
+        # the chunks extracted before the failure are written and checkpointed, the resumed run starts after them
+        self.assertGreater(extractor.checkpoint.next_chunk("zed.txt"), 0)
+        with open(output) as f:
+            self.assertIn("zed.txt", {json.loads(line)["document"] for line in f})
+
+    def test_workers_share_rate_limits(self):
+        rate_file = os.path.join(self.tmp_dir.name, "rate.json")
+        batch._init_worker(make_fake_miner, RELATION_FILE, rate_file)
+        self.assertEqual(batch._worker_miner.scheduler.coordinator.location, rate_file)
+
+        # the schedulers already coordinated keep their own file
+        coordinated = functools.partial(make_coordinated_miner, os.path.join(self.tmp_dir.name, "own.json"))
+        batch._init_worker(coordinated, RELATION_FILE, rate_file)
+        self.assertEqual(batch._worker_miner.scheduler.coordinator.location, os.path.join(self.tmp_dir.name, "own.json"))
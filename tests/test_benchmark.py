@@ -0,0 +1,59 @@
+import tracemalloc
+import unittest
+from unittest.mock import patch
+
+from langchain.schema import HumanMessage
+
+from relminer.benchmark import Benchmark, synthetic_corpus
+from relminer.fake_llm import FakeChatModel, FakeRateLimitError
+
+
+class TestFakeChatModel(unittest.TestCase):
+    def test_deterministic_answers_and_failures(self):
+        prompt = [HumanMessage(content="Extract relations of the follwing types {'Lived_At', 'Works_At'} in the text below and focus on Joe\ntext: Joe moved to Boston. Joe worked at Acme.")]
+        answers, failures = [], []
+        for _ in range(2):
+            model = FakeChatModel(failure_rate=0.3, seed=7)
+            outcomes = []
+            for _ in range(20):
+                try:
+                    outcomes.append(model.invoke(prompt).content)
+                except FakeRateLimitError:
+                    outcomes.append(None)
+            answers.append(outcomes)
+            failures.append(sum(call["failed"] for call in model.calls))
+
+        self.assertEqual(answers[0], answers[1])
+        self.assertTrue(0 < failures[0] < 20)
+        answer = next(content for content in answers[0] if content)
+        self.assertIn('["Joe", ', answer)
+        self.assertIn("Boston", answer)
+
+
+class TestBenchmark(unittest.TestCase):
+    def test_synthetic_corpus_is_seeded(self):
+        self.assertEqual(synthetic_corpus(3, 5, seed=1), synthetic_corpus(3, 5, seed=1))
+        self.assertNotEqual(synthetic_corpus(3, 5, seed=1), synthetic_corpus(3, 5, seed=2))
+
+    def test_run_scenarios(self):
+        benchmark = Benchmark(failure_rate=0.2, chunk_tokens=64)
+        extract, register = benchmark.run_all(["extract", "register"], [5])
+        self.assertEqual(extract.operations, 10)
+        self.assertGreater(extract.chunks, 10)
+        self.assertGreater(extract.relations, 0)
+        self.assertGreater(extract.prompt_tokens_per_chunk, 0)
+        self.assertLessEqual(extract.p50, extract.p99)
+        self.assertEqual(register.relations, 5)
+        self.assertGreater(extract.peak_memory, 0)
+
+    def test_timed_pass_not_traced(self):
+        benchmark = Benchmark(chunk_tokens=64)
+        operations, tracing = benchmark._operations, []
+
+        def traced_operations(*args):
+            return [lambda operation=operation: tracing.append(tracemalloc.is_tracing()) or operation() for operation in operations(*args)]
+
+        with patch.object(benchmark, "_operations", side_effect=traced_operations):
+            benchmark.run("extract", 2)
+        # the timed operations first, then the memory pass
+        self.assertEqual(tracing, [False] * 10 + [True] * 10)
@@ -0,0 +1,67 @@
+import unittest
+from unittest.mock import patch
+
+from relminer.chunking import TokenChunker, count_tokens, make_token_counter
+
+
+def count_words(text):
+    return len(text.split())
+
+
+class TestTokenChunker(unittest.TestCase):
+    def test_packs_sentences_up_to_the_budget(self):
+        text = "One two three. Four five six. Seven eight nine.\n\nTen eleven twelve."
+        chunks = TokenChunker(chunk_tokens=6, token_counter=count_words).split(text)
+        self.assertEqual([chunk.text for chunk in chunks], ["One two three. Four five six.", "Seven eight nine.\n\nTen eleven twelve."])
+        self.assertEqual([chunk.tokens for chunk in chunks], [6, 6])
+        for chunk in chunks:
+            self.assertEqual(text[chunk.start:chunk.end].strip(), chunk.text)
+
+    def test_overlap_and_long_sentences(self):
+        text = "One two three. Four five six. Seven eight nine ten eleven twelve thirteen."
+        chunker = TokenChunker(chunk_tokens=6, overlap_tokens=3, token_counter=count_words)
+        chunks = chunker.split(text)
+        self.assertEqual(chunks[0].text, "One two three. Four five six.")
+        self.assertTrue(chunks[1].text.startswith("Four five six. Seven"))
+        self.assertTrue(all(chunk.tokens <= 6 for chunk in chunks))
+
+    def test_prompt_overhead_reduces_budget(self):
+        chunker = TokenChunker(chunk_tokens=100, context_window=110, completion_tokens=5, token_counter=count_words)
+        self.assertEqual(chunker.budget(prompt_tokens=0), 100)
+        self.assertEqual(chunker.budget(prompt_tokens=100), 5)
+        with self.assertRaises(ValueError):
+            chunker.budget(prompt_tokens=105)
+
+        plan = chunker.plan("a b c. d e f. g h i.", prompt_tokens=100)
+        self.assertEqual(plan.num_chunks, 3)
+        self.assertEqual(plan.total_tokens, 9 + 300)
+
+    def test_iter_chunks_matches_split(self):
+        text = "One two three. Four five six. Seven eight nine.\n\nTen eleven twelve. Thirteen"
+        chunker = TokenChunker(chunk_tokens=6, overlap_tokens=3, token_counter=count_words)
+        for size in (1, 5, 16, len(text)):
+            blocks = [text[i:i + size] for i in range(0, len(text), size)]
+            self.assertEqual(list(chunker.iter_chunks(blocks)), chunker.split(text))
+
+    def test_content_defined_boundaries_realign_after_an_edit(self):
+        sentences = [f"Sentence number {i} about topic {i * 7}." for i in range(200)]
+        edited = sentences[:3] + ["Sentence number three was rewritten with a few more words than before."] + sentences[4:]
+
+        def changed_chunks(chunker):
+            before = set(chunk.text for chunk in chunker.split(" ".join(sentences)))
+            return [chunk for chunk in chunker.split(" ".join(edited)) if chunk.text not in before]
+
+        chunker = TokenChunker(chunk_tokens=60, boundary_every=4, token_counter=count_words)
+        # only the chunks around the edited sentence differ, the greedy packing shifts all the next ones
+        self.assertLessEqual(len(changed_chunks(chunker)), 2)
+        self.assertGreater(len(changed_chunks(TokenChunker(chunk_tokens=60, token_counter=count_words))), 2)
+        self.assertTrue(all(chunk.tokens <= 60 for chunk in chunker.split(" ".join(edited))))
+
+    def test_token_encoding_resolved_by_the_first_count(self):
+        with patch("relminer.chunking.load_token_encoder", return_value=count_tokens) as mock_load:
+            counter = make_token_counter("gpt-3.5-turbo-1106")
+            TokenChunker(token_counter=counter)
+            self.assertEqual(mock_load.call_count, 0)
+            self.assertEqual(counter("Joe lives in Boston."), count_tokens("Joe lives in Boston."))
+            counter("Joe works at Acme.")
+        mock_load.assert_called_once_with("gpt-3.5-turbo-1106")
@@ -0,0 +1,43 @@
+import os
+import subprocess
+import sys
+import unittest
+import unittest.mock
+
+from relminer import cli
+from relminer.benchmark import SCENARIOS
+from relminer.chunking import DEFAULT_CHUNK_TOKENS
+from relminer.sinks import PARTITION_FIELDS, SINK_FORMATS
+
+ROOT_DIR = os.path.join(os.path.dirname(__file__), "..")
+
+
+class TestCli(unittest.TestCase):
+    def test_parse_commands(self):
+        args = cli.make_parser().parse_args(["extract", "Joe", "joe.txt", "--dry-run", "-l", "debug"])
+        self.assertIs(args.run, cli.run_extract)
+        self.assertEqual((args.sub, args.file, args.dry_run, args.loglevel), ("Joe", "joe.txt", True, "debug"))
+        self.assertEqual(args.chunk_tokens, DEFAULT_CHUNK_TOKENS)
+        self.assertEqual(cli.BENCHMARK_SCENARIOS, SCENARIOS)
+        self.assertEqual(cli.SINK_FORMATS, tuple(SINK_FORMATS))
+        self.assertEqual(cli.PARTITION_FIELDS, PARTITION_FIELDS)
+
+    def test_extract_modes(self):
+        parser = cli.make_parser()
+        # the simple prompt stays the default of extract_relations.py
+        self.assertFalse(parser.parse_args(["extract", "Joe", "joe.txt"]).few_shot)
+        self.assertTrue(parser.parse_args(["extract", "Joe", "joe.txt", "--few-shot"]).few_shot)
+        with open(os.devnull, "w") as devnull, unittest.mock.patch("sys.stderr", devnull):
+            with self.assertRaises(SystemExit):
+                parser.parse_args(["extract", "Joe", "joe.txt", "--few-shot", "--stream", "--doc-id", "joe"])
+        with self.assertRaises(SystemExit):
+            cli.run_extract(parser.parse_args(["extract", "Joe", "joe.txt", "--doc-id", "joe"]))
+
+    def test_list_does_not_load_langchain(self):
+        code = "import sys; from relminer.cli import main; main(['list', '--types']); print('langchain' in sys.modules)"
+        env = dict(os.environ, PYTHONPATH=ROOT_DIR)
+        output = subprocess.run(
+            [sys.executable, "-c", code], cwd=ROOT_DIR, env=env, capture_output=True, text=True, check=True
+        )
+        self.assertEqual(output.stdout.strip(), "False")
+        self.assertIn("Lived_At", output.stderr)
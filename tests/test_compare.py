@@ -0,0 +1,40 @@
+import time
+import unittest
+
+from relminer.compare import RelationComparator
+from relminer.domain import Relation
+
+
+class TestRelationComparator(unittest.TestCase):
+    def setUp(self) -> None:
+        self.relation_sets = {
+            "Joe": [Relation("Joe", "lives_at", "Boston"), Relation("Joe", "born_in", "Miami")],
+            "Ann": [Relation("Ann", "lives_at", "boston."), Relation("Ann", "studied_at", "MIT")],
+            "Bob": [Relation("Bob", "born_in", "Paris"), Relation("Bob", "visited", "Boston")],
+        }
+        return super().setUp()
+
+    def test_report(self):
+        report = RelationComparator(self.relation_sets).report()
+        self.assertEqual(report.pair("name", "Joe", "Ann"), 1)
+        self.assertEqual(report.pair("name", "Joe", "Bob"), 1)
+        self.assertEqual(report.pair("name", "Ann", "Bob"), 0)
+        self.assertEqual(report.pair("name_object", "Joe", "Ann"), 1)
+        self.assertEqual(report.pair("name_object", "Joe", "Bob"), 0)
+        self.assertEqual(report.pair("name", "Joe", "Joe"), 2)
+        self.assertEqual(report.shared["object"], {"boston": ["Joe", "Ann", "Bob"]})
+
+    def test_shared_relations(self):
+        comparator = RelationComparator(self.relation_sets)
+        shared = comparator.shared_relations("name", ["Joe", "Ann"])
+        self.assertEqual([(r.subject, r.name) for r in shared], [("Joe", "lives_at"), ("Ann", "lives_at")])
+
+    def test_scales_to_many_subjects(self):
+        relation_sets = {
+            f"Person {i}": [Relation(f"Person {i}", f"rel_{j % 50}", f"Object {(i + j) % 200}") for j in range(100)]
+            for i in range(300)
+        }
+        started_at = time.time()
+        report = RelationComparator(relation_sets).report()
+        self.assertLess(time.time() - started_at, 5)
+        self.assertEqual(report.pair("name", "Person 0", "Person 1"), 50)
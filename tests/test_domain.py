@@ -0,0 +1,58 @@
+import io
+import unittest
+
+from relminer.domain import Relation, RelationBatch
+from relminer.relation_store import FastRelationStore
+
+
+class TestRelation(unittest.TestCase):
+    def test_slots(self):
+        rel = Relation("Joe", "lives_at", "Boston")
+        self.assertFalse(hasattr(rel, "__dict__"))
+        self.assertEqual(rel.to_dict(exclude=["description", "sentence", "explanation"]), {"subject": "Joe", "name": "lives_at", "object": "Boston"})
+
+
+class TestRelationBatch(unittest.TestCase):
+    def setUp(self) -> None:
+        self.relations = [
+            Relation("Joe", "lives_at", "Boston"),
+            Relation("Joe", "born_in", "Miami", provenance=[1, 2]),
+            Relation("Ann", "lives_at", "Boston"),
+            Relation("Joe", "lives_at", "Boston", sentence="duplicated"),
+        ]
+        self.batch = RelationBatch.from_relations(self.relations)
+        return super().setUp()
+
+    def test_encoded_columns(self):
+        self.assertEqual(len(self.batch), 4)
+        self.assertEqual(self.batch.columns["subject"].vocabulary, ["Joe", "Ann"])
+        self.assertEqual(list(self.batch.column("object")), ["Boston", "Miami", "Boston", "Boston"])
+        self.assertEqual(str(self.batch[1]), str(self.relations[1]))
+
+    def test_filter_and_dedup(self):
+        lives_at = self.batch.select(name="lives_at", subject="Joe")
+        self.assertEqual(len(lives_at), 2)
+
+        not_boston = self.batch.filter(self.batch.mask_where("object", lambda o: o != "Boston"))
+        self.assertEqual([r.object for r in not_boston], ["Miami"])
+
+        unique = self.batch.dedup()
+        self.assertEqual(len(unique), 3)
+        self.assertEqual(unique[0].sentence, "")
+        self.assertEqual(unique[1].provenance, [1, 2])
+
+    def test_dicts_and_avro(self):
+        records = list(self.batch.to_dicts())
+        self.assertEqual(records[3]["sentence"], "duplicated")
+        self.assertEqual(records[1]["provenance"], [1, 2])
+        self.assertEqual(list(RelationBatch.from_dicts(records).to_dicts()), records)
+
+        fo = io.BytesIO()
+        self.batch.to_avro(fo)
+        fo.seek(0)
+        loaded = RelationBatch.from_avro(fo)
+        self.assertEqual([str(r) for r in loaded], [str(r) for r in self.relations])
+
+    def test_load_batch(self):
+        store = FastRelationStore()
+        self.assertEqual([str(r) for r in store.load_batch()], [str(r) for r in store.load_relations()])
@@ -0,0 +1,24 @@
+import unittest
+
+from relminer.domain import Relation
+from relminer.example_selector import BM25ExampleSelector
+from relminer.relation_store import FastRelationStore
+
+
+class TestBM25ExampleSelector(unittest.TestCase):
+    def setUp(self) -> None:
+        self.relations = FastRelationStore().load_relations()
+        return super().setUp()
+
+    def test_selects_relevant_examples(self):
+        selector = BM25ExampleSelector.from_relations(self.relations, k=3)
+        examples = selector.select_examples({"input": "She studied at Stanford University"})
+        self.assertEqual(len(examples), 3)
+        self.assertEqual(examples[0]["example_text"], "Mary Lane studied at Stanford University.")
+
+    def test_token_budget(self):
+        relations = [Relation(f"Person {i}", f"Rel_{i}", "Thing", "", f"Person {i} rel {i} thing", "x" * 400) for i in range(1000)]
+        selector = BM25ExampleSelector.from_relations(relations, k=50, max_tokens=500)
+        examples = selector.select_examples({"input": "Person 7 rel 7 a thing"})
+        self.assertEqual(examples[0]["example_text"], "Person 7 rel 7 thing")
+        self.assertLessEqual(len(examples) * selector.example_tokens[0], 500)
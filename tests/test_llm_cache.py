@@ -0,0 +1,54 @@
+import os
+import tempfile
+import time
+import unittest
+
+from relminer.llm_cache import LLMResponseCache
+
+
+class TestLLMResponseCache(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.location = os.path.join(self.tmp_dir.name, "cache.sqlite")
+        return super().setUp()
+
+    def tearDown(self) -> None:
+        self.tmp_dir.cleanup()
+        return super().tearDown()
+
+    def test_hit_and_miss(self):
+        cache = LLMResponseCache(self.location)
+        key = LLMResponseCache.make_key("model", "prompt", {"type": "json_object"})
+        self.assertIsNone(cache.get(key))
+        cache.put(key, '{"relations": []}')
+        self.assertEqual(cache.get(key), '{"relations": []}')
+        self.assertEqual(cache.stats()["hits"], 1)
+        self.assertEqual(cache.stats()["misses"], 1)
+        cache.close()
+
+        # the cache survives the process
+        self.assertEqual(LLMResponseCache(self.location).get(key), '{"relations": []}')
+
+    def test_key_depends_on_model_prompt_and_format(self):
+        key = LLMResponseCache.make_key("model", "prompt", None)
+        self.assertNotEqual(key, LLMResponseCache.make_key("other-model", "prompt", None))
+        self.assertNotEqual(key, LLMResponseCache.make_key("model", "other prompt", None))
+        self.assertNotEqual(key, LLMResponseCache.make_key("model", "prompt", {"type": "json_object"}))
+
+    def test_eviction(self):
+        cache = LLMResponseCache(self.location, max_entries=2)
+        for i in range(3):
+            cache.put(f"key-{i}", f"value-{i}")
+            time.sleep(0.001)
+        cache.evict()
+        self.assertIsNone(cache.get("key-0"))
+        self.assertEqual(cache.get("key-2"), "value-2")
+
+        cache = LLMResponseCache(self.location, max_age=0)
+        self.assertIsNone(cache.get("key-2"))
+
+    def test_disabled(self):
+        cache = LLMResponseCache(self.location, enabled=False)
+        cache.put("key", "value")
+        self.assertIsNone(cache.get("key"))
+        self.assertFalse(os.path.exists(self.location))
@@ -0,0 +1,113 @@
+import asyncio
+import os
+import shutil
+import tempfile
+import unittest
+
+from relminer.chunking import DEFAULT_BOUNDARY_SENTENCES, TokenChunker
+from relminer.domain import Relation
+from relminer.fake_llm import FakeChatModel
+from relminer.manifest import ChunkManifest
+from relminer.relation_store import RELATION_FILE, FastRelationStore
+from relminer.relations_miner import RelationsMiner
+from relminer.scheduler import LLMScheduler
+
+SENTENCES = [f"Joe visited City{i} with Friend{i * 3} in the summer." for i in range(120)]
+
+
+class TestChunkManifest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.manifest = ChunkManifest(os.path.join(self.tmp_dir.name, "manifest.sqlite"))
+
+    def tearDown(self):
+        self.manifest.close()
+        self.tmp_dir.cleanup()
+
+    def test_save_and_load(self):
+        relations = [Relation("Joe", "lived_at", "Boston"), Relation("Joe", "works_at", "Acme")]
+        self.manifest.save("doc-1", [("a", relations), ("b", [])])
+        self.manifest.save("doc-2", [("c", relations[:1])])
+
+        loaded = self.manifest.load("doc-1")
+        self.assertEqual(list(loaded), ["a", "b"])
+        self.assertEqual([relation.object for relation in loaded["a"]], ["Boston", "Acme"])
+        self.assertEqual(loaded["b"], [])
+
+        # a new version replaces the previous chunks of the document only
+        self.manifest.save("doc-1", [("d", [])])
+        self.assertEqual(list(self.manifest.load("doc-1")), ["d"])
+        self.assertEqual(self.manifest.documents(), ["doc-1", "doc-2"])
+        self.manifest.delete("doc-2")
+        self.assertEqual(self.manifest.load("doc-2"), {})
+
+    def test_fingerprint(self):
+        fingerprint = ChunkManifest.fingerprint("model", "Joe", ["b", "a"], "Joe moved to Boston.")
+        self.assertEqual(fingerprint, ChunkManifest.fingerprint("model", "Joe", ["a", "b"], "Joe moved to Boston."))
+        self.assertNotEqual(fingerprint, ChunkManifest.fingerprint("model", "Joe", ["a", "b", "c"], "Joe moved to Boston."))
+        self.assertNotEqual(fingerprint, ChunkManifest.fingerprint("model", "Ann", ["a", "b"], "Joe moved to Boston."))
+
+
+class TestIncrementalExtraction(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.manifest = ChunkManifest(os.path.join(self.tmp_dir.name, "manifest.sqlite"))
+        # the other tests register relation types in the shared store, the prompts use a copy of it
+        relation_file = os.path.join(self.tmp_dir.name, "relations.avro")
+        shutil.copyfile(RELATION_FILE, relation_file)
+        self.relation_store = FastRelationStore(relation_file)
+        self.chat_llm = FakeChatModel()
+        self.rel_miner = RelationsMiner(
+            relation_store=self.relation_store,
+            scheduler=LLMScheduler(requests_per_minute=1e9),
+            chunker=TokenChunker(chunk_tokens=300, boundary_every=4),
+            chat_llm=self.chat_llm,
+            manifest=self.manifest,
+        )
+
+    def tearDown(self):
+        self.manifest.close()
+        self.tmp_dir.cleanup()
+
+    def test_only_edited_chunks_are_extracted(self):
+        text = " ".join(SENTENCES)
+        first = self.rel_miner.extract_relations("Joe", text, doc_id="joe")
+        num_chunks = len(self.chat_llm.calls)
+        self.assertGreater(num_chunks, 4)
+
+        # the unchanged document is not sent to the model again
+        self.assertEqual([str(r) for r in self.rel_miner.extract_relations("Joe", text, doc_id="joe")], [str(r) for r in first])
+        self.assertEqual(len(self.chat_llm.calls), num_chunks)
+
+        edited = " ".join(SENTENCES[:60] + ["Joe also visited Lisbon with Ann."] + SENTENCES[60:])
+        relations = self.rel_miner.extract_relations("Joe", edited, doc_id="joe")
+        self.assertLessEqual(len(self.chat_llm.calls) - num_chunks, 2)
+        self.assertIn("Lisbon", [relation.object for relation in relations])
+        self.assertEqual(self.manifest.stats()["extracted"], len(self.chat_llm.calls))
+
+        # the relations of the reused chunks point to their position in the edited document
+        num_edited_chunks = len(self.rel_miner.chunker.split(edited))
+        self.assertEqual(max(index for relation in relations for index in relation.provenance), num_edited_chunks - 1)
+
+    def test_aextract_relations_incremental(self):
+        text = " ".join(SENTENCES)
+        first = asyncio.run(self.rel_miner.aextract_relations("Joe", text, doc_id="joe"))
+        num_chunks = len(self.chat_llm.calls)
+        second = asyncio.run(self.rel_miner.aextract_relations("Joe", text, doc_id="joe"))
+        self.assertEqual([str(r) for r in second], [str(r) for r in first])
+        self.assertEqual(len(self.chat_llm.calls), num_chunks)
+
+    def test_doc_id_needs_a_manifest(self):
+        self.rel_miner.manifest = None
+        with self.assertRaises(ValueError):
+            self.rel_miner.extract_relations("Joe", "Joe moved to Boston.", doc_id="joe")
+
+    def test_manifest_enables_boundaries(self):
+        rel_miner = RelationsMiner(relation_store=self.relation_store, manifest=self.manifest)
+        self.assertEqual(rel_miner.chunker.boundary_every, DEFAULT_BOUNDARY_SENTENCES)
+        self.assertIsNone(RelationsMiner(relation_store=self.relation_store).chunker.boundary_every)
+
+        # a chunker given without boundaries cannot realign the chunks of an edited document
+        self.rel_miner.chunker = TokenChunker(chunk_tokens=300)
+        with self.assertRaises(ValueError):
+            self.rel_miner.extract_relations("Joe", "Joe moved to Boston.", doc_id="joe")
@@ -0,0 +1,81 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+import urllib.request
+
+from relminer.chunking import TokenChunker
+from relminer.fake_llm import FakeChatModel
+from relminer.metrics import InMemorySink, JSONLSink, MetricsRecorder, PrometheusSink, metric_labels
+from relminer.relation_store import RELATION_FILE, FastRelationStore
+from relminer.relations_miner import RelationsMiner
+from relminer.scheduler import LLMScheduler
+
+
+class TestMetricsRecorder(unittest.TestCase):
+    def test_summary_and_labels(self):
+        sink = InMemorySink()
+        metrics = MetricsRecorder([sink])
+        with metric_labels(document="a"):
+            with metrics.timer("parse"):
+                pass
+            metrics.increment("prompt_tokens", 10)
+        with metric_labels(document="b"):
+            metrics.increment("prompt_tokens", 5)
+        metrics.increment("prompt_tokens", 0)
+
+        summary = metrics.summary()
+        self.assertEqual(summary["stages"]["parse"]["count"], 1)
+        self.assertEqual(summary["counters"], {"prompt_tokens": 15})
+        by_document = metrics.summary(group_by="document")
+        self.assertEqual(by_document["a"]["counters"], {"prompt_tokens": 10})
+        self.assertEqual(by_document["b"]["counters"], {"prompt_tokens": 5})
+        self.assertEqual([event["labels"] for event in sink.events], [{"document": "a"}] * 2 + [{"document": "b"}])
+        self.assertIn("prompt_tokens", metrics.format_summary())
+
+    def test_sinks(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            location = os.path.join(tmp_dir, "metrics.jsonl")
+            jsonl_sink, prometheus_sink = JSONLSink(location), PrometheusSink(label_names=["document"])
+            metrics = MetricsRecorder([jsonl_sink, prometheus_sink])
+            with metric_labels(document="a", subject="Joe"):
+                metrics.observe("llm_call", 0.5)
+                metrics.increment("cache_hits", 2)
+            jsonl_sink.close()
+
+            with open(location) as f:
+                self.assertEqual([json.loads(line)["name"] for line in f], ["llm_call", "cache_hits"])
+
+            server = prometheus_sink.serve(0, "127.0.0.1")
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{server.server_address[1]}/metrics") as response:
+                    text = response.read().decode("utf-8")
+            finally:
+                server.shutdown()
+            self.assertIn('relminer_stage_seconds_sum{stage="llm_call",document="a"} 0.5', text)
+            self.assertIn('relminer_cache_hits_total{document="a"} 2', text)
+
+
+class TestMinerMetrics(unittest.TestCase):
+    def test_extraction_stages(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            relation_file = os.path.join(tmp_dir, "relations.avro")
+            shutil.copyfile(RELATION_FILE, relation_file)
+            metrics = MetricsRecorder()
+            rel_miner = RelationsMiner(
+                relation_store=FastRelationStore(relation_file, metrics),
+                scheduler=LLMScheduler(requests_per_minute=1e9, backoff=0.001, max_retries=50),
+                chunker=TokenChunker(chunk_tokens=16),
+                chat_llm=FakeChatModel(failure_rate=0.3, seed=3),
+                metrics=metrics,
+            )
+            rel_miner.extract_relations("Joe", "Joe moved to Boston. Joe worked at Acme with Ann. Joe lives in Miami.")
+
+            summary = metrics.summary()
+            for stage in ("store_load", "few_shot_context", "prompt_build", "llm_call", "parse", "merge"):
+                self.assertIn(stage, summary["stages"])
+            failures = sum(call["failed"] for call in rel_miner.chat_llm.calls)
+            self.assertEqual(summary["counters"].get("llm_retries", 0), failures)
+            self.assertEqual(summary["counters"]["llm_calls"], summary["stages"]["llm_call"]["count"])
+            self.assertGreater(summary["counters"]["prompt_tokens"], summary["counters"]["completion_tokens"])
@@ -0,0 +1,40 @@
+import unittest
+
+from relminer.domain import Relation
+from relminer.normalize import EntityNormalizer, merge_relations, normalize_text
+
+
+class TestNormalize(unittest.TestCase):
+    def test_normalize_text(self):
+        self.assertEqual(normalize_text("  Boston,  MA "), "boston ma")
+        self.assertEqual(normalize_text("ＪＯＥ"), "joe")
+
+    def test_canonical_names(self):
+        normalizer = EntityNormalizer({"Boston, MA": "Boston", "NYC": "New York"}, entities=["Joe Smith"])
+        self.assertEqual(normalizer.canonical("boston ma"), "Boston")
+        self.assertEqual(normalizer.canonical(" nyc"), "New York")
+        self.assertEqual(normalizer.canonical("joe smith"), "Joe Smith")
+        self.assertEqual(normalizer.canonical("Joe"), "Joe Smith")
+        self.assertIsNone(normalizer.canonical("Ann"))
+
+    def test_merge_relations(self):
+        relations = [
+            Relation("Joe", "lives_at", "Boston, MA", provenance=[1]),
+            Relation("Joe Smith", "lives_at", "boston", provenance=[0]),
+            Relation(" joe smith ", "born_in", "Miami", provenance=[2]),
+            Relation("Joe Smith", "Lives_At", "Boston", provenance=[1]),
+            Relation("Ann", "lives_at", "Boston", provenance=[2]),
+        ]
+        normalizer = EntityNormalizer({"Boston, MA": "Boston"}, entities=["Joe Smith"])
+        merged = merge_relations(relations, normalizer)
+
+        self.assertEqual(
+            [(rel.subject, rel.name, rel.object, rel.provenance) for rel in merged],
+            [
+                ("Joe Smith", "lives_at", "Boston", [0, 1]),
+                ("Joe Smith", "born_in", "Miami", [2]),
+                ("Ann", "lives_at", "Boston", [2]),
+            ],
+        )
+        # the same input always merges the same way
+        self.assertEqual(str(merge_relations(relations, normalizer)), str(merged))
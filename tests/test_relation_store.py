@@ -0,0 +1,94 @@
+import os
+import shutil
+import tempfile
+import unittest
+import unittest.mock
+
+from relminer.domain import Relation
+from relminer.relation_store import RELATION_FILE, FastRelationStore, IndexedRelationStore
+
+
+class TestIndexedRelationStore(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.relation_file = os.path.join(self.tmp_dir.name, "relations.avro")
+        shutil.copyfile(RELATION_FILE, self.relation_file)
+        return super().setUp()
+
+    def tearDown(self) -> None:
+        self.tmp_dir.cleanup()
+        return super().tearDown()
+
+    def test_lookups_match_full_load(self):
+        relations = FastRelationStore(self.relation_file).load_relations()
+        store = IndexedRelationStore(self.relation_file)
+
+        self.assertEqual(len(store), len(relations))
+        self.assertEqual(store.relation_names(), set(r.name for r in relations))
+        self.assertEqual([str(r) for r in store.load_relations()], [str(r) for r in relations])
+
+        lived_at = store.get_by_name("Lived_At")
+        self.assertEqual([r.subject for r in lived_at], ["Jim Ozark"])
+        self.assertEqual(lived_at[0].sentence, "Jim Ozark has lived at Mountain View")
+        self.assertEqual(store.get_by_subject("nobody"), [])
+        self.assertTrue(os.path.exists(self.relation_file + ".idx"))
+
+    def test_index_follows_appends(self):
+        store = IndexedRelationStore(self.relation_file)
+        size = len(store)
+        store.add_relations([Relation("Ann", "Works_At", "Acme", "a person working for a company")])
+
+        # a fresh store reuses the persisted index and only indexes the appended block
+        store = IndexedRelationStore(self.relation_file)
+        self.assertEqual(len(store), size + 1)
+        self.assertEqual([r.object for r in store.get_by_subject("Ann")], ["Acme"])
+
+        store.add_relations([Relation("Bob", "Works_At", "Initech")], append=False)
+        self.assertEqual(len(store), 1)
+        self.assertEqual(store.relation_names(), {"Works_At"})
+
+
+class TestFastRelationStore(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.relation_file = os.path.join(self.tmp_dir.name, "relations.avro")
+        shutil.copyfile(RELATION_FILE, self.relation_file)
+        return super().setUp()
+
+    def tearDown(self) -> None:
+        self.tmp_dir.cleanup()
+        return super().tearDown()
+
+    def test_bulk_add_deduplicates(self):
+        store = FastRelationStore(self.relation_file)
+        size = len(store.load_relations())
+        relations = [Relation(f"Person {i}", "Works_At", "Acme") for i in range(1000)]
+
+        self.assertEqual(store.add_relations(relations + relations[:10]), 1000)
+        self.assertEqual(store.add_relations(relations[:10]), 0)
+        self.assertEqual(len(store.load_relations()), size + 1000)
+        self.assertFalse(os.path.exists(self.relation_file + ".tmp"))
+
+    def test_compact(self):
+        store = FastRelationStore(self.relation_file)
+        for i in range(5):
+            store.add_relations([Relation(f"Person {i}", "Works_At", "Acme")])
+        store.add_relations([Relation("Person 0", "Works_At", "Acme")], dedupe=False)
+        relations = store.load_relations()
+
+        stats = store.compact()
+        self.assertEqual(stats["duplicates"], 1)
+        self.assertLess(stats["size_after"], stats["size_before"])
+        self.assertEqual(len(store.load_relations()), len(relations) - 1)
+        self.assertEqual(len(IndexedRelationStore(self.relation_file)), len(relations) - 1)
+
+    def test_relation_names_cached_per_version(self):
+        store = FastRelationStore(self.relation_file)
+        names = store.relation_names()
+        self.assertEqual(names, set(r.name for r in store.load_relations()))
+
+        with unittest.mock.patch.object(store, "load_batch", side_effect=AssertionError("store decoded again")):
+            self.assertEqual(store.relation_names(), names)
+
+        store.add_relations([Relation("Joe", "Plays_For", "Celtics")])
+        self.assertEqual(store.relation_names(), names | {"Plays_For"})
@@ -1,13 +1,21 @@
 import unittest
 from unittest.mock import patch
-import langchain
+import langchain.chat_models
 import json
+import asyncio
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
 from collections import namedtuple
 
 from relminer.relations_miner import RelationsMiner
-from relminer.relation_store import FastRelationStore
+from relminer.relation_store import RELATION_FILE, FastRelationStore
 from relminer.relations_miner import RelationsMiner
+from relminer.chunking import TokenChunker
 from relminer.domain import Relation
+from relminer.llm_cache import LLMResponseCache
 
 relation_store = FastRelationStore()
 
@@ -37,6 +45,13 @@ class TestRelMiner(unittest.TestCase):
         )
         print(extracted_relations)
 
+    @patch.object(langchain.chat_models.ChatOpenAI, "invoke", mock_extract_triplets)
+    def test_extract_relations_simple(self):
+        extracted_relations = self.rel_miner.extract_relations_simple(
+            "Joe", "Joe lives in Boston and was born in Miami"
+        )
+        self.assertEqual([rel.name for rel in extracted_relations], ["lives_at", "born_in"])
+
     def mock_explain_relation(arg1, arg2):
         generations = json.dumps(
             {
@@ -48,6 +63,244 @@ class TestRelMiner(unittest.TestCase):
 
     @patch.object(langchain.chat_models.ChatOpenAI, "invoke", mock_explain_relation)
     def test_explain_relation(self):
-        rel = Relation("TheSubject", "TheRelName", "TheObject", "TheDescription")
-        extracted_relations = self.rel_miner.register_relation(rel)
-        print(extracted_relations)
+        # registered in a copy, the committed store is shared by the other tests
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            relation_file = os.path.join(tmp_dir, "relations.avro")
+            shutil.copyfile(RELATION_FILE, relation_file)
+            rel_miner = RelationsMiner(relation_store=FastRelationStore(relation_file))
+            rel = Relation("TheSubject", "TheRelName", "TheObject", "TheDescription")
+            extracted_relations = rel_miner.register_relation(rel)
+            print(extracted_relations)
+            self.assertIn("TheRelName", rel_miner.relation_store.relation_names())
+
+    async def mock_aextract_triplets(arg1, arg2):
+        # later chunks answer first, the results must still come back in chunk order
+        chunk_text = arg2[0].content.split("text: ")[-1]
+        index = int(chunk_text.split()[0])
+        await asyncio.sleep(0.01 * (5 - index))
+        generations = json.dumps(
+            {
+                "relations": [["Joe", "Visited", f"City {index}"]],
+                "explanation": f"Joe visited city {index}",
+            }
+        )
+        return Generations(generations)
+
+    @patch.object(langchain.chat_models.ChatOpenAI, "ainvoke", mock_aextract_triplets)
+    def test_aextract_relations(self):
+        # one sentence per chunk
+        rel_miner = RelationsMiner(relation_store=relation_store, chunker=TokenChunker(chunk_tokens=8))
+        input_text = "\n\n".join(f"{i} Joe visited a city." for i in range(5))
+        extracted_relations = asyncio.run(
+            rel_miner.aextract_relations("Joe", input_text, max_concurrency=3)
+        )
+        self.assertEqual([rel.object for rel in extracted_relations], [f"City {i}" for i in range(5)])
+
+    @patch.object(langchain.chat_models.ChatOpenAI, "ainvoke", mock_aextract_triplets)
+    def test_aiter_relations(self):
+        rel_miner = RelationsMiner(relation_store=relation_store, chunker=TokenChunker(chunk_tokens=8))
+        # the text arrives in small blocks cutting the sentences
+        input_text = "\n\n".join(f"{i} Joe visited a city." for i in range(5))
+        blocks = [input_text[i:i + 7] for i in range(0, len(input_text), 7)]
+
+        async def collect():
+            return [result async for result in rel_miner.aiter_relations("Joe", iter(blocks), max_concurrency=2)]
+
+        results = asyncio.run(collect())
+        self.assertEqual([result.chunk.index for result in results], list(range(5)))
+        self.assertEqual([result.relations[0].object for result in results], [f"City {i}" for i in range(5)])
+        for result in results:
+            self.assertEqual(input_text[result.chunk.start:result.chunk.end].strip(), result.chunk.text)
+
+    @patch.object(langchain.chat_models.ChatOpenAI, "invoke", mock_extract_triplets)
+    def test_iter_relations_from_file(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "joe.txt")
+            with open(path, "w") as f:
+                f.write("Joe lives in Boston. " * 200)
+            with open(path) as f:
+                results = list(self.rel_miner.iter_relations("Joe", f))
+        self.assertEqual(len(results), self.rel_miner.plan_extraction("Joe", "Joe lives in Boston. " * 200).num_chunks)
+        self.assertEqual([rel.name for rel in results[0].relations], ["lives_at", "born_in"])
+
+    def test_extract_relations_cached(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            rel_miner = RelationsMiner(
+                relation_store=relation_store,
+                llm_cache=LLMResponseCache(os.path.join(tmp_dir, "cache.sqlite")),
+            )
+            with patch.object(
+                langchain.chat_models.ChatOpenAI, "invoke", autospec=True, side_effect=TestRelMiner.mock_extract_triplets
+            ) as mock_invoke:
+                first = rel_miner.extract_relations("Joe", "Joe lives in Boston and was born in Miami")
+                second = rel_miner.extract_relations("Joe", "Joe lives in Boston and was born in Miami")
+            self.assertEqual(mock_invoke.call_count, 1)
+            self.assertEqual(str(first), str(second))
+            self.assertEqual(rel_miner.llm_cache.hits, 1)
+
+    def test_malformed_generation_not_cached(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            rel_miner = RelationsMiner(
+                relation_store=relation_store,
+                llm_cache=LLMResponseCache(os.path.join(tmp_dir, "cache.sqlite")),
+            )
+            generations = [Generations("not json"), TestRelMiner.mock_extract_triplets(None, None)]
+            with patch.object(
+                langchain.chat_models.ChatOpenAI, "invoke", autospec=True, side_effect=generations
+            ) as mock_invoke:
+                with self.assertRaises(Exception):
+                    rel_miner.extract_relations("Joe", "Joe lives in Boston and was born in Miami")
+                results = rel_miner.extract_relations("Joe", "Joe lives in Boston and was born in Miami")
+            self.assertEqual(mock_invoke.call_count, 2)
+            self.assertEqual([rel.name for rel in results], ["lives_at", "born_in"])
+
+            # a malformed entry left in the cache is dropped and the model asked again
+            key = next(iter(rel_miner.llm_cache._connection().execute("SELECT key FROM responses")))[0]
+            rel_miner.llm_cache.put(key, "not json")
+            with patch.object(
+                langchain.chat_models.ChatOpenAI, "invoke", autospec=True, side_effect=TestRelMiner.mock_extract_triplets
+            ) as mock_invoke:
+                results = rel_miner.extract_relations("Joe", "Joe lives in Boston and was born in Miami")
+            self.assertEqual(mock_invoke.call_count, 1)
+            self.assertEqual([rel.name for rel in results], ["lives_at", "born_in"])
+
+    def test_prompt_cache_key_stable_across_hash_seeds(self):
+        code = (
+            "from relminer.relations_miner import RelationsMiner; "
+            "from relminer.relation_store import FastRelationStore; "
+            "rel_miner = RelationsMiner(relation_store=FastRelationStore()); "
+            "print(rel_miner._cache_key(rel_miner.make_chunk_prompts('Joe', 'Joe lives in Boston')[0])); "
+            "print(rel_miner._cache_key(rel_miner._make_simple_prompts('Joe', 'Joe lives in Boston')[0]))"
+        )
+        root_dir = os.path.join(os.path.dirname(__file__), "..")
+        outputs = [
+            subprocess.run(
+                [sys.executable, "-c", code],
+                cwd=root_dir,
+                env=dict(os.environ, PYTHONPATH=root_dir, PYTHONHASHSEED=seed),
+                capture_output=True,
+                text=True,
+                check=True,
+            ).stdout
+            for seed in ("1", "2")
+        ]
+        self.assertEqual(len(outputs[0].split()), 2)
+        self.assertEqual(outputs[0], outputs[1])
+
+    def test_default_chat_model_does_not_retry(self):
+        # the scheduler is the only one retrying the rate limited calls
+        self.assertEqual(self.rel_miner.chat_llm.max_retries, 0)
+
+    def test_few_shot_examples_selection(self):
+        rel_miner = RelationsMiner(relation_store=relation_store, few_shot_k=2)
+        prompts = rel_miner.make_chunk_prompts("Joe", "Joe moved to Miami with a friend")
+        prompt = prompts[0][0].content
+        self.assertIn("Jerry McGuire moved to Miami", prompt)
+        self.assertEqual(prompt.count("\ntext: "), 2)
+
+        # only the types of the two selected examples are listed
+        selected = rel_miner.build_few_shot_context()[0].example_selector.select_examples({"input": "Joe moved to Miami with a friend"})
+        relation_types = prompt.split(" in the text below")[0]
+        self.assertEqual(relation_types.count("'"), 2 * len({example["example_name"] for example in selected}))
+        for example in selected:
+            self.assertIn(f"'{example['example_name']}'", relation_types)
+
+    def test_plan_extraction(self):
+        input_text = "Joe lives in Boston. " * 200
+        plan = self.rel_miner.plan_extraction("Joe", input_text)
+        self.assertEqual(plan.num_chunks, len(self.rel_miner.make_chunk_prompts("Joe", input_text)))
+        self.assertGreater(plan.prompt_tokens, 0)
+        self.assertEqual(plan.total_tokens, plan.input_tokens + plan.num_chunks * plan.prompt_tokens)
+
+    def mock_extract_multi_triplets(arg1, arg2):
+        generations = json.dumps(
+            {
+                "relations": [
+                    ["Joe", "Lives_At", "Boston"],
+                    ["Ann Smith", "Born_In", "Miami"],
+                    ["Smith", "Friend_Of", "Joe"],
+                    ["Bob", "Born_In", "Paris"],
+                ],
+                "explanation": "Joe lives in Boston, Ann Smith was born in Miami and is a friend of Joe",
+            }
+        )
+        return Generations(generations)
+
+    def mock_extract_duplicate_triplets(arg1, arg2):
+        generations = json.dumps(
+            {
+                "relations": [["Joe", "Lives_At", "Boston, MA"], ["joe", "lives_at", "boston ma"]],
+                "explanation": "Joe lives in Boston",
+            }
+        )
+        return Generations(generations)
+
+    @patch.object(langchain.chat_models.ChatOpenAI, "invoke", mock_extract_duplicate_triplets)
+    def test_extract_relations_merged(self):
+        rel_miner = RelationsMiner(relation_store=relation_store, chunker=TokenChunker(chunk_tokens=8))
+        extracted_relations = rel_miner.extract_relations("Joe", "Joe lives in Boston.\n\nJoe lives in Boston, MA.")
+        self.assertEqual(len(extracted_relations), 1)
+        self.assertEqual(extracted_relations[0].provenance, [0, 1])
+
+    def test_extract_relations_multi(self):
+        with patch.object(
+            langchain.chat_models.ChatOpenAI, "invoke", autospec=True, side_effect=TestRelMiner.mock_extract_multi_triplets
+        ) as mock_invoke:
+            results = self.rel_miner.extract_relations_multi(
+                ["Joe", "Ann Smith"], "Joe lives in Boston. Ann Smith, his friend, was born in Miami"
+            )
+        self.assertEqual(mock_invoke.call_count, 1)
+        self.assertEqual([rel.object for rel in results["Joe"]], ["Boston"])
+        self.assertEqual([rel.object for rel in results["Ann Smith"]], ["Miami", "Joe"])
+
+    def test_few_shot_context_cache(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            relation_file = os.path.join(tmp_dir, "relations.avro")
+            shutil.copyfile(RELATION_FILE, relation_file)
+            store = FastRelationStore(relation_file)
+            rel_miner = RelationsMiner(relation_store=store)
+
+            context = rel_miner.build_few_shot_context()
+            with patch.object(store, "load_relations", wraps=store.load_relations) as mock_load:
+                self.assertIs(rel_miner.build_few_shot_context(), context)
+                self.assertEqual(mock_load.call_count, 0)
+
+            store.add_relations([Relation("Ann", "Works_At", "Acme", "a person working for a company")])
+            self.assertIn("Works_At", rel_miner.build_few_shot_context()[1])
+
+    def mock_explain_batch(arg1, arg2):
+        prompt = arg2[0].content
+        if "For each of the following relation types" not in prompt:
+            # the single call of a relation the batch failed
+            return TestRelMiner.mock_explain_relation(arg1, arg2)
+        items = [
+            {"index": 0, "sentence": "Ann works at Acme.", "explanation": "Ann is employed by Acme"},
+            # invalid: an empty sentence, and the relation 2 is missing from the answer
+            {"index": 1, "sentence": "", "explanation": "Bob plays chess"},
+            {"index": 7, "sentence": "Out of range.", "explanation": "There is no relation 7"},
+        ]
+        return Generations(json.dumps({"relations": items}))
+
+    @patch.object(langchain.chat_models.ChatOpenAI, "invoke", side_effect=mock_explain_batch, autospec=True)
+    def test_register_relations_batched(self, mock_invoke):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            relation_file = os.path.join(tmp_dir, "relations.avro")
+            shutil.copyfile(RELATION_FILE, relation_file)
+            store = FastRelationStore(relation_file)
+            rel_miner = RelationsMiner(relation_store=store)
+            relations = [
+                Relation("Ann", "Works_At", "Acme", "a person working for a company"),
+                Relation("Bob", "Plays", "Chess", "a person playing a game"),
+                Relation("Eve", "Owns", "Boat", "a person owning a thing"),
+            ]
+
+            with patch.object(store, "add_relations", wraps=store.add_relations) as mock_add:
+                rel_miner.register_relations(relations)
+                self.assertEqual(mock_add.call_count, 1)
+
+            # one batch call, then one call for each of the two failed items
+            self.assertEqual(mock_invoke.call_count, 3)
+            self.assertEqual(relations[0].sentence, "Ann works at Acme.")
+            self.assertEqual(relations[1].sentence, "This is an example sentence of the relation")
+            self.assertEqual(relations[2].sentence, "This is an example sentence of the relation")
+            self.assertTrue({"Works_At", "Plays", "Owns"} <= set(store.relation_names()))
@@ -0,0 +1,98 @@
+import asyncio
+import os
+import tempfile
+import threading
+import time
+import unittest
+
+from relminer.scheduler import (
+    FileRateCoordinator,
+    LLMScheduler,
+    PRIORITY_BATCH,
+    PRIORITY_INTERACTIVE,
+)
+
+
+class RateLimitError(Exception):
+    http_status = 429
+
+
+class TestLLMScheduler(unittest.TestCase):
+    def test_requests_per_minute(self):
+        scheduler = LLMScheduler(requests_per_minute=600)
+        scheduler.buckets["requests"].level = 0
+        started_at = time.time()
+        for _ in range(3):
+            scheduler.call(lambda: None)
+        # 10 requests per second once the bucket is empty
+        self.assertGreaterEqual(time.time() - started_at, 0.25)
+
+    def test_tokens_per_minute(self):
+        scheduler = LLMScheduler(requests_per_minute=6000, tokens_per_minute=600)
+        scheduler.call(lambda: None, tokens=600)
+        started_at = time.time()
+        scheduler.call(lambda: None, tokens=5)
+        self.assertGreaterEqual(time.time() - started_at, 0.4)
+
+    def test_retries_rate_limited_calls(self):
+        scheduler = LLMScheduler(backoff=0.01)
+        attempts = []
+
+        def flaky():
+            attempts.append(1)
+            if len(attempts) < 3:
+                raise RateLimitError()
+            return "done"
+
+        self.assertEqual(scheduler.call(flaky), "done")
+        self.assertEqual(scheduler.stats["retries"], 2)
+
+        scheduler = LLMScheduler(max_retries=1, backoff=0.01)
+        with self.assertRaises(RateLimitError):
+            scheduler.call(lambda: (_ for _ in ()).throw(RateLimitError()))
+        with self.assertRaises(ValueError):
+            scheduler.call(lambda: (_ for _ in ()).throw(ValueError()))
+
+    def test_priorities(self):
+        scheduler = LLMScheduler(requests_per_minute=1200)
+        scheduler.buckets["requests"].level = 0
+        served = []
+
+        async def run():
+            batch = [
+                asyncio.ensure_future(scheduler.acall(lambda i=i: asyncio.sleep(0, served.append(f"batch {i}")), priority=PRIORITY_BATCH))
+                for i in range(3)
+            ]
+            await asyncio.sleep(0.01)
+            interactive = scheduler.acall(lambda: asyncio.sleep(0, served.append("interactive")), priority=PRIORITY_INTERACTIVE)
+            await asyncio.gather(interactive, *batch)
+
+        asyncio.run(run())
+        self.assertLess(served.index("interactive"), 2)
+
+    def test_cancelled_waiter_does_not_block(self):
+        scheduler = LLMScheduler(requests_per_minute=1200)
+        scheduler.buckets["requests"].level = 0
+
+        async def run():
+            waiter = asyncio.ensure_future(scheduler.aacquire())
+            await asyncio.sleep(0.01)
+            waiter.cancel()
+            await asyncio.wait_for(scheduler.aacquire(), timeout=1)
+
+        asyncio.run(run())
+
+    def test_file_coordinator_shares_the_budget(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            location = os.path.join(tmp_dir, "rate.json")
+            first = LLMScheduler(requests_per_minute=60, coordinator=FileRateCoordinator(location))
+            second = LLMScheduler(requests_per_minute=60, coordinator=FileRateCoordinator(location))
+            for _ in range(60):
+                first.acquire()
+
+            # the second scheduler sees the bucket emptied by the first one
+            thread = threading.Thread(target=second.acquire)
+            started_at = time.time()
+            thread.start()
+            thread.join()
+            self.assertGreaterEqual(time.time() - started_at, 0.5)
@@ -0,0 +1,99 @@
+import asyncio
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from relminer.fake_llm import FakeChatModel
+from relminer.relation_store import RELATION_FILE, FastRelationStore
+from relminer.relations_miner import RelationsMiner
+from relminer.scheduler import LLMScheduler
+from relminer.server import ExtractionService
+
+TEXT = "Joe moved to Boston. Joe worked at Acme with Ann Smith. Ann Smith lives in Miami."
+
+
+async def request(port, method, path, payload=None):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    body = json.dumps(payload).encode("utf-8") if payload is not None else b""
+    writer.write(f"{method} {path} HTTP/1.1\r\nHost: localhost\r\nContent-Length: {len(body)}\r\n\r\n".encode() + body)
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+    head, _, content = response.partition(b"\r\n\r\n")
+    return int(head.split()[1]), json.loads(content)
+
+
+class TestExtractionService(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        relation_file = os.path.join(self.tmp_dir.name, "relations.avro")
+        shutil.copyfile(RELATION_FILE, relation_file)
+        self.relation_store = FastRelationStore(relation_file)
+        self.chat_llm = FakeChatModel(latency=0.02)
+        scheduler = LLMScheduler(requests_per_minute=1e9)
+
+        def make_miner():
+            return RelationsMiner(relation_store=self.relation_store, scheduler=scheduler, chat_llm=self.chat_llm)
+
+        self.service = ExtractionService(make_miner, pool_size=2, batch_window=0.05)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def serve(self, scenario):
+        async def run():
+            await self.service.start(port=0)
+            try:
+                return await scenario(self.service.port)
+            finally:
+                await self.service.close()
+
+        return asyncio.run(run())
+
+    def test_extract_coalesced_and_batched(self):
+        async def scenario(port):
+            return await asyncio.gather(
+                request(port, "POST", "/extract", {"subject": "Joe", "text": TEXT}),
+                request(port, "POST", "/extract", {"subject": "Joe", "text": TEXT}),
+                request(port, "POST", "/extract", {"subject": "Ann Smith", "text": TEXT}),
+            )
+
+        (status_a, joe_a), (status_b, joe_b), (status_c, ann) = self.serve(scenario)
+        self.assertEqual((status_a, status_b, status_c), (200, 200, 200))
+        self.assertEqual(joe_a, joe_b)
+        self.assertTrue(joe_a["relations"])
+        self.assertTrue(all(relation["subject"] == "Joe" for relation in joe_a["relations"]))
+        self.assertTrue(all(relation["subject"] == "Ann Smith" for relation in ann["relations"]))
+        # one extraction for the three requests, a single model call for the one chunk
+        self.assertEqual(self.service.stats["coalesced"], 1)
+        self.assertEqual(self.service.stats["batched"], 1)
+        self.assertEqual(self.service.stats["extractions"], 1)
+        self.assertEqual(len(self.chat_llm.calls), 1)
+
+    def test_register_compare_and_health(self):
+        async def scenario(port):
+            registered = await asyncio.gather(
+                request(port, "POST", "/register", {"relations": [{"subject": "Ann", "name": "Works_At", "object": "Acme", "description": "a person working for a company"}]}),
+                request(port, "POST", "/register", {"relations": [{"subject": "Bob", "name": "Plays", "object": "Chess", "description": "a person playing a game"}]}),
+            )
+            compared = await request(port, "POST", "/compare", {"subject_a": "Joe", "text_a": TEXT, "subject_b": "Ann Smith", "text_b": TEXT})
+            health = await request(port, "GET", "/health")
+            missing = await request(port, "POST", "/extract", {"subject": "Joe"})
+            unknown = await request(port, "GET", "/nothing")
+            return registered, compared, health, missing, unknown
+
+        registered, compared, health, missing, unknown = self.serve(scenario)
+        self.assertEqual([body["relations"][0]["subject"] for _, body in registered], ["Ann", "Bob"])
+        self.assertTrue(all(body["relations"][0]["sentence"] for _, body in registered))
+        self.assertIn("Works_At", self.relation_store.relation_names())
+        self.assertIn("Plays", self.relation_store.relation_names())
+
+        status, body = compared
+        self.assertEqual(status, 200)
+        self.assertEqual(body["overlap"]["subjects"], ["Joe", "Ann Smith"])
+        self.assertEqual(health[1]["status"], "ok")
+        self.assertEqual(health[1]["miners"], 2)
+        self.assertEqual(missing[0], 400)
+        self.assertEqual(unknown[0], 404)
@@ -0,0 +1,196 @@
+import json
+import os
+import tempfile
+import unittest
+
+import fastavro
+
+from relminer.batch import BatchExtractor, read_manifest
+from relminer.domain import Relation
+from relminer.relation_store import FastRelationStore
+from relminer.sinks import AvroSink, make_sink
+
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
+
+relation_store = FastRelationStore()
+
+RELATIONS = [
+    Relation("Joe", "lived_at", "Boston", provenance=[0]),
+    Relation("Joe", "works_at", "Acme Inc.", provenance=[1, 2]),
+    Relation("Ann", "lived_at", "Miami", provenance=[0]),
+]
+
+
+def read_avro(path):
+    with open(path, "rb") as f:
+        return list(fastavro.reader(f))
+
+
+class TestAvroSink(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.location = os.path.join(self.tmp_dir.name, "relations")
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_partitioned_blocks(self):
+        with AvroSink(self.location, partition_by="name", codec="deflate", block_size=64) as sink:
+            for _ in range(10):
+                sink.write(RELATIONS, document="doc-1")
+
+        self.assertEqual(sorted(os.listdir(self.location)), ["name=lived_at", "name=works_at"])
+        records = read_avro(os.path.join(self.location, "name=works_at", "part-00000.avro"))
+        self.assertEqual(len(records), 10)
+        self.assertEqual(records[0]["object"], "Acme Inc.")
+        self.assertEqual(records[0]["provenance"], [1, 2])
+        self.assertEqual(records[0]["document"], "doc-1")
+
+        # the records were written in several blocks of about block_size bytes
+        with open(os.path.join(self.location, "name=lived_at", "part-00000.avro"), "rb") as f:
+            blocks = list(fastavro.block_reader(f))
+        self.assertGreater(len(blocks), 1)
+        self.assertEqual(sum(block.num_records for block in blocks), 20)
+
+    def test_flushed_records_are_readable_and_runs_add_parts(self):
+        sink = make_sink("avro", self.location)
+        sink.write(RELATIONS[:1])
+        sink.flush()
+        self.assertEqual([r["subject"] for r in read_avro(os.path.join(self.location, "part-00000.avro"))], ["Joe"])
+        sink.close()
+
+        with make_sink("avro", self.location) as sink:
+            sink.write(RELATIONS)
+        self.assertEqual(len(read_avro(os.path.join(self.location, "part-00001.avro"))), 3)
+
+        with self.assertRaises(ValueError):
+            AvroSink(self.location, partition_by="explanation")
+        with self.assertRaises(ValueError):
+            make_sink("csv", self.location)
+
+    def test_atomic_part_files_renamed_on_close(self):
+        class AtomicAvroSink(AvroSink):
+            atomic = True
+
+        sink = AtomicAvroSink(self.location, partition_by="subject")
+        sink.write(RELATIONS)
+        sink.flush()
+        # until the sink is closed, the part files only exist under their temporary name
+        self.assertEqual(os.listdir(os.path.join(self.location, "subject=Joe")), ["part-00000.avro.tmp"])
+        sink.close()
+        self.assertEqual(os.listdir(os.path.join(self.location, "subject=Joe")), ["part-00000.avro"])
+        self.assertEqual(len(read_avro(os.path.join(self.location, "subject=Joe", "part-00000.avro"))), 2)
+
+    def test_open_writers_capped(self):
+        with AvroSink(self.location, partition_by="subject", max_open_writers=1) as sink:
+            sink.write(RELATIONS)
+            self.assertEqual(list(sink.writers), ["Ann"])
+            # the closed partition rolls to a new part file
+            sink.write(RELATIONS[:1])
+            self.assertEqual(list(sink.writers), ["Joe"])
+
+        joe_dir = os.path.join(self.location, "subject=Joe")
+        self.assertEqual(sorted(os.listdir(joe_dir)), ["part-00000.avro", "part-00001.avro"])
+        self.assertEqual(len(read_avro(os.path.join(joe_dir, "part-00000.avro"))), 2)
+        self.assertEqual(len(read_avro(os.path.join(joe_dir, "part-00001.avro"))), 1)
+
+    def test_part_index_after_highest(self):
+        os.makedirs(self.location)
+        # a gap left by a deleted part file, and a temporary part file left by a killed run
+        for name in ["part-00000.avro", "part-00003.avro.tmp"]:
+            open(os.path.join(self.location, name), "w").close()
+        with AvroSink(self.location) as sink:
+            sink.write(RELATIONS)
+        self.assertEqual(sink.files, [os.path.join(self.location, "part-00004.avro")])
+
+    @unittest.skipIf(pyarrow is None, "pyarrow is not installed")
+    def test_parquet(self):
+        import pyarrow.parquet
+
+        with make_sink("parquet", self.location, partition_by="subject", block_size=2) as sink:
+            sink.write(RELATIONS * 3)
+        table = pyarrow.parquet.read_table(os.path.join(self.location, "subject=Joe", "part-00000.parquet"))
+        self.assertEqual(table.num_rows, 6)
+        self.assertEqual(table.column("provenance").to_pylist()[:2], [[0], [1, 2]])
+
+
+class TestBatchSink(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        for name, text in {"joe.txt": "Joe lives in Boston.", "ann.txt": "Ann lives in Miami."}.items():
+            with open(os.path.join(self.tmp_dir.name, name), "w") as f:
+                f.write(text)
+        self.output = os.path.join(self.tmp_dir.name, "relations.jsonl")
+        self.location = os.path.join(self.tmp_dir.name, "sink")
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_batch_streams_to_sink(self):
+        from relminer.fake_llm import FakeChatModel
+        from relminer.relations_miner import RelationsMiner
+        from relminer.scheduler import LLMScheduler
+
+        rel_miner = RelationsMiner(relation_store, scheduler=LLMScheduler(requests_per_minute=1e9), chat_llm=FakeChatModel())
+        with AvroSink(self.location, partition_by="document") as sink:
+            stats = BatchExtractor(rel_miner, self.output, sink=sink).run(read_manifest(self.tmp_dir.name))
+
+        with open(self.output) as f:
+            output = [json.loads(line) for line in f]
+        records = read_avro(os.path.join(self.location, "document=joe.txt", "part-00000.avro"))
+        records += read_avro(os.path.join(self.location, "document=ann.txt", "part-00000.avro"))
+        self.assertEqual(len(records), stats["relations"])
+        self.assertEqual(
+            sorted((r["document"], r["subject"], r["object"], r["provenance"][0]) for r in records),
+            sorted((r["document"], r["subject"], r["object"], r["chunk"]) for r in output),
+        )
+
+    def test_resumed_document_is_complete_in_sink(self):
+        from relminer.chunking import TokenChunker
+        from relminer.fake_llm import FakeChatModel
+        from relminer.relations_miner import RelationsMiner
+        from relminer.scheduler import LLMScheduler
+
+        class CrashingChatModel(FakeChatModel):
+            crash = True
+
+            def invoke(self, chat_messages):
+                if self.crash and "Ann crashed in Paris" in chat_messages[-1].content.split("text: ")[-1]:
+                    raise RuntimeError("rate limit")
+                return super().invoke(chat_messages)
+
+        with open(os.path.join(self.tmp_dir.name, "ann.txt"), "w") as f:
+            f.write("Ann lives in Miami.\n\nAnn crashed in Paris.\n\nAnn works at Acme.")
+        chat_llm = CrashingChatModel()
+        rel_miner = RelationsMiner(
+            relation_store,
+            scheduler=LLMScheduler(requests_per_minute=1e9, max_retries=0),
+            chunker=TokenChunker(chunk_tokens=8),
+            chat_llm=chat_llm,
+        )
+
+        with self.assertRaises(RuntimeError):
+            with AvroSink(self.location) as sink:
+                BatchExtractor(rel_miner, self.output, sink=sink).run(read_manifest(self.tmp_dir.name))
+        # the first chunk of ann.txt was written to the output, not to the sink
+        self.assertTrue(os.path.getsize(self.output))
+        self.assertFalse(os.path.exists(os.path.join(self.location, "part-00000.avro")))
+
+        chat_llm.crash = False
+        with AvroSink(self.location) as sink:
+            BatchExtractor(rel_miner, self.output, sink=sink).run(read_manifest(self.tmp_dir.name))
+
+        records = read_avro(os.path.join(self.location, "part-00000.avro"))
+        # the documents are not flushed one by one, the few records of the run fit in a single block
+        with open(os.path.join(self.location, "part-00000.avro"), "rb") as f:
+            self.assertEqual(len(list(fastavro.block_reader(f))), 1)
+        with open(self.output) as f:
+            output = [json.loads(line) for line in f]
+        self.assertEqual(
+            sorted((r["document"], r["object"], r["provenance"][0]) for r in records),
+            sorted((r["document"], r["object"], r["chunk"]) for r in output),
+        )
+        self.assertEqual(sorted(set(r["provenance"][0] for r in records if r["document"] == "ann.txt")), [0, 1, 2])
@@ -0,0 +1,17 @@
+import unittest
+from unittest.mock import patch, mock_open
+
+from relminer.relations_miner_utils import TemplateRegistry, TEMPLATES_DIR
+
+
+class TestTemplateRegistry(unittest.TestCase):
+    def test_templates_are_loaded_once(self):
+        registry = TemplateRegistry(TEMPLATES_DIR).load_all()
+        with patch("builtins.open", mock_open()) as mock_file:
+            prompt_template = registry.get_prompt_template("few_shot_example.txt")
+            self.assertIs(prompt_template, registry.get_prompt_template("few_shot_example.txt"))
+            registry.get_template("explain_relation.txt")
+            mock_file.assert_not_called()
+        self.assertEqual(
+            set(prompt_template.input_variables), {"example_text", "example_relations", "example_explanation"}
+        )